@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+OCR后端基准测试
+功能：用同一批图片对比各OCR后端每秒识别的页数
+使用方法：python3 bench_ocr_backends.py [图片目录] [张数] [语言] [并行数]
+例如：python3 bench_ocr_backends.py ../tony/pdf存档/截图源文件/tony 10 chi_sim+eng 1
+"""
+
+import os
+import sys
+import time
+
+# 基准测试不使用OCR缓存，否则第二个后端会直接命中第一个后端的结果
+os.environ['TONY_OCR_CACHE'] = 'off'
+
+from ocr_backends import get_ocr_backend, set_ocr_backend, recognize_file, recognize_files, BACKEND_CLASSES
+from ocr_parallel import ocr_images_in_order
+
+DEFAULT_IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 '..', 'tony', 'pdf存档', '截图源文件', 'tony')
+
+def list_images(image_dir, count):
+    files = sorted(f for f in os.listdir(image_dir)
+                   if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif', '.webp')))
+    return [os.path.join(image_dir, f) for f in files[:count]]
+
+def run_backend(name, image_paths, lang, workers):
+    """用指定后端识别全部图片，返回 (耗时秒数, 出错页数)"""
+    set_ocr_backend(name)
+    backend = get_ocr_backend()
+    start = time.perf_counter()
+    errors = 0
+    for _, text in ocr_images_in_order(recognize_file, image_paths, lang, workers,
+                                       recognize_files, backend.batch_size):
+        if text.startswith("处理图片时出错"):
+            errors += 1
+    return time.perf_counter() - start, errors
+
+def main():
+    image_dir = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_IMAGE_DIR
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    lang = sys.argv[3] if len(sys.argv) > 3 else 'chi_sim+eng'
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+
+    image_paths = list_images(image_dir, count)
+    if not image_paths:
+        print(f"错误: 在目录 '{image_dir}' 中没有找到图片文件")
+        sys.exit(1)
+    print(f"图片: {len(image_paths)} 张，语言: {lang}，并行数: {workers}")
+    print(f"{'后端':<14}{'耗时(秒)':>10}{'页/秒':>10}{'相对速度':>10}")
+
+    baseline = None
+    for name in BACKEND_CLASSES:
+        try:
+            get_ocr_backend(name)
+        except RuntimeError as e:
+            print(f"{name:<14}跳过: {e}")
+            continue
+        elapsed, errors = run_backend(name, image_paths, lang, workers)
+        pages_per_second = len(image_paths) / elapsed
+        if baseline is None:
+            baseline = pages_per_second
+        line = f"{name:<14}{elapsed:>10.2f}{pages_per_second:>10.2f}{pages_per_second / baseline:>9.2f}x"
+        if errors:
+            line += f"  ({errors} 页出错)"
+        print(line)
+
+if __name__ == "__main__":
+    main()
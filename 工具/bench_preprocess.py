@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+图像预处理基准测试
+功能：对比不同预处理组合下的单页预处理耗时、OCR耗时和字符准确率
+准确率以参考文本目录中同名的 .txt 为准，按去除空白后的编辑距离计算
+使用方法：python3 bench_preprocess.py [图片目录] [参考文本目录] [张数] [语言]
+例如：python3 bench_preprocess.py ../tony/pdf存档/截图源文件/tony ../tony/pdf存档/截图转文字/tony/文本 5
+"""
+
+import os
+import sys
+import time
+
+# 基准测试不使用OCR缓存
+os.environ['TONY_OCR_CACHE'] = 'off'
+
+from PIL import Image
+
+from image_preprocess import PRESETS, preprocess_image
+from ocr_backends import get_ocr_backend
+
+BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tony', 'pdf存档')
+DEFAULT_IMAGE_DIR = os.path.join(BASE_DIR, '截图源文件', 'tony')
+DEFAULT_REFERENCE_DIR = os.path.join(BASE_DIR, '截图转文字', 'tony', '文本')
+
+def edit_distance(a, b):
+    """两个字符串的编辑距离，逐行动态规划，只保留一行"""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+def char_accuracy(text, reference):
+    """字符准确率：1 - 编辑距离 / 参考文本长度，忽略空白"""
+    text = "".join(text.split())
+    reference = "".join(reference.split())
+    if not reference:
+        return 1.0 if not text else 0.0
+    return max(0.0, 1.0 - edit_distance(text, reference) / len(reference))
+
+def main():
+    image_dir = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_IMAGE_DIR
+    reference_dir = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_REFERENCE_DIR
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    lang = sys.argv[4] if len(sys.argv) > 4 else 'chi_sim+eng'
+
+    backend = get_ocr_backend()
+
+    # 只使用有参考文本的图片
+    pages = []
+    for file in sorted(os.listdir(image_dir)):
+        if not file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif', '.webp')):
+            continue
+        reference_path = os.path.join(reference_dir, os.path.splitext(file)[0] + '.txt')
+        if os.path.isfile(reference_path):
+            with open(reference_path, 'r', encoding='utf-8') as f:
+                pages.append((os.path.join(image_dir, file), f.read()))
+        if len(pages) >= count:
+            break
+    if not pages:
+        print(f"错误: 没有找到同时存在图片和参考文本的页面")
+        sys.exit(1)
+
+    print(f"页数: {len(pages)}，语言: {lang}，OCR后端: {backend.name}")
+    print(f"{'预处理':<10}{'预处理(秒/页)':>14}{'OCR(秒/页)':>12}{'字符准确率':>12}")
+    for preset, steps in PRESETS.items():
+        preprocess_time = ocr_time = accuracy = 0.0
+        for image_path, reference in pages:
+            img = Image.open(image_path)
+            img.load()
+
+            start = time.perf_counter()
+            prepared = preprocess_image(img, steps)
+            preprocess_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            text = backend.image_to_string(prepared, lang)
+            ocr_time += time.perf_counter() - start
+
+            accuracy += char_accuracy(text, reference)
+        n = len(pages)
+        print(f"{preset:<10}{preprocess_time / n:>14.3f}{ocr_time / n:>12.3f}{accuracy / n:>12.1%}")
+
+if __name__ == "__main__":
+    main()
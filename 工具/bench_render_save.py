@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+页面保存方式基准测试
+功能：对比旧的 PNG编码→解码→再编码 保存方式与直接保存pixmap的单页耗时和峰值内存
+使用方法：python3 bench_render_save.py [PDF文件] [页数]
+例如：python3 bench_render_save.py ../tony/pdf存档/源文件不要解析/tony.pdf 5
+不指定PDF文件时会生成一个合成的测试PDF
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import tempfile
+import subprocess
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from pdf_to_images import pixmap_to_image
+
+DPI_VALUES = [150, 300, 600]
+METHODS = ["roundtrip", "direct", "frombuffer"]
+
+def save_roundtrip(pix, img_path):
+    """旧的保存方式：PNG编码后再用Pillow解码、重新编码"""
+    img_data = pix.tobytes("png")
+    img = Image.open(io.BytesIO(img_data))
+    img.save(img_path)
+
+def save_direct(pix, img_path):
+    """由PyMuPDF直接写盘"""
+    pix.save(img_path)
+
+def save_frombuffer(pix, img_path):
+    """零拷贝交给Pillow后保存（需要后处理时的路径）"""
+    pixmap_to_image(pix).save(img_path)
+
+SAVE_FUNCTIONS = {
+    "roundtrip": save_roundtrip,
+    "direct": save_direct,
+    "frombuffer": save_frombuffer,
+}
+
+def create_sample_pdf(pdf_path, page_count):
+    """生成包含中英文文字和图形的测试PDF"""
+    document = fitz.open()
+    for i in range(page_count):
+        page = document.new_page()
+        page.insert_text((72, 72), f"Sample page {i+1}", fontsize=20)
+        for line in range(40):
+            page.insert_text((72, 110 + line * 16), "The quick brown fox jumps over the lazy dog. " * 2, fontsize=9)
+        page.draw_rect(fitz.Rect(300, 600, 520, 760), color=(0, 0, 1), fill=(0.8, 0.9, 1))
+    document.save(pdf_path)
+    document.close()
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB），仅在类Unix系统上可用"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS以字节为单位，Linux以KB为单位
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+def run_single(pdf_path, page_count, dpi, method):
+    """在独立子进程中执行的单项测试，结果以JSON输出到标准输出"""
+    document = fitz.open(pdf_path)
+    page_count = min(page_count, document.page_count)
+    save = SAVE_FUNCTIONS[method]
+    timings = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for page_num in range(page_count):
+            page = document.load_page(page_num)
+            start = time.perf_counter()
+            pix = page.get_pixmap(matrix=fitz.Matrix(dpi/72, dpi/72))
+            save(pix, os.path.join(tmp_dir, f"page_{page_num}.png"))
+            timings.append(time.perf_counter() - start)
+            pix = None
+    document.close()
+    print(json.dumps({
+        "seconds_per_page": sum(timings) / len(timings),
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--single":
+        run_single(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]), sys.argv[5])
+        return
+
+    page_count = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    tmp_pdf = None
+    if len(sys.argv) > 1:
+        pdf_path = sys.argv[1]
+    else:
+        tmp_pdf = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+        tmp_pdf.close()
+        pdf_path = tmp_pdf.name
+        create_sample_pdf(pdf_path, page_count)
+        print(f"已生成测试PDF: {pdf_path} ({page_count} 页)")
+
+    print(f"{'DPI':>5}  {'方式':<12}{'单页耗时(秒)':>14}{'峰值内存(MB)':>14}")
+    try:
+        for dpi in DPI_VALUES:
+            baseline = None
+            for method in METHODS:
+                # 每项测试在新进程中运行，峰值内存互不影响
+                output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--single",
+                                                  pdf_path, str(page_count), str(dpi), method])
+                result = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+                rss = result["peak_rss_mb"]
+                rss_text = f"{rss:.1f}" if rss is not None else "-"
+                line = f"{dpi:>5}  {method:<12}{result['seconds_per_page']:>14.3f}{rss_text:>14}"
+                if baseline is None:
+                    baseline = result
+                else:
+                    speedup = baseline["seconds_per_page"] / result["seconds_per_page"]
+                    line += f"  (耗时为旧方式的 {1/speedup:.0%}"
+                    if rss is not None:
+                        line += f"，内存节省 {baseline['peak_rss_mb'] - rss:.1f} MB"
+                    line += ")"
+                print(line)
+    finally:
+        if tmp_pdf:
+            os.remove(pdf_path)
+
+if __name__ == "__main__":
+    main()
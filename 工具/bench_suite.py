@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+渲染与OCR基准测试套件
+功能：生成内容和页数可控的合成PDF，在多个DPI和并行数下分别测试
+      渲染阶段（convert_pdf_to_images）和OCR阶段（process_images_in_directory），
+      统计每秒页数、单页耗时的P50/P95、峰值内存和写出字节数，结果保存为JSON便于前后对比
+合成PDF的内容：
+    latin   英文文字页
+    cjk     中文文字页
+    mixed   中英文混排文字页
+    image   只有一张整页图片、没有文字层的页（模拟扫描件）
+使用方法：python3 bench_suite.py [--pages 8] [--kinds latin,cjk,mixed,image] [--dpi 150,300]
+                               [--workers 1,4] [--stages render,ocr] [--output 结果.json] [--compare 旧结果.json]
+例如：python3 bench_suite.py --dpi 150,300 --workers 1,4 --output bench_before.json
+      python3 bench_suite.py --dpi 150,300 --workers 1,4 --output bench_after.json --compare bench_before.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+
+from metrics import percentile
+
+KINDS = ("latin", "cjk", "mixed", "image")
+STAGES = ("render", "ocr")
+
+LATIN_WORDS = ("market", "price", "volume", "trend", "support", "resistance", "breakout", "risk",
+               "position", "stop", "entry", "exit", "signal", "range", "momentum", "the", "and", "of")
+CJK_WORDS = ("市场", "价格", "成交量", "趋势", "支撑", "阻力", "突破", "风险",
+             "仓位", "止损", "入场", "出场", "信号", "区间", "动能", "交易")
+
+def _random_line(rng, kind, width):
+    """生成一行随机文字，内容由随机种子决定，每次运行完全相同"""
+    if kind == "cjk":
+        return "".join(rng.choice(CJK_WORDS) for _ in range(width // 2))
+    if kind == "mixed":
+        return "".join(rng.choice(CJK_WORDS) if rng.random() < 0.6 else f" {rng.choice(LATIN_WORDS)} "
+                       for _ in range(width // 3)).strip()
+    return " ".join(rng.choice(LATIN_WORDS) for _ in range(width // 6))
+
+def _draw_text_page(page, rng, kind, page_num):
+    fontname = "helv" if kind == "latin" else "china-s"
+    page.insert_text((72, 72), f"Page {page_num + 1}", fontsize=18, fontname="helv")
+    for line in range(38):
+        page.insert_text((72, 110 + line * 17), _random_line(rng, kind, 60), fontsize=10, fontname=fontname)
+
+def build_synthetic_pdf(pdf_path, kind, page_count, seed=0):
+    """
+    生成合成测试PDF
+
+    参数:
+        pdf_path: 输出路径
+        kind: latin / cjk / mixed / image，见模块说明
+        page_count: 页数
+        seed: 随机种子，相同参数生成的PDF内容相同
+    """
+    import fitz  # PyMuPDF
+    rng = random.Random(f"{kind}:{seed}")
+    document = fitz.open()
+    for page_num in range(page_count):
+        page = document.new_page()
+        if kind != "image":
+            _draw_text_page(page, rng, kind, page_num)
+            continue
+        # 先画一页混排文字，再栅格化后作为整页图片放进新页面，页面本身没有文字层
+        scratch = fitz.open()
+        _draw_text_page(scratch.new_page(), rng, "mixed", page_num)
+        pix = scratch[0].get_pixmap(matrix=fitz.Matrix(200/72, 200/72))
+        page.insert_image(page.rect, pixmap=pix)
+        scratch.close()
+    document.save(pdf_path, deflate=True)
+    document.close()
+
+def peak_rss_mb(who=None):
+    """
+    峰值常驻内存（MB）；who为 resource.RUSAGE_CHILDREN 时统计已结束子进程中的最大值
+
+    Linux上 ru_maxrss 会跨 exec 继承父进程的峰值，本进程的峰值优先读取 /proc/self/status 中的VmHWM
+    """
+    if who is None:
+        try:
+            with open("/proc/self/status", "r") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    # macOS以字节为单位，Linux以KB为单位
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+def directory_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            total += os.path.getsize(os.path.join(root, file))
+    return total
+
+def run_single(config):
+    """
+    在独立子进程中执行一项测试，结果以JSON输出到标准输出的最后一行
+
+    单页耗时取相邻两页完成的时间间隔；并行运行时它反映的是吞吐而不是单页的实际处理时间
+    """
+    stamps = []
+
+    def record(current, total):
+        stamps.append(time.perf_counter())
+
+    stage, output_dir = config["stage"], config["output_dir"]
+    start = time.perf_counter()
+    # 被测函数的逐页输出会干扰结果解析，全部丢弃
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if stage == "render":
+            from pdf_to_images import convert_pdf_to_images
+            success, message = convert_pdf_to_images(config["pdf_path"], output_dir, config["dpi"], record,
+                                                     config["workers"], resume=False)
+        else:
+            from images_to_text_cli import process_images_in_directory
+            success = process_images_in_directory(config["image_dir"], output_dir, config["lang"],
+                                                  config["workers"], record)
+            message = "" if success else "OCR失败"
+    elapsed = time.perf_counter() - start
+
+    try:
+        import resource
+        child_rss = peak_rss_mb(resource.RUSAGE_CHILDREN)
+    except ImportError:
+        child_rss = None
+    latencies = [b - a for a, b in zip([start] + stamps, stamps)]
+    pages = len(stamps)
+    print(json.dumps({
+        "ok": bool(success),
+        "message": "" if success else message,
+        "pages": pages,
+        "seconds": elapsed,
+        "pages_per_sec": pages / elapsed if elapsed else None,
+        "p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+        "p95_ms": percentile(latencies, 95) * 1000 if latencies else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_child_rss_mb": child_rss,
+        "bytes_written": directory_bytes(output_dir),
+    }))
+
+def run_in_subprocess(config):
+    """每项测试在新进程中运行，峰值内存互不影响；OCR缓存关闭，保证每次都真正识别"""
+    env = dict(os.environ, TONY_OCR_CACHE="off")
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--single", json.dumps(config)],
+                            stdout=subprocess.PIPE, env=env, check=True).stdout
+    return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+def environment_info():
+    """记录运行环境，不同机器上的结果不能直接比较"""
+    info = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+    try:
+        import fitz
+        info["pymupdf"] = fitz.VersionBind
+    except ImportError:
+        pass
+    from tesseract_path import tesseract_version
+    info["tesseract"] = tesseract_version()
+    try:
+        info["git_commit"] = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return info
+
+def result_key(result):
+    return (result["stage"], result["kind"], result["dpi"], result["workers"])
+
+def compare_results(results, baseline_path):
+    """与之前保存的结果对比每秒页数"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {result_key(r): r for r in json.load(f)["results"]}
+    print(f"\n与 {baseline_path} 对比（每秒页数）:")
+    for result in results:
+        old = baseline.get(result_key(result))
+        if not old or not old.get("pages_per_sec") or not result.get("pages_per_sec"):
+            continue
+        ratio = result["pages_per_sec"] / old["pages_per_sec"]
+        stage, kind, dpi, workers = result_key(result)
+        print(f"{stage:<8}{kind:<8}{dpi:>5}{workers:>5}  {old['pages_per_sec']:>8.2f} → "
+              f"{result['pages_per_sec']:>8.2f}  ({ratio - 1:+.1%})")
+
+def _int_list(text):
+    return [int(x) for x in text.split(",") if x.strip()]
+
+def _name_list(choices):
+    def parse(text):
+        names = [x.strip() for x in text.split(",") if x.strip()]
+        unknown = [x for x in names if x not in choices]
+        if unknown:
+            raise argparse.ArgumentTypeError(f"未知的取值: {', '.join(unknown)}，可选: {', '.join(choices)}")
+        return names
+    return parse
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--single":
+        run_single(json.loads(sys.argv[2]))
+        return
+
+    parser = argparse.ArgumentParser(description="渲染与OCR基准测试套件")
+    parser.add_argument("--pages", type=int, default=8, help="每个合成PDF的页数，默认8")
+    parser.add_argument("--kinds", type=_name_list(KINDS), default=list(KINDS), help="PDF内容类型，逗号分隔")
+    parser.add_argument("--dpi", type=_int_list, default=[150, 300], help="渲染分辨率列表，默认150,300")
+    parser.add_argument("--workers", type=_int_list, default=sorted({1, os.cpu_count() or 1}),
+                        help="并行数列表，默认1和CPU核心数")
+    parser.add_argument("--stages", type=_name_list(STAGES), default=list(STAGES), help="测试阶段，默认render,ocr")
+    parser.add_argument("--lang", default="chi_sim+eng", help="OCR语言，默认 chi_sim+eng")
+    parser.add_argument("--seed", type=int, default=0, help="合成PDF的随机种子，默认0")
+    parser.add_argument("--output", help="结果JSON的保存路径")
+    parser.add_argument("--compare", help="与之前保存的结果JSON对比")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'阶段':<8}{'内容':<8}{'DPI':>5}{'并行':>5}{'页/秒':>9}{'P50(ms)':>10}{'P95(ms)':>10}"
+          f"{'峰值内存(MB)':>14}{'写出(KB)':>11}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for kind in args.kinds:
+            pdf_path = os.path.join(tmp_dir, f"{kind}.pdf")
+            build_synthetic_pdf(pdf_path, kind, args.pages, args.seed)
+            for dpi in args.dpi:
+                # OCR阶段的输入图片：单进程渲染一次，不计入测试
+                image_dir = os.path.join(tmp_dir, f"{kind}_{dpi}_images")
+                if "ocr" in args.stages:
+                    from pdf_to_images import convert_pdf_to_images
+                    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                        convert_pdf_to_images(pdf_path, image_dir, dpi, workers=1, resume=False)
+                    # 渲染清单不是图片，不交给OCR
+                    for file in os.listdir(image_dir):
+                        if file.endswith(".json"):
+                            os.remove(os.path.join(image_dir, file))
+
+                for stage in args.stages:
+                    for workers in args.workers:
+                        output_dir = os.path.join(tmp_dir, f"{stage}_{kind}_{dpi}_{workers}")
+                        config = {"stage": stage, "kind": kind, "dpi": dpi, "workers": workers,
+                                  "pdf_path": pdf_path, "image_dir": image_dir, "lang": args.lang,
+                                  "output_dir": output_dir}
+                        result = run_in_subprocess(config)
+                        result.update(stage=stage, kind=kind, dpi=dpi, workers=workers)
+                        results.append(result)
+
+                        if not result["ok"]:
+                            print(f"{stage:<8}{kind:<8}{dpi:>5}{workers:>5}  失败: {result['message']}")
+                            continue
+                        rss = max(x for x in (result["peak_rss_mb"], result["peak_child_rss_mb"], 0) if x is not None)
+                        print(f"{stage:<8}{kind:<8}{dpi:>5}{workers:>5}{result['pages_per_sec']:>9.2f}"
+                              f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{rss:>14.1f}"
+                              f"{result['bytes_written'] / 1024:>11.1f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"environment": environment_info(), "pages": args.pages, "seed": args.seed,
+                       "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {args.output}")
+    if args.compare:
+        compare_results(results, args.compare)
+
+if __name__ == "__main__":
+    main()
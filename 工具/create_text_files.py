@@ -11,6 +11,44 @@ import os
 import sys
 import re
 
+def extract_page_number(filename):
+    """从文件名中的“第N页”取出页码，没有时返回0"""
+    match = re.search(r'第(\d+)页', filename)
+    if match:
+        return int(match.group(1))
+    return 0
+
+def list_page_images(input_dir):
+    """列出目录中的图片文件，按页码排序"""
+    image_files = [file for file in os.listdir(input_dir)
+                   if file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif', '.webp'))]
+    image_files.sort(key=extract_page_number)
+    return image_files
+
+def write_image_index(input_dir, output_dir, image_files):
+    """
+    写出图片索引文件
+
+    参数:
+        input_dir: 图片目录，目录名作为书名
+        output_dir: 输出目录
+        image_files: list_page_images 返回的图片文件名列表
+
+    返回:
+        索引文件路径
+    """
+    book_name = os.path.basename(os.path.normpath(input_dir))
+    index_file_path = os.path.join(output_dir, f"{book_name}_图片索引.txt")
+    
+    with open(index_file_path, 'w', encoding='utf-8') as f:
+        f.write(f"# {book_name} 图片索引\n\n")
+        f.write("本文件列出了所有图片文件，按页码排序。\n")
+        f.write("需要安装OCR软件来提取文字内容。\n\n")
+        
+        for i, file in enumerate(image_files):
+            f.write(f"{i+1}. 第{extract_page_number(file)}页: {file}\n")
+    return index_file_path
+
 def main():
     # 检查命令行参数
     if len(sys.argv) < 3:
@@ -30,46 +68,26 @@ def main():
         os.makedirs(output_dir)
         print(f"创建输出目录: {output_dir}")
     
-    # 获取所有图片文件
-    image_files = []
-    for file in os.listdir(input_dir):
-        if file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff')):
-            image_files.append(file)
+    # 获取所有图片文件，按页码排序
+    image_files = list_page_images(input_dir)
     
     if not image_files:
         print(f"错误: 在目录 '{input_dir}' 中没有找到图片文件")
         return
     
-    # 按页码排序
-    def extract_page_number(filename):
-        match = re.search(r'第(\d+)页', filename)
-        if match:
-            return int(match.group(1))
-        return 0
-    
-    image_files.sort(key=extract_page_number)
     print(f"找到 {len(image_files)} 个图片文件，已按页码排序")
     
     # 创建一个简单的文本文件，记录所有图片
-    book_name = os.path.basename(input_dir)
-    index_file_path = os.path.join(output_dir, f"{book_name}_图片索引.txt")
+    index_file_path = write_image_index(input_dir, output_dir, image_files)
     
-    with open(index_file_path, 'w', encoding='utf-8') as f:
-        f.write(f"# {book_name} 图片索引\n\n")
-        f.write("本文件列出了所有图片文件，按页码排序。\n")
-        f.write("需要安装OCR软件来提取文字内容。\n\n")
+    # 同时为每个图片创建一个空的文本文件作为占位符
+    for file in image_files:
+        base_name = os.path.splitext(file)[0]
+        text_file_path = os.path.join(output_dir, f"{base_name}.txt")
         
-        for i, file in enumerate(image_files):
-            page_num = extract_page_number(file)
-            f.write(f"{i+1}. 第{page_num}页: {file}\n")
-            
-            # 同时创建一个空的文本文件作为占位符
-            base_name = os.path.splitext(file)[0]
-            text_file_path = os.path.join(output_dir, f"{base_name}.txt")
-            
-            with open(text_file_path, 'w', encoding='utf-8') as tf:
-                tf.write(f"# 第{page_num}页\n\n")
-                tf.write("此文件需要OCR软件来提取文字内容。\n")
+        with open(text_file_path, 'w', encoding='utf-8') as tf:
+            tf.write(f"# 第{extract_page_number(file)}页\n\n")
+            tf.write("此文件需要OCR软件来提取文字内容。\n")
     
     # 创建一个安装指南文件
     guide_file_path = os.path.join(output_dir, "OCR安装指南.txt")
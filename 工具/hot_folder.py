@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+收件箱监视模式
+功能：常驻运行，监视收件箱目录，把新放入的PDF文件或图片文件夹排队转换为文字
+      所有任务共用一个常驻的工作进程池，按页调度，各任务轮流取页，大部头不会饿死小文件
+      任务完成后，文本和源文件一起移到输出目录下以任务命名的子目录中
+任务和逐页进度保存在输出目录的 .tony_ocr_jobs.sqlite3 中，中断后重启会从未完成的页继续
+出错的页重新排队，多次仍出错时整个任务失败，源文件移到 _失败；一个任务出错或工作进程崩溃不会停止监视
+使用方法：python3 tony_ocr.py watch <收件箱> <输出目录> [--workers N] [--lang 语言] [--dpi DPI] [--once]
+"""
+
+import os
+import json
+import time
+import shutil
+import sqlite3
+import collections
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from ocr_parallel import default_ocr_workers, limit_tesseract_threads
+from create_text_files import list_page_images, extract_page_number
+from text_output import CombinedTextWriter
+from metrics import get_metrics
+
+STATE_FILE = ".tony_ocr_jobs.sqlite3"
+WORK_DIR = ".进行中"
+FAILED_DIR = "_失败"
+SOURCE_SUBDIR = "源文件"
+
+KIND_PDF = "pdf"
+KIND_IMAGES = "images"
+
+# 一页最多处理几次：出错或所在的工作进程崩溃时重新排队，超过次数后整个任务失败
+MAX_PAGE_ATTEMPTS = 3
+
+# 工作进程中缓存的已打开PDF数，轮流调度时各任务交替取页，缓存几个文档避免反复打开
+_DOCUMENT_CACHE_SIZE = 4
+
+_worker_options = None
+_worker_documents = collections.OrderedDict()
+
+def _init_worker(options):
+    """工作进程初始化：设置OCR后端、预处理和tesseract线程数，之后一直复用"""
+    global _worker_options
+    _worker_options = options
+    limit_tesseract_threads(options["workers"])
+    if options.get("backend"):
+        from ocr_backends import set_ocr_backend
+        set_ocr_backend(options["backend"])
+    if options.get("preprocess"):
+        from image_preprocess import set_default_preprocess
+        set_default_preprocess(options["preprocess"])
+
+def _open_document(path):
+    import fitz  # PyMuPDF
+    document = _worker_documents.pop(path, None)
+    if document is None:
+        document = fitz.open(path)
+    _worker_documents[path] = document
+    while len(_worker_documents) > _DOCUMENT_CACHE_SIZE:
+        _worker_documents.popitem(last=False)[1].close()
+    return document
+
+def _process_page(kind, path, page_num):
+    """
+    在工作进程中处理一页
+
+    参数:
+        kind: KIND_PDF 时 path 为PDF文件、page_num为页码；KIND_IMAGES 时 path 为图片文件
+        page_num: 页码（从0开始）
+
+    返回:
+        (文字, 来源, 各步骤耗时)；出错时来源为 "error"，文字为错误信息
+    """
+    options = _worker_options
+    timings = {}
+    try:
+        if kind == KIND_IMAGES:
+            from ocr_backends import recognize_file
+            start = time.perf_counter()
+            text = recognize_file(path, options["lang"])
+            timings["ocr"] = time.perf_counter() - start
+            return text, "ocr", timings
+
+        import fitz  # PyMuPDF
+        from ocr_backends import recognize_image
+        from pdf_to_text_pipeline import usable_text_layer
+        from pdf_to_images import pixmap_to_image
+
+        start = time.perf_counter()
+        page = _open_document(path).load_page(page_num)
+        timings["load"] = time.perf_counter() - start
+
+        if options["min_text_chars"] is not None:
+            start = time.perf_counter()
+            text = page.get_text()
+            timings["text_layer"] = time.perf_counter() - start
+            if usable_text_layer(text, options["min_text_chars"]):
+                return text, "text_layer", timings
+
+        dpi = options["dpi"]
+        start = time.perf_counter()
+        pix = page.get_pixmap(matrix=fitz.Matrix(dpi/72, dpi/72))
+        timings["render"] = time.perf_counter() - start
+        start = time.perf_counter()
+        # 不经过 ocr_image：它把异常变成页面文字，这里要让识别出错的页重新排队
+        text = recognize_image(pixmap_to_image(pix), options["lang"])
+        timings["ocr"] = time.perf_counter() - start
+        return text, "ocr", timings
+    except Exception as e:
+        return str(e), "error", timings
+
+class JobStore:
+    """
+    任务状态，保存在SQLite中
+
+    jobs   每个PDF或图片文件夹一条，status 为 queued / running / done / failed
+    pages  已完成的页；页面文字先写到任务的工作目录，写完后才插入记录，重启时据此跳过
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    page_count INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    finished REAL,
+                    error TEXT
+                )""")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    job_id INTEGER NOT NULL,
+                    page INTEGER NOT NULL,
+                    source TEXT NOT NULL,
+                    PRIMARY KEY (job_id, page)
+                )""")
+
+    def is_tracked(self, source):
+        """该路径是否已有未结束的任务"""
+        row = self._conn.execute("SELECT 1 FROM jobs WHERE source = ? AND status IN ('queued', 'running')",
+                                 (source,)).fetchone()
+        return row is not None
+
+    def add_job(self, name, source, kind, page_count):
+        with self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (name, source, kind, status, page_count, created) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (name, source, kind, page_count, time.time()))
+        return cursor.lastrowid
+
+    def active_jobs(self):
+        """未结束的任务，按创建顺序"""
+        rows = self._conn.execute(
+            "SELECT id, name, source, kind, page_count FROM jobs WHERE status IN ('queued', 'running') ORDER BY id")
+        return [dict(zip(("id", "name", "source", "kind", "page_count"), row)) for row in rows]
+
+    def done_pages(self, job_id):
+        return {row[0] for row in self._conn.execute("SELECT page FROM pages WHERE job_id = ?", (job_id,))}
+
+    def page_sources(self, job_id):
+        return dict(self._conn.execute("SELECT page, source FROM pages WHERE job_id = ?", (job_id,)))
+
+    def mark_page(self, job_id, page, source):
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO pages (job_id, page, source) VALUES (?, ?, ?)",
+                               (job_id, page, source))
+            self._conn.execute("UPDATE jobs SET status = 'running' WHERE id = ? AND status = 'queued'", (job_id,))
+
+    def finish_job(self, job_id, status, error=None):
+        with self._conn:
+            self._conn.execute("UPDATE jobs SET status = ?, finished = ?, error = ? WHERE id = ?",
+                               (status, time.time(), error, job_id))
+
+    def close(self):
+        self._conn.close()
+
+def _unique_path(path):
+    """目标已存在时在名字后加序号"""
+    candidate, n = path, 2
+    while os.path.exists(candidate):
+        candidate = f"{path}_{n}"
+        n += 1
+    return candidate
+
+def _latest_mtime(path):
+    if os.path.isfile(path):
+        return os.path.getmtime(path)
+    latest = os.path.getmtime(path)
+    for root, _, files in os.walk(path):
+        for file in files:
+            latest = max(latest, os.path.getmtime(os.path.join(root, file)))
+    return latest
+
+class HotFolder:
+    """
+    收件箱监视器
+
+    参数:
+        inbox: 收件箱目录，放入PDF文件或图片文件夹
+        output_dir: 输出目录
+        lang: OCR语言
+        dpi: PDF渲染分辨率
+        workers: 工作进程数，None表示使用全部CPU核心
+        interval: 扫描收件箱的间隔（秒）
+        settle: 文件最后修改后至少经过这么多秒才入队，避免处理还在复制中的文件
+        min_text_chars: 文字层至少有多少个字符才直接采用，None表示所有页都走OCR
+        backend, preprocess: 工作进程使用的OCR后端和预处理步骤，None表示默认
+        search_index: 全文检索索引文件，完成的任务自动加入索引，None表示不索引
+    """
+
+    def __init__(self, inbox, output_dir, lang='chi_sim+eng', dpi=300, workers=None, interval=5.0,
+                 settle=5.0, min_text_chars=50, backend=None, preprocess=None, search_index=None):
+        self.inbox = os.path.abspath(inbox)
+        self.output_dir = os.path.abspath(output_dir)
+        self.workers = max(1, workers or default_ocr_workers())
+        self.interval = interval
+        self.settle = settle
+        self.search_index = search_index
+        self.options = {"lang": lang, "dpi": dpi, "min_text_chars": min_text_chars,
+                        "backend": backend, "preprocess": preprocess, "workers": self.workers}
+        os.makedirs(os.path.join(self.output_dir, WORK_DIR), exist_ok=True)
+        self.store = JobStore(os.path.join(self.output_dir, STATE_FILE))
+        self.metrics = get_metrics()
+        # {任务号: 任务信息}，任务信息中 queue 为尚未提交的页，in_flight 为已提交未完成的页数
+        self.jobs = collections.OrderedDict()
+
+    def log(self, message):
+        print(f"[{time.strftime('%H:%M:%S')}] {message}", flush=True)
+
+    def work_dir(self, job):
+        return os.path.join(self.output_dir, WORK_DIR, str(job["id"]))
+
+    def scan(self):
+        """扫描收件箱，把已经稳定的新PDF和图片文件夹加入任务表"""
+        if not os.path.isdir(self.inbox):
+            return
+        now = time.time()
+        for entry in sorted(os.listdir(self.inbox)):
+            if entry.startswith("."):
+                continue
+            path = os.path.join(self.inbox, entry)
+            is_pdf = os.path.isfile(path) and entry.lower().endswith(".pdf")
+            if not (is_pdf or os.path.isdir(path)) or self.store.is_tracked(path):
+                continue
+            try:
+                if now - _latest_mtime(path) < self.settle:
+                    continue
+                if is_pdf:
+                    import fitz  # PyMuPDF
+                    with fitz.open(path) as document:
+                        page_count = document.page_count
+                    kind, name = KIND_PDF, os.path.splitext(entry)[0]
+                else:
+                    page_count = len(list_page_images(path))
+                    if not page_count:
+                        continue
+                    kind, name = KIND_IMAGES, entry
+            except Exception as e:
+                self.log(f"无法读取 {entry}: {e}")
+                self._move_failed(path, str(e))
+                continue
+            job_id = self.store.add_job(name, path, kind, page_count)
+            self.log(f"新任务 #{job_id}: {entry}（{page_count} 页）")
+
+    def load_jobs(self):
+        """从任务表载入未结束的任务，跳过已完成的页（重启后从这里继续）"""
+        for job in self.store.active_jobs():
+            if job["id"] in self.jobs:
+                continue
+            if not os.path.exists(job["source"]):
+                self.store.finish_job(job["id"], "failed", "源文件已不存在")
+                self.log(f"任务 #{job['id']} 的源文件已不存在: {job['source']}")
+                continue
+            done = self.store.done_pages(job["id"])
+            job["files"] = list_page_images(job["source"]) if job["kind"] == KIND_IMAGES else None
+            job["queue"] = collections.deque(p for p in range(job["page_count"]) if p not in done)
+            job["in_flight"] = 0
+            # {页: 已处理次数}，只计本次运行中出错或崩溃的次数
+            job["attempts"] = {}
+            os.makedirs(self.work_dir(job), exist_ok=True)
+            self.jobs[job["id"]] = job
+            if done:
+                self.log(f"继续任务 #{job['id']} {job['name']}：已完成 {len(done)}/{job['page_count']} 页")
+            if not job["queue"]:
+                self.complete(job)
+
+    def next_page(self):
+        """
+        轮流从各任务中取下一页
+
+        每取一页就把该任务移到队尾，提交给进程池的页在各任务之间交替，
+        新加入的小任务不必等大任务全部完成
+        """
+        for job_id in list(self.jobs):
+            job = self.jobs[job_id]
+            if job["queue"]:
+                self.jobs.move_to_end(job_id)
+                return job, job["queue"].popleft()
+        return None, None
+
+    def page_file(self, job, page):
+        """单页文本文件名，与其他工具的命名一致"""
+        if job["kind"] == KIND_IMAGES:
+            base_name = os.path.splitext(job["files"][page])[0]
+        else:
+            base_name = f"{job['name']}_第{page+1:03d}页"
+        return os.path.join(self.work_dir(job), f"{base_name}.txt")
+
+    def save_page(self, job, page, text, source):
+        path = self.page_file(job, page)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        self.store.mark_page(job["id"], page, source)
+
+    def retry_page(self, job, page, error):
+        """出错的页重新排队，已经处理了 MAX_PAGE_ATTEMPTS 次时整个任务失败"""
+        attempts = job["attempts"][page] = job["attempts"].get(page, 0) + 1
+        if attempts >= MAX_PAGE_ATTEMPTS:
+            self.fail(job, f"第 {page+1} 页处理 {attempts} 次仍然出错: {error}")
+            return
+        job["queue"].append(page)
+        self.log(f"任务 #{job['id']} {job['name']} 第 {page+1} 页出错，稍后重试: {error}")
+
+    def complete(self, job):
+        """
+        全部页完成后整理输出并更新检索索引
+
+        出错时只把这个任务记为失败，不影响其他任务；文本已经移到输出目录后才出错的（更新索引失败）
+        保留输出，只在任务表中记为失败
+        """
+        try:
+            final_dir = self.finish(job)
+        except Exception as e:
+            self.fail(job, f"整理输出失败: {e}")
+            return
+        if not self.search_index:
+            return
+        try:
+            from search_index import update_search_index
+            self.log(update_search_index(self.search_index, final_dir))
+        except Exception as e:
+            error = f"文本已移到 {final_dir}，但更新全文检索索引失败: {e}"
+            self.store.finish_job(job["id"], "failed", error)
+            self.log(f"任务 #{job['id']} {job['name']}: {error}")
+
+    def fail(self, job, error):
+        """任务失败：记入任务表，源文件移到 _失败，丢弃已识别的页"""
+        self.jobs.pop(job["id"], None)
+        self.store.finish_job(job["id"], "failed", error)
+        self.log(f"任务 #{job['id']} {job['name']} 失败: {error}")
+        work_dir = self.work_dir(job)
+        source = job["source"]
+        # 整理输出时出错的，源文件可能已经移进了工作目录
+        moved_source = os.path.join(work_dir, SOURCE_SUBDIR, os.path.basename(source))
+        if not os.path.exists(source) and os.path.exists(moved_source):
+            source = moved_source
+        try:
+            if os.path.exists(source):
+                self._move_failed(source, error)
+            shutil.rmtree(work_dir, ignore_errors=True)
+        except Exception as e:
+            self.log(f"无法把任务 #{job['id']} 的源文件移到 {FAILED_DIR}: {e}")
+
+    def finish(self, job):
+        """
+        全部页完成：写合并文本，把源文件和文本一起移到输出目录
+
+        返回:
+            任务的输出目录
+        """
+        work_dir = self.work_dir(job)
+        sources = self.store.page_sources(job["id"])
+        combined_path = os.path.join(work_dir, f"{job['name']}_完整文本.txt")
+        with CombinedTextWriter(combined_path) as combined:
+            for page in range(job["page_count"]):
+                with open(self.page_file(job, page), 'r', encoding='utf-8') as f:
+                    text = f.read()
+                page_num = extract_page_number(job["files"][page]) if job["files"] else page + 1
+                combined.add(page, page_num, text)
+        with open(os.path.join(work_dir, f"{job['name']}_页面来源.json"), 'w', encoding='utf-8') as f:
+            json.dump({str(page + 1): source for page, source in sorted(sources.items())},
+                      f, ensure_ascii=False, indent=2)
+
+        source_dir = os.path.join(work_dir, SOURCE_SUBDIR)
+        os.makedirs(source_dir, exist_ok=True)
+        shutil.move(job["source"], os.path.join(source_dir, os.path.basename(job["source"])))
+        final_dir = _unique_path(os.path.join(self.output_dir, job["name"]))
+        os.replace(work_dir, final_dir)
+        self.store.finish_job(job["id"], "done")
+        self.jobs.pop(job["id"], None)
+        self.log(f"完成任务 #{job['id']} {job['name']}，已移到 {final_dir}")
+        return final_dir
+
+    def _move_failed(self, path, error):
+        failed_dir = os.path.join(self.output_dir, FAILED_DIR)
+        os.makedirs(failed_dir, exist_ok=True)
+        target = _unique_path(os.path.join(failed_dir, os.path.basename(path)))
+        shutil.move(path, target)
+        with open(target + ".错误.txt", 'w', encoding='utf-8') as f:
+            f.write(error + "\n")
+
+    def run(self, once=False):
+        """
+        主循环；once为True时处理完收件箱中已有的文件后退出
+
+        按 Ctrl+C 停止；已完成的页已经记录，下次启动时继续
+        """
+        max_in_flight = self.workers * 2
+        in_flight = {}
+        last_scan = 0.0
+        self.log(f"开始监视 {self.inbox}，输出到 {self.output_dir}，工作进程 {self.workers} 个")
+        pool = self._new_pool()
+        try:
+            while True:
+                if time.monotonic() - last_scan >= self.interval:
+                    last_scan = time.monotonic()
+                    self.scan()
+                    self.load_jobs()
+
+                broken = False
+                while len(in_flight) < max_in_flight:
+                    job, page = self.next_page()
+                    if job is None:
+                        break
+                    path = os.path.join(job["source"], job["files"][page]) if job["files"] else job["source"]
+                    try:
+                        future = pool.submit(_process_page, job["kind"], path, page)
+                    except BrokenProcessPool:
+                        job["queue"].appendleft(page)
+                        broken = True
+                        break
+                    in_flight[future] = (job, page)
+                    job["in_flight"] += 1
+                self.metrics.gauge("pages_in_flight", len(in_flight))
+
+                if not in_flight and not broken:
+                    if once:
+                        break
+                    time.sleep(self.interval)
+                    continue
+
+                done, _ = wait(in_flight, timeout=self.interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job, page = in_flight.pop(future)
+                    job["in_flight"] -= 1
+                    error = future.exception()
+                    if isinstance(error, BrokenProcessPool):
+                        broken, error = True, "工作进程意外退出"
+                    self._page_done(job, page, None if error else future.result(), error)
+                if broken:
+                    pool = self._rebuild_pool(pool, in_flight)
+        except KeyboardInterrupt:
+            self.log("正在停止，已完成的页已保存，下次启动时继续")
+            pool.shutdown(wait=False, cancel_futures=True)
+        finally:
+            pool.shutdown()
+            self.store.close()
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.options,))
+
+    def _rebuild_pool(self, pool, in_flight):
+        """
+        工作进程崩溃（内存不足被结束、MuPDF崩溃等）后进程池不能再用：
+        仍在进行的页都重新排队（计入处理次数，反复让进程崩溃的页所在的任务最终失败），换一个新的进程池
+        """
+        self.log("工作进程意外退出，重新启动进程池")
+        for job, page in in_flight.values():
+            job["in_flight"] -= 1
+            self._page_done(job, page, None, "工作进程意外退出")
+        in_flight.clear()
+        pool.shutdown(wait=False, cancel_futures=True)
+        return self._new_pool()
+
+    def _page_done(self, job, page, result, error=None):
+        """
+        处理一页的结果：成功时保存，出错时重新排队；任务的所有页都完成时整理输出
+
+        参数:
+            result: _process_page 的返回值，error不为None时忽略
+            error: 工作进程中未能捕获的异常
+        """
+        if job["id"] not in self.jobs:
+            # 任务已经失败，其余在途页的结果丢弃
+            return
+        if error is None:
+            text, source, timings = result
+            for stage, seconds in timings.items():
+                self.metrics.observe(stage, seconds, page)
+            if source == "error":
+                error = text
+            else:
+                try:
+                    self.save_page(job, page, text, source)
+                except Exception as e:
+                    self.fail(job, f"无法保存第 {page+1} 页: {e}")
+                    return
+        if error is not None:
+            self.retry_page(job, page, error)
+        if job["id"] in self.jobs and not job["queue"] and not job["in_flight"]:
+            self.complete(job)
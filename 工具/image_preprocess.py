@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+OCR前的图像预处理
+功能：用NumPy数组运算把彩色页面转换为紧凑的灰度或黑白图像再交给tesseract
+    gray       灰度化
+    threshold  自适应二值化（累加和求局部均值）
+    deskew     纠正扫描倾斜（投影方差最大的角度）
+    crop       裁掉空白页边
+步骤用逗号分隔，例如 "gray,threshold,deskew,crop"；"none" 表示不处理
+可通过环境变量 TONY_OCR_PREPROCESS 或各工具的 --preprocess 参数设置
+"""
+
+import os
+
+# numpy导入较慢，第一次真正做预处理时才加载（见 _load_numpy）
+np = None
+
+STEPS = ("gray", "threshold", "deskew", "crop")
+
+# 常用组合
+PRESETS = {
+    "none": (),
+    "gray": ("gray",),
+    "binary": ("gray", "threshold"),
+    "full": ("gray", "threshold", "deskew", "crop"),
+}
+
+_default_steps = None
+
+def _load_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise RuntimeError("图像预处理需要numpy，请安装: pip install numpy")
+        np = numpy
+    return np
+
+def parse_preprocess_steps(spec):
+    """
+    解析预处理步骤说明
+
+    参数:
+        spec: 预设名（none/gray/binary/full）或逗号分隔的步骤列表
+
+    返回:
+        按固定顺序排列的步骤元组
+    """
+    if not spec:
+        return ()
+    spec = spec.strip().lower()
+    if spec in PRESETS:
+        return PRESETS[spec]
+    steps = [step.strip() for step in spec.split(",") if step.strip()]
+    unknown = [step for step in steps if step not in STEPS]
+    if unknown:
+        raise ValueError(f"未知的预处理步骤: {', '.join(unknown)}，可选: {', '.join(STEPS)}")
+    # 二值化、纠偏和裁边都基于灰度图，按固定顺序执行
+    return tuple(step for step in STEPS if step in steps or (step == "gray" and steps))
+
+def set_default_preprocess(spec):
+    """设置本进程默认的预处理步骤"""
+    global _default_steps
+    _default_steps = parse_preprocess_steps(spec)
+
+def get_default_preprocess():
+    """当前默认的预处理步骤，未设置时读取环境变量 TONY_OCR_PREPROCESS"""
+    if _default_steps is None:
+        return parse_preprocess_steps(os.environ.get('TONY_OCR_PREPROCESS', ''))
+    return _default_steps
+
+def to_grayscale(arr):
+    """RGB数组按 ITU-R 601 权重转为8位灰度"""
+    if arr.ndim == 2:
+        return arr.astype(np.uint8, copy=False)
+    rgb = arr[..., :3].astype(np.float32)
+    gray = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    return np.clip(gray + 0.5, 0, 255).astype(np.uint8)
+
+def adaptive_threshold(gray, block_size=41, offset=0.15):
+    """
+    自适应二值化：像素比周围 block_size×block_size 区域的均值暗 offset 以上时视为文字
+
+    局部和先按列、再按行用累加和相减求出，复杂度与窗口大小无关；
+    全程使用int32，300 DPI整页的临时数组也只有几十MB
+
+    返回:
+        布尔数组，True表示前景（文字）
+    """
+    h, w = gray.shape
+    half = block_size // 2
+    g = gray.astype(np.int32)
+
+    rows = np.arange(h)
+    cols = np.arange(w)
+    y0 = np.clip(rows - half, 0, h)
+    y1 = np.clip(rows + half + 1, 0, h)
+    x0 = np.clip(cols - half, 0, w)
+    x1 = np.clip(cols + half + 1, 0, w)
+
+    # 纵向窗口和
+    column_cumsum = np.zeros((h + 1, w), dtype=np.int32)
+    np.cumsum(g, axis=0, out=column_cumsum[1:])
+    vertical = column_cumsum[y1] - column_cumsum[y0]
+    del column_cumsum
+
+    # 横向窗口和
+    row_cumsum = np.zeros((h, w + 1), dtype=np.int32)
+    np.cumsum(vertical, axis=1, out=row_cumsum[:, 1:])
+    del vertical
+    window_sum = row_cumsum[:, x1] - row_cumsum[:, x0]
+    del row_cumsum
+
+    # 用整数比较 gray < mean * (1 - offset)，避免生成浮点大数组
+    area = ((y1 - y0)[:, None] * (x1 - x0)[None, :]).astype(np.int32)
+    scale = 1000
+    return g * area * scale < window_sum * int(round((1.0 - offset) * scale))
+
+def estimate_skew(foreground, max_angle=5.0, step=0.25, max_samples=200000):
+    """
+    估计倾斜角度（度）
+
+    对每个候选角度把前景像素按该角度剪切后投影到行上，文字行对齐时行投影的方差最大
+
+    参数:
+        foreground: 布尔数组，True表示文字
+        max_angle: 搜索范围 ±max_angle 度
+        step: 搜索步长（度）
+        max_samples: 最多抽样的前景像素数
+    """
+    ys, xs = np.nonzero(foreground)
+    if len(ys) == 0:
+        return 0.0
+    if len(ys) > max_samples:
+        index = np.random.default_rng(0).choice(len(ys), max_samples, replace=False)
+        ys, xs = ys[index], xs[index]
+
+    height = foreground.shape[0]
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_angle, max_angle + step / 2, step):
+        shifted = np.round(ys - xs * np.tan(np.radians(angle))).astype(np.int64)
+        shifted -= shifted.min()
+        profile = np.bincount(shifted, minlength=height)
+        score = float(np.var(profile))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+def crop_margins(foreground, padding=20):
+    """
+    找出包含全部前景的最小矩形，四周留 padding 像素
+
+    返回:
+        (top, bottom, left, right)，没有前景时返回None
+    """
+    rows = np.flatnonzero(foreground.any(axis=1))
+    cols = np.flatnonzero(foreground.any(axis=0))
+    if len(rows) == 0:
+        return None
+    h, w = foreground.shape
+    return (max(rows[0] - padding, 0), min(rows[-1] + padding + 1, h),
+            max(cols[0] - padding, 0), min(cols[-1] + padding + 1, w))
+
+def preprocess_image(img, steps):
+    """
+    按步骤预处理PIL图像
+
+    参数:
+        img: PIL图像
+        steps: parse_preprocess_steps 返回的步骤元组
+
+    返回:
+        处理后的PIL图像：做了二值化时为1位图像，否则为8位灰度图像（steps为空时原样返回）
+    """
+    if not steps:
+        return img
+    _load_numpy()
+    from PIL import Image
+    if img.mode not in ("L", "RGB", "RGBA"):
+        img = img.convert("RGB")
+
+    gray = to_grayscale(np.asarray(img))
+    foreground = None
+    if "threshold" in steps or "deskew" in steps or "crop" in steps:
+        foreground = adaptive_threshold(gray)
+
+    if "deskew" in steps:
+        angle = estimate_skew(foreground)
+        if abs(angle) >= 0.1:
+            # 旋转后再重新二值化，避免旋转布尔图产生锯齿
+            rotated = Image.fromarray(gray).rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor=255)
+            gray = np.asarray(rotated)
+            foreground = adaptive_threshold(gray)
+
+    if "crop" in steps:
+        box = crop_margins(foreground)
+        if box:
+            top, bottom, left, right = box
+            gray = gray[top:bottom, left:right]
+            foreground = foreground[top:bottom, left:right]
+
+    if "threshold" in steps:
+        # 前景为黑、背景为白的1位图像
+        return Image.fromarray(~foreground)
+    return Image.fromarray(gray)
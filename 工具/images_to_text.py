@@ -11,6 +11,21 @@ import os
 import sys
 import subprocess
 import time
+import tkinter as tk
+from tkinter import filedialog, messagebox, ttk
+import threading
+
+from ocr_parallel import ocr_images_in_order, default_ocr_workers
+from ocr_cache import get_ocr_cache
+from metrics import get_metrics
+from ocr_backends import (recognize_file, recognize_files, get_ocr_backend, set_ocr_backend,
+                          default_backend_name, BACKEND_CLASSES)
+from text_output import CombinedTextWriter
+from create_text_files import extract_page_number
+from progress_channel import JobCancelled, ProgressChannel
+from page_triage import triage_pages, ocr_indices, merge_triaged, write_triage_report, DEFAULT_BLANK_THRESHOLD
+from image_preprocess import set_default_preprocess, PRESETS
+from tesseract_path import import_pytesseract
 
 # 尝试安装必要的库
 def install_package(package):
@@ -19,27 +34,22 @@ def install_package(package):
     print(f"{package} 安装完成")
     time.sleep(1)  # 给一点时间让系统识别新安装的包
 
-# 检查并安装必要的库
-try:
-    import pytesseract
-except ImportError:
-    install_package("pytesseract")
+def ensure_dependencies():
+    """检查并安装必要的库，只在直接运行本工具时调用，导入本模块不会触发安装"""
     try:
         import pytesseract
     except ImportError:
-        print("无法安装 pytesseract，请手动安装: pip install pytesseract")
-        sys.exit(1)
-
-try:
-    from PIL import Image
-except ImportError:
-    install_package("Pillow")
-    from PIL import Image
+        install_package("pytesseract")
+        try:
+            import pytesseract
+        except ImportError:
+            print("无法安装 pytesseract，请手动安装: pip install pytesseract")
+            sys.exit(1)
 
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
-import threading
-import re
+    try:
+        from PIL import Image
+    except ImportError:
+        install_package("Pillow")
 
 def extract_text_from_image(image_path, lang='chi_sim+eng'):
     """
@@ -53,13 +63,13 @@ def extract_text_from_image(image_path, lang='chi_sim+eng'):
         提取的文本内容
     """
     try:
-        img = Image.open(image_path)
-        text = pytesseract.image_to_string(img, lang=lang)
-        return text
+        # 先查OCR缓存，未命中时交给当前选择的OCR后端
+        return recognize_file(image_path, lang)
     except Exception as e:
         return f"处理图片时出错: {e}"
 
-def process_images_in_directory(input_dir, output_dir, lang='chi_sim+eng', progress_callback=None):
+def process_images_in_directory(input_dir, output_dir, lang='chi_sim+eng', progress_callback=None, workers=1,
+                                runner=None, skip_blank=False, dedupe=False):
     """
     处理目录中的所有图片文件
     
@@ -67,7 +77,11 @@ def process_images_in_directory(input_dir, output_dir, lang='chi_sim+eng', progr
         input_dir: 输入图片目录
         output_dir: 输出文本目录
         lang: OCR语言
-        progress_callback: 进度回调函数
+        progress_callback: 进度回调函数，抛出 progress_channel.JobCancelled 时停止识别，已完成的页保留
+        workers: 并行OCR的进程数，1表示逐张识别，None表示使用全部CPU核心
+        runner: ocr_async.AsyncOCRRunner，提供时改用异步驱动识别，可从界面线程取消
+        skip_blank: 是否跳过空白页，空白页的文本为空
+        dedupe: 是否检测重复页，重复页沿用前面相同页的文本
     """
     # 确保输出目录存在
     if not os.path.exists(output_dir):
@@ -76,58 +90,84 @@ def process_images_in_directory(input_dir, output_dir, lang='chi_sim+eng', progr
     # 获取所有图片文件
     image_files = []
     for file in os.listdir(input_dir):
-        if file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff')):
+        if file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif', '.webp')):
             image_files.append(file)
     
     if not image_files:
         return False, f"在目录 '{input_dir}' 中没有找到图片文件"
     
     # 按页码排序
-    def extract_page_number(filename):
-        match = re.search(r'第(\d+)页', filename)
-        if match:
-            return int(match.group(1))
-        return 0
-    
     image_files.sort(key=extract_page_number)
     
     # 处理每个图片
     total_files = len(image_files)
-    all_text = ""
     
-    for i, file in enumerate(image_files):
-        if progress_callback:
-            progress_callback(i, total_files)
-        
-        image_path = os.path.join(input_dir, file)
-        text = extract_text_from_image(image_path, lang)
-        
-        # 将文本添加到总文本中
-        page_num = extract_page_number(file)
-        all_text += f"\n\n--- 第{page_num}页 ---\n\n"
-        all_text += text
-        
-        # 同时保存单独的文本文件
-        base_name = os.path.splitext(file)[0]
-        text_file_path = os.path.join(output_dir, f"{base_name}.txt")
-        
-        with open(text_file_path, 'w', encoding='utf-8') as f:
-            f.write(text)
-    
-    # 保存合并的文本文件
+    image_paths = [os.path.join(input_dir, file) for file in image_files]
     book_name = os.path.basename(input_dir)
-    combined_file_path = os.path.join(output_dir, f"{book_name}_完整文本.txt")
     
-    with open(combined_file_path, 'w', encoding='utf-8') as f:
-        f.write(all_text)
+    # 预筛：空白页和重复页不交给OCR
+    decisions = None
+    ocr_paths = image_paths
+    if skip_blank or dedupe:
+        decisions = triage_pages(image_paths, workers, DEFAULT_BLANK_THRESHOLD if skip_blank else None, dedupe)
+        ocr_paths = [image_paths[i] for i in ocr_indices(decisions)]
+    
+    # 合并文本边识别边写入
+    combined_file_path = os.path.join(output_dir, f"{book_name}_完整文本.txt")
+    metrics = get_metrics()
+    with CombinedTextWriter(combined_file_path) as combined:
+        # 识别结果按页码顺序返回
+        if runner:
+            results = runner.results(ocr_paths)
+        else:
+            backend = get_ocr_backend()
+            results = ocr_images_in_order(extract_text_from_image, ocr_paths, lang, workers,
+                                          recognize_files, backend.batch_size)
+        if decisions:
+            results = merge_triaged(decisions, results)
+        try:
+            for i, text in results:
+                file = image_files[i]
+                
+                with metrics.timer("text_write", i):
+                    # 将文本追加到合并文本中
+                    page_num = extract_page_number(file)
+                    combined.add(i, page_num, text)
+                
+                    # 同时保存单独的文本文件
+                    base_name = os.path.splitext(file)[0]
+                    text_file_path = os.path.join(output_dir, f"{base_name}.txt")
+                
+                    with open(text_file_path, 'w', encoding='utf-8') as f:
+                        f.write(text)
+                
+                # 进度回调在本页写完之后调用，暂停或取消时已识别的页不会丢失
+                if progress_callback:
+                    progress_callback(i, total_files)
+            cancelled = False
+        except JobCancelled:
+            cancelled = True
+        finally:
+            # 立即关闭结果生成器，让线程池或异步驱动停止提交新页
+            results.close()
     
-    return True, f"处理完成! 共处理 {total_files} 个图片，文本已保存到 '{output_dir}'"
+    if cancelled or (runner and runner.cancelled):
+        return False, f"已取消，完成了 {combined.pages_written}/{total_files} 个图片，文本已保存到 '{output_dir}'"
+    message = f"处理完成! 共处理 {total_files} 个图片，文本已保存到 '{output_dir}'"
+    if decisions:
+        summary = write_triage_report(output_dir, book_name, image_files, decisions)
+        if summary:
+            message += f"\n{summary}"
+    cache = get_ocr_cache()
+    if cache:
+        message += f"\n{cache.summary()}"
+    return True, message
 
 class ImageToTextApp:
     def __init__(self, root):
         self.root = root
         self.root.title("图片转文字工具")
-        self.root.geometry("600x400")
+        self.root.geometry("600x500")
         self.root.resizable(True, True)
         
         # 设置样式
@@ -169,6 +209,33 @@ class ImageToTextApp:
         lang_combo.pack(side=tk.LEFT, padx=5)
         ttk.Label(lang_frame, text="(chi_sim=简体中文, eng=英文, chi_tra=繁体中文)").pack(side=tk.LEFT, padx=5)
         
+        # 并行数设置
+        workers_frame = ttk.Frame(main_frame)
+        workers_frame.pack(fill=tk.X, pady=10)
+        
+        ttk.Label(workers_frame, text="并行识别数:").pack(side=tk.LEFT)
+        self.workers_var = tk.IntVar(value=default_ocr_workers())
+        ttk.Spinbox(workers_frame, textvariable=self.workers_var, from_=1, to=64, width=8).pack(side=tk.LEFT, padx=5)
+        ttk.Label(workers_frame, text="(同时运行的tesseract进程数)").pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(workers_frame, text="OCR后端:").pack(side=tk.LEFT, padx=(20, 0))
+        self.backend_var = tk.StringVar(value=default_backend_name())
+        ttk.Combobox(workers_frame, textvariable=self.backend_var, values=list(BACKEND_CLASSES),
+                     width=12, state="readonly").pack(side=tk.LEFT, padx=5)
+        
+        # 预处理设置
+        preprocess_frame = ttk.Frame(main_frame)
+        preprocess_frame.pack(fill=tk.X, pady=10)
+        
+        ttk.Label(preprocess_frame, text="图像预处理:").pack(side=tk.LEFT)
+        self.preprocess_var = tk.StringVar(value="none")
+        ttk.Combobox(preprocess_frame, textvariable=self.preprocess_var, values=list(PRESETS),
+                     width=12, state="readonly").pack(side=tk.LEFT, padx=5)
+        ttk.Label(preprocess_frame, text="(binary=灰度+二值化, full=另加纠偏和裁边)").pack(side=tk.LEFT, padx=5)
+        
+        self.triage_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(preprocess_frame, text="跳过空白页和重复页", variable=self.triage_var).pack(side=tk.RIGHT)
+        
         # 进度条
         progress_frame = ttk.Frame(main_frame)
         progress_frame.pack(fill=tk.X, pady=20)
@@ -181,6 +248,9 @@ class ImageToTextApp:
         status_label = ttk.Label(progress_frame, textvariable=self.status_var)
         status_label.pack(fill=tk.X, pady=5)
         
+        self.stage_var = tk.StringVar()
+        ttk.Label(progress_frame, textvariable=self.stage_var).pack(fill=tk.X)
+        
         # 转换按钮
         button_frame = ttk.Frame(main_frame)
         button_frame.pack(fill=tk.X, pady=10)
@@ -188,7 +258,20 @@ class ImageToTextApp:
         self.convert_button = ttk.Button(button_frame, text="开始转换", command=self.start_conversion)
         self.convert_button.pack(side=tk.RIGHT, padx=5)
         
-        ttk.Button(button_frame, text="退出", command=root.quit).pack(side=tk.RIGHT, padx=5)
+        self.cancel_button = ttk.Button(button_frame, text="取消", command=self.cancel_conversion, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.RIGHT, padx=5)
+        
+        self.pause_button = ttk.Button(button_frame, text="暂停", command=self.toggle_pause, state=tk.DISABLED)
+        self.pause_button.pack(side=tk.RIGHT, padx=5)
+        
+        ttk.Button(button_frame, text="退出", command=self.quit).pack(side=tk.RIGHT, padx=5)
+        
+        # 当前任务的进度通道，工作线程只通过它与界面通信；
+        # 使用pytesseract后端时由异步驱动直接运行tesseract进程，取消时立即结束它们
+        self.channel = None
+        self.runner = None
+        self.last_progress = None
+        root.protocol("WM_DELETE_WINDOW", self.quit)
     
     def browse_input_dir(self):
         dir_path = filedialog.askdirectory(title="选择图片目录")
@@ -204,16 +287,44 @@ class ImageToTextApp:
         if dir_path:
             self.output_dir_var.set(dir_path)
     
-    def update_progress(self, current, total):
-        progress = (current + 1) / total * 100
-        self.progress_var.set(progress)
-        self.status_var.set(f"正在处理第 {current + 1}/{total} 个图片 ({int(progress)}%)")
-        self.root.update_idletasks()
+    def poll_progress(self):
+        """在主线程中定时取出进度事件并更新界面，任务结束后停止"""
+        progress, finished = self.channel.poll()
+        if progress:
+            self.last_progress = progress
+            done, total = progress
+            self.progress_var.set(done / total * 100)
+            self.status_var.set("已识别" + self.channel.describe(done, total, "张"))
+        self.stage_var.set(self.channel.stage_text())
+        if finished:
+            self.conversion_complete(*finished)
+        else:
+            self.root.after(100, self.poll_progress)
+    
+    def toggle_pause(self):
+        if self.channel.control.paused:
+            self.channel.resume()
+            self.pause_button.config(text="暂停")
+        else:
+            self.channel.pause()
+            self.pause_button.config(text="继续")
+        if self.last_progress:
+            self.status_var.set("已识别" + self.channel.describe(*self.last_progress, "张"))
+    
+    def quit(self):
+        # 转换线程可能正在暂停中，先取消，让它结束后退出
+        if self.channel:
+            self.cancel_conversion()
+        self.root.quit()
     
     def start_conversion(self):
         input_dir = self.input_dir_var.get()
         output_dir = self.output_dir_var.get()
         lang = self.lang_var.get()
+        workers = self.workers_var.get()
+        backend = self.backend_var.get()
+        preprocess = self.preprocess_var.get()
+        triage = self.triage_var.get()
         
         if not input_dir or not output_dir:
             messagebox.showerror("错误", "请选择图片目录和输出目录")
@@ -225,55 +336,57 @@ class ImageToTextApp:
         
         # 禁用按钮，防止重复点击
         self.convert_button.config(state=tk.DISABLED)
+        self.pause_button.config(state=tk.NORMAL, text="暂停")
+        self.cancel_button.config(state=tk.NORMAL)
         self.status_var.set("正在准备转换...")
+        self.stage_var.set("")
         self.progress_var.set(0)
+        self.last_progress = None
+        
+        channel = self.channel = ProgressChannel()
+        channel.start()
+        self.runner = None
+        if backend == 'pytesseract':
+            from ocr_async import AsyncOCRDriver, AsyncOCRRunner
+            # 暂停期间事件循环不运行，超时计时会把暂停的时间也算进去，所以界面不设单页超时，卡住时用取消
+            self.runner = AsyncOCRRunner(AsyncOCRDriver(lang, workers, timeout=None))
+        runner = self.runner
         
-        # 在新线程中执行转换，避免界面卡死
+        # 在新线程中执行转换，避免界面卡死；结果也经进度通道交给主线程
         def conversion_thread():
             try:
-                # 尝试设置tesseract路径
-                tesseract_path = self.find_tesseract()
-                if tesseract_path:
-                    pytesseract.pytesseract.tesseract_cmd = tesseract_path
+                set_ocr_backend(backend)
+                set_default_preprocess(preprocess)
                 
-                success, message = process_images_in_directory(input_dir, output_dir, lang, self.update_progress)
-                
-                # 更新UI（必须在主线程中进行）
-                self.root.after(0, lambda: self.conversion_complete(success, message))
+                success, message = process_images_in_directory(input_dir, output_dir, lang, channel.progress, workers,
+                                                                runner, skip_blank=triage, dedupe=triage)
             except Exception as e:
-                self.root.after(0, lambda: self.conversion_complete(False, f"转换过程中出错: {e}"))
+                success, message = False, f"转换过程中出错: {e}"
+            channel.finish(success, message)
         
         threading.Thread(target=conversion_thread).start()
+        self.poll_progress()
     
-    def find_tesseract(self):
-        """尝试找到tesseract可执行文件的路径"""
-        # 默认路径
-        default_paths = [
-            r'C:\Program Files\Tesseract-OCR\tesseract.exe',  # Windows
-            r'C:\Program Files (x86)\Tesseract-OCR\tesseract.exe',  # Windows 32位
-            '/usr/bin/tesseract',  # Linux
-            '/usr/local/bin/tesseract',  # macOS
-            '/opt/homebrew/bin/tesseract'  # macOS Homebrew
-        ]
-        
-        # 首先检查环境变量
-        if 'TESSERACT_CMD' in os.environ:
-            return os.environ['TESSERACT_CMD']
-        
-        # 然后检查默认路径
-        for path in default_paths:
-            if os.path.isfile(path):
-                print(f"找到Tesseract: {path}")
-                return path
-        
-        # 如果找不到，返回默认命令名，让系统在PATH中查找
-        print("未找到Tesseract安装路径，将使用系统PATH中的tesseract命令")
-        return 'tesseract'
+    def cancel_conversion(self):
+        self.channel.cancel()
+        if self.runner:
+            self.runner.cancel()
+        self.pause_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.DISABLED)
+        self.status_var.set("正在取消...")
     
     def conversion_complete(self, success, message):
         self.convert_button.config(state=tk.NORMAL)
+        self.pause_button.config(state=tk.DISABLED, text="暂停")
+        self.cancel_button.config(state=tk.DISABLED)
+        cancelled = self.channel.control.cancelled
+        self.channel = None
+        self.runner = None
         
-        if success:
+        if cancelled:
+            self.status_var.set("已取消")
+            messagebox.showinfo("已取消", message)
+        elif success:
             self.status_var.set("转换完成!")
             messagebox.showinfo("成功", message)
         else:
@@ -281,9 +394,11 @@ class ImageToTextApp:
             messagebox.showerror("错误", message)
 
 def main():
-    # 检查Tesseract是否已安装
+    ensure_dependencies()
+    
+    # 检查Tesseract是否已安装（同时设置tesseract路径）
     try:
-        tesseract_version = pytesseract.get_tesseract_version()
+        tesseract_version = import_pytesseract().get_tesseract_version()
         print(f"检测到Tesseract版本: {tesseract_version}")
     except Exception as e:
         print("警告: 未检测到Tesseract OCR引擎或无法访问它")
@@ -4,15 +4,25 @@
 """
 图片转文字工具 - 命令行版本
 功能：将图片文件转换为文字内容并保存到指定目录
-使用方法：python3 images_to_text_cli.py <输入目录> <输出目录> [语言]
-例如：python3 images_to_text_cli.py ../tony/pdf存档/截图源文件/tony ../tony/pdf存档/文本 chi_sim+eng
+使用方法：python3 images_to_text_cli.py <输入目录> <输出目录> [语言] [并行数] [--backend pytesseract|tesserocr|batch] [--preprocess 预处理] [--skip-blank] [--dedupe] [--pages 页码范围] [--shard i/N]
+例如：python3 images_to_text_cli.py ../tony/pdf存档/截图源文件/tony ../tony/pdf存档/文本 chi_sim+eng 4
 """
 
 import os
 import sys
 import subprocess
 import time
-import re
+
+from ocr_parallel import ocr_images_in_order, default_ocr_workers
+from ocr_cache import get_ocr_cache
+from metrics import get_metrics
+from ocr_backends import recognize_file, recognize_files, get_ocr_backend, set_ocr_backend, BACKEND_CLASSES
+from text_output import CombinedTextWriter
+from create_text_files import extract_page_number
+from page_triage import triage_pages, ocr_indices, merge_triaged, write_triage_report, DEFAULT_BLANK_THRESHOLD
+from page_shards import select_pages, write_shard_manifest, file_page_numbers
+from image_preprocess import set_default_preprocess, get_default_preprocess
+from tesseract_path import import_pytesseract
 
 # 尝试安装必要的库
 def install_package(package):
@@ -21,47 +31,22 @@ def install_package(package):
     print(f"{package} 安装完成")
     time.sleep(1)  # 给一点时间让系统识别新安装的包
 
-# 检查并安装必要的库
-try:
-    import pytesseract
-except ImportError:
-    install_package("pytesseract")
+def ensure_dependencies():
+    """检查并安装必要的库，只在直接运行本工具时调用，导入本模块不会触发安装"""
     try:
         import pytesseract
     except ImportError:
-        print("无法安装 pytesseract，请手动安装: pip install pytesseract")
-        sys.exit(1)
-
-try:
-    from PIL import Image
-except ImportError:
-    install_package("Pillow")
-    from PIL import Image
+        install_package("pytesseract")
+        try:
+            import pytesseract
+        except ImportError:
+            print("无法安装 pytesseract，请手动安装: pip install pytesseract")
+            sys.exit(1)
 
-def find_tesseract():
-    """尝试找到tesseract可执行文件的路径"""
-    # 默认路径
-    default_paths = [
-        r'C:\Program Files\Tesseract-OCR\tesseract.exe',  # Windows
-        r'C:\Program Files (x86)\Tesseract-OCR\tesseract.exe',  # Windows 32位
-        '/usr/bin/tesseract',  # Linux
-        '/usr/local/bin/tesseract',  # macOS
-        '/opt/homebrew/bin/tesseract'  # macOS Homebrew
-    ]
-    
-    # 首先检查环境变量
-    if 'TESSERACT_CMD' in os.environ:
-        return os.environ['TESSERACT_CMD']
-    
-    # 然后检查默认路径
-    for path in default_paths:
-        if os.path.isfile(path):
-            print(f"找到Tesseract: {path}")
-            return path
-    
-    # 如果找不到，返回默认命令名，让系统在PATH中查找
-    print("未找到Tesseract安装路径，将使用系统PATH中的tesseract命令")
-    return 'tesseract'
+    try:
+        from PIL import Image
+    except ImportError:
+        install_package("Pillow")
 
 def extract_text_from_image(image_path, lang='chi_sim+eng'):
     """
@@ -75,13 +60,13 @@ def extract_text_from_image(image_path, lang='chi_sim+eng'):
         提取的文本内容
     """
     try:
-        img = Image.open(image_path)
-        text = pytesseract.image_to_string(img, lang=lang)
-        return text
+        # 先查OCR缓存，未命中时交给当前选择的OCR后端
+        return recognize_file(image_path, lang)
     except Exception as e:
         return f"处理图片时出错: {e}"
 
-def process_images_in_directory(input_dir, output_dir, lang='chi_sim+eng'):
+def process_images_in_directory(input_dir, output_dir, lang='chi_sim+eng', workers=1, progress_callback=None,
+                                runner=None, skip_blank=False, dedupe=False, pages=None, shard=None):
     """
     处理目录中的所有图片文件
     
@@ -89,10 +74,21 @@ def process_images_in_directory(input_dir, output_dir, lang='chi_sim+eng'):
         input_dir: 输入图片目录
         output_dir: 输出文本目录
         lang: OCR语言
+        workers: 并行OCR的进程数，1表示逐张识别，None表示使用全部CPU核心
+        progress_callback: 进度回调函数，每写出一页调用一次 progress_callback(序号, 总数)
+        runner: ocr_async.AsyncOCRRunner，提供时改用异步驱动识别（单页超时、可取消），忽略OCR后端设置
+        skip_blank: 是否跳过空白页，空白页的文本为空
+        dedupe: 是否检测重复页，重复页沿用前面相同页的文本
+        pages: 只处理这些页，例如 "1-20,35,50-"，页码取自文件名中的"第N页"
+        shard: 分片 "i/N"，只处理页码除以N余i-1的页；指定pages或shard时输出目录中另写分片清单，
+               各分片的输出用 page_shards.merge_shards（tony-ocr merge）合并
     """
     print(f"开始处理目录: {input_dir}")
     print(f"输出目录: {output_dir}")
     print(f"OCR语言: {lang}")
+    print(f"并行数: {workers if workers else default_ocr_workers()}")
+    print(f"OCR后端: {'异步tesseract进程' if runner else get_ocr_backend().name}")
+    print(f"预处理: {','.join(get_default_preprocess()) or '无'}")
     
     # 确保输出目录存在
     if not os.path.exists(output_dir):
@@ -100,9 +96,10 @@ def process_images_in_directory(input_dir, output_dir, lang='chi_sim+eng'):
         print(f"创建输出目录: {output_dir}")
     
     # 获取所有图片文件
+    # 先按文件名排序，没有页码的文件在各台机器上的顺序也相同
     image_files = []
-    for file in os.listdir(input_dir):
-        if file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff')):
+    for file in sorted(os.listdir(input_dir)):
+        if file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif', '.webp')):
             image_files.append(file)
     
     if not image_files:
@@ -110,54 +107,117 @@ def process_images_in_directory(input_dir, output_dir, lang='chi_sim+eng'):
         return False
     
     # 按页码排序
-    def extract_page_number(filename):
-        match = re.search(r'第(\d+)页', filename)
-        if match:
-            return int(match.group(1))
-        return 0
-    
     image_files.sort(key=extract_page_number)
     print(f"找到 {len(image_files)} 个图片文件，已按页码排序")
     
+    # 只处理部分页时按页码选出图片，文件名中都没有页码时按排序后的位置计
+    book_name = os.path.basename(input_dir)
+    partial = bool(pages or shard)
+    if partial:
+        try:
+            all_numbers = file_page_numbers(image_files, extract_page_number)
+            selected = select_pages(all_numbers, pages, shard)
+        except ValueError as e:
+            print(f"错误: {e}")
+            return False
+        image_files = [image_files[i] for i in selected]
+        numbers = [all_numbers[i] for i in selected]
+        print(f"选中 {len(image_files)} 个图片（页码范围: {pages or '全部'}，分片: {shard or '不分片'}）")
+        written_files = {}
+        if not image_files:
+            write_shard_manifest(output_dir, book_name, pages, shard, all_numbers, {}, True)
+            print("本分片没有需要处理的页")
+            return True
+    
     # 处理每个图片
     total_files = len(image_files)
-    all_text = ""
-    
-    for i, file in enumerate(image_files):
-        print(f"处理第 {i+1}/{total_files} 个图片: {file}")
-        
-        image_path = os.path.join(input_dir, file)
-        text = extract_text_from_image(image_path, lang)
-        
-        # 将文本添加到总文本中
-        page_num = extract_page_number(file)
-        all_text += f"\n\n--- 第{page_num}页 ---\n\n"
-        all_text += text
-        
-        # 同时保存单独的文本文件
-        base_name = os.path.splitext(file)[0]
-        text_file_path = os.path.join(output_dir, f"{base_name}.txt")
-        
-        with open(text_file_path, 'w', encoding='utf-8') as f:
-            f.write(text)
-        
-        print(f"已保存: {text_file_path}")
-    
-    # 保存合并的文本文件
-    book_name = os.path.basename(input_dir)
-    combined_file_path = os.path.join(output_dir, f"{book_name}_完整文本.txt")
     
-    with open(combined_file_path, 'w', encoding='utf-8') as f:
-        f.write(all_text)
+    image_paths = [os.path.join(input_dir, file) for file in image_files]
+    
+    # 预筛：空白页和重复页不交给OCR
+    decisions = None
+    ocr_paths = image_paths
+    if skip_blank or dedupe:
+        decisions = triage_pages(image_paths, workers, DEFAULT_BLANK_THRESHOLD if skip_blank else None, dedupe)
+        ocr_paths = [image_paths[i] for i in ocr_indices(decisions)]
+        print(f"预筛完成: {total_files} 个图片中需要识别 {len(ocr_paths)} 个")
+    
+    # 合并文本边识别边写入
+    combined_file_path = os.path.join(output_dir, f"{book_name}_完整文本.txt")
+    metrics = get_metrics()
+    with CombinedTextWriter(combined_file_path) as combined:
+        # 识别结果按页码顺序返回
+        if runner:
+            results = runner.results(ocr_paths)
+        else:
+            backend = get_ocr_backend()
+            results = ocr_images_in_order(extract_text_from_image, ocr_paths, lang, workers,
+                                          recognize_files, backend.batch_size)
+        if decisions:
+            results = merge_triaged(decisions, results)
+        for i, text in results:
+            file = image_files[i]
+            print(f"处理第 {i+1}/{total_files} 个图片: {file}")
+            
+            with metrics.timer("text_write", i):
+                # 将文本追加到合并文本中
+                page_num = extract_page_number(file)
+                combined.add(i, page_num, text)
+            
+                # 同时保存单独的文本文件
+                base_name = os.path.splitext(file)[0]
+                text_file_path = os.path.join(output_dir, f"{base_name}.txt")
+            
+                with open(text_file_path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+            
+            print(f"已保存: {text_file_path}")
+            if partial:
+                written_files[numbers[i]] = os.path.basename(text_file_path)
+            if progress_callback:
+                progress_callback(i, total_files)
     
     print(f"已保存合并文本: {combined_file_path}")
+    cancelled = bool(runner and runner.cancelled)
+    if partial:
+        manifest_path = write_shard_manifest(output_dir, book_name, pages, shard, all_numbers, written_files,
+                                             not cancelled)
+        print(f"已保存分片清单: {manifest_path}")
+    if cancelled:
+        print(f"已取消，完成了 {combined.pages_written}/{total_files} 个图片")
+        return False
     print(f"处理完成! 共处理 {total_files} 个图片，文本已保存到 '{output_dir}'")
+    if decisions:
+        summary = write_triage_report(output_dir, book_name, image_files, decisions)
+        if summary:
+            print(summary)
+    cache = get_ocr_cache()
+    if cache:
+        print(cache.summary())
+    return True
+
+def pop_option(args, name):
+    """从参数列表中取出 "name 值" 形式的选项，不存在时返回None"""
+    if name not in args:
+        return None
+    i = args.index(name)
+    value = args[i + 1] if i + 1 < len(args) else ''
+    del args[i:i + 2]
+    return value
+
+def pop_flag(args, name):
+    """从参数列表中取出开关选项，返回是否出现过"""
+    if name not in args:
+        return False
+    args.remove(name)
     return True
 
 def main():
-    # 检查Tesseract是否已安装
+    ensure_dependencies()
+    
+    # 检查Tesseract是否已安装（同时设置tesseract路径）
     try:
-        tesseract_version = pytesseract.get_tesseract_version()
+        tesseract_version = import_pytesseract().get_tesseract_version()
         print(f"检测到Tesseract版本: {tesseract_version}")
     except Exception as e:
         print("警告: 未检测到Tesseract OCR引擎或无法访问它")
@@ -169,32 +229,60 @@ def main():
         print("- Fedora: sudo dnf install tesseract tesseract-langpack-chi-sim")
         print("\n程序将继续运行，但如果没有安装Tesseract，OCR功能将无法正常工作。")
     
-    # 设置tesseract路径
-    tesseract_path = find_tesseract()
-    if tesseract_path:
-        pytesseract.pytesseract.tesseract_cmd = tesseract_path
+    # 解析命令行参数，以 -- 开头的选项可以出现在任意位置
+    args = sys.argv[1:]
+    backend = pop_option(args, '--backend')
+    preprocess = pop_option(args, '--preprocess')
+    skip_blank = pop_flag(args, '--skip-blank')
+    dedupe = pop_flag(args, '--dedupe')
+    pages = pop_option(args, '--pages')
+    shard = pop_option(args, '--shard')
+    try:
+        if backend is not None:
+            set_ocr_backend(backend)
+            get_ocr_backend()
+        if preprocess is not None:
+            set_default_preprocess(preprocess)
+    except (ValueError, RuntimeError) as e:
+        print(f"错误: {e}")
+        sys.exit(1)
     
-    # 解析命令行参数
-    if len(sys.argv) < 3:
-        print("用法: python3 images_to_text_cli.py <输入目录> <输出目录> [语言]")
-        print("例如: python3 images_to_text_cli.py ../tony/pdf存档/截图源文件/tony ../tony/pdf存档/文本 chi_sim+eng")
+    if len(args) < 2:
+        print("用法: python3 images_to_text_cli.py <输入目录> <输出目录> [语言] [并行数] [--backend 后端] [--preprocess 预处理]"
+              " [--skip-blank] [--dedupe] [--pages 页码范围] [--shard i/N]")
+        print("例如: python3 images_to_text_cli.py ../tony/pdf存档/截图源文件/tony ../tony/pdf存档/文本 chi_sim+eng 4")
         print("\n可用的语言选项:")
         print("- chi_sim+eng: 简体中文+英文（默认）")
         print("- chi_sim: 仅简体中文")
         print("- eng: 仅英文")
         print("- chi_tra+eng: 繁体中文+英文")
         print("- chi_tra: 仅繁体中文")
+        print("\n并行数默认为CPU核心数，设为1则逐张识别")
+        print("\n可用的OCR后端:")
+        print("- pytesseract: 每页启动一次tesseract进程（默认）")
+        print("- tesserocr: 进程内常驻引擎，语言模型只加载一次（需要 pip install tesserocr）")
+        print("- batch: tesseract列表文件模式，一个进程识别一批图片")
+        print("\n预处理（默认不处理）:")
+        print("- none / gray / binary / full，或逗号分隔的步骤 gray,threshold,deskew,crop")
+        print("\n预筛（默认不启用）:")
+        print("- --skip-blank: 空白页不识别，文本为空")
+        print("- --dedupe: 与前面某页几乎相同的重复页沿用那一页的文本")
+        print("\n多台机器分担（默认处理全部页）:")
+        print("- --pages 1-20,35,50-: 只处理这些页")
+        print("- --shard i/N: 只处理N个分片中的第i个，各分片的输出用 tony-ocr merge 合并")
         sys.exit(1)
     
-    input_dir = sys.argv[1]
-    output_dir = sys.argv[2]
-    lang = sys.argv[3] if len(sys.argv) > 3 else 'chi_sim+eng'
+    input_dir = args[0]
+    output_dir = args[1]
+    lang = args[2] if len(args) > 2 else 'chi_sim+eng'
+    workers = int(args[3]) if len(args) > 3 else default_ocr_workers()
     
     if not os.path.exists(input_dir):
         print(f"错误: 输入目录不存在: {input_dir}")
         sys.exit(1)
     
-    process_images_in_directory(input_dir, output_dir, lang)
+    process_images_in_directory(input_dir, output_dir, lang, workers, skip_blank=skip_blank, dedupe=dedupe,
+                                pages=pages, shard=shard)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
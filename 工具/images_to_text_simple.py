@@ -34,7 +34,7 @@ def main():
     # 获取所有图片文件
     image_files = []
     for file in os.listdir(input_dir):
-        if file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff')):
+        if file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif', '.webp')):
             image_files.append(file)
     
     if not image_files:
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+版面区域检测
+功能：找出页面中的文本块，只把这些区域裁剪下来交给tesseract，页边、装饰线和大块图片不再参与识别，
+      各区域按单一文本块识别（--psm 6），省去tesseract的整页版面分析，同一页的各区域还可以并行识别
+做法：
+    渲染出的图像：二值化后做投影分析（递归XY切分）。先找贯穿整个区域的竖向空白（分栏），
+                  没有再找横向空白（段落、标题、页眉页脚之间的间隔），直到不能再切分；
+                  切分顺序就是阅读顺序：从上到下，分栏时先左栏后右栏
+    PyMuPDF块几何：页面有足够的文字层（只是被忽略或是乱码）时，直接用文字块和图片块的位置，更准确
+不适合的页面（没有找到区域、区域过多、只有一个几乎占满整页的区域）返回None，由调用方整页识别
+"""
+
+from PIL import Image
+
+from page_triage import paper_level
+
+# 投影分析时把页面缩小到约这个宽度（像素）
+WORK_WIDTH = 800
+# 比纸色暗多少（0-255）的像素算墨迹
+INK_CONTRAST = 64
+# 投影中墨迹不超过该值（0-255，即约0.5%的像素）的行或列算空白，容许零星噪点
+EMPTY_PROFILE = 1
+# 切分需要的最小空白，占页面高度或宽度的比例：横向约为两倍行距，竖向约为常见的栏间距
+MIN_ROW_GAP = 0.012
+MIN_COLUMN_GAP = 0.025
+# 小于该尺寸（占页面高度或宽度的比例）的区域是分隔线、污点，丢弃
+MIN_REGION_HEIGHT = 0.006
+MIN_REGION_WIDTH = 0.004
+# 墨迹密度超过该值的区域是照片或色块，不识别
+MAX_INK_DENSITY = 0.7
+# 裁剪时四周多留的边距，占页面宽度的比例，tesseract在文字贴边时容易漏字
+REGION_PADDING = 0.008
+# 区域太多时每个区域启动一次tesseract的开销超过节省的时间，改为整页识别
+MAX_REGIONS = 24
+# 只有一个区域且面积超过页面的这个比例时，裁剪没有意义
+MAX_SINGLE_REGION_AREA = 0.85
+
+def find_text_regions(img):
+    """
+    用投影分析找出图像中的文本区域
+
+    参数:
+        img: 页面图像（PIL）
+
+    返回:
+        按阅读顺序排列的区域列表 [(left, top, right, bottom), ...]，像素坐标已加边距；
+        不适合分区域识别时返回None
+    """
+    gray = img.convert("L")
+    factor = max(1, gray.width // WORK_WIDTH)
+    if factor > 1:
+        gray = gray.reduce(factor)
+    threshold = paper_level(gray.histogram()) - INK_CONTRAST
+    if threshold <= 0:
+        return None
+    # 墨迹为255，纸为0，缩放后的平均值即墨迹比例
+    ink = gray.point(lambda value: 255 if value < threshold else 0)
+
+    width, height = ink.size
+    limits = {
+        'row_gap': max(2, round(height * MIN_ROW_GAP)),
+        'column_gap': max(2, round(width * MIN_COLUMN_GAP)),
+        'min_height': max(2, round(height * MIN_REGION_HEIGHT)),
+        'min_width': max(2, round(width * MIN_REGION_WIDTH)),
+    }
+    leaves = []
+    _xy_cut(ink, (0, 0, width, height), limits, leaves)
+    if len(leaves) > MAX_REGIONS:
+        return None
+
+    regions = [box for box in leaves if _ink_density(ink, box) <= MAX_INK_DENSITY]
+    if not regions:
+        return None
+    if len(regions) == 1:
+        left, top, right, bottom = regions[0]
+        if (right - left) * (bottom - top) > MAX_SINGLE_REGION_AREA * width * height:
+            return None
+
+    padding = max(8, round(img.width * REGION_PADDING))
+    return [(max(0, left * factor - padding), max(0, top * factor - padding),
+             min(img.width, right * factor + padding), min(img.height, bottom * factor + padding))
+            for left, top, right, bottom in regions]
+
+def _xy_cut(ink, box, limits, leaves):
+    """递归切分，叶子区域按阅读顺序追加到leaves"""
+    bbox = ink.crop(box).getbbox()
+    if bbox is None:
+        return
+    left, top = box[0] + bbox[0], box[1] + bbox[1]
+    box = (left, top, box[0] + bbox[2], box[1] + bbox[3])
+    region = ink.crop(box)
+    width, height = region.size
+
+    # 先按栏切分，保证分栏的页面先读完左栏；每次只在最宽的空白处一分为二再递归，
+    # 否则两栏中碰巧对齐的段落间隔会把两栏横着切开，阅读顺序变成左上、右上、左下、右下
+    gap = _widest_gap(list(region.resize((width, 1), Image.BOX).getdata()), limits['column_gap'])
+    if gap:
+        _xy_cut(ink, (left, top, left + gap[0], box[3]), limits, leaves)
+        _xy_cut(ink, (left + gap[1], top, box[2], box[3]), limits, leaves)
+        return
+    gap = _widest_gap(list(region.resize((1, height), Image.BOX).getdata()), limits['row_gap'])
+    if gap:
+        _xy_cut(ink, (left, top, box[2], top + gap[0]), limits, leaves)
+        _xy_cut(ink, (left, top + gap[1], box[2], box[3]), limits, leaves)
+        return
+
+    if height >= limits['min_height'] and width >= limits['min_width']:
+        leaves.append(box)
+
+def _widest_gap(profile, min_gap):
+    """
+    找出投影中最宽的空白（两端的空白已被裁掉）
+
+    返回:
+        (空白起点, 空白终点)，没有不短于min_gap的空白时返回None；宽度相同时取靠前的
+    """
+    best = None
+    start = None
+    for position, value in enumerate(profile):
+        if value <= EMPTY_PROFILE:
+            if start is None:
+                start = position
+        elif start is not None:
+            if position - start >= min_gap and (best is None or position - start > best[1] - best[0]):
+                best = (start, position)
+            start = None
+    return best
+
+def _ink_density(ink, box):
+    histogram = ink.crop(box).histogram()
+    return histogram[255] / max(1, sum(histogram))
+
+def page_block_regions(page, dpi, min_chars):
+    """
+    用PyMuPDF的块几何得到区域，适用于有文字层但文字层被忽略或是乱码的页面
+
+    参数:
+        page: PyMuPDF页面
+        dpi: 页面图像的分辨率
+        min_chars: 文字层至少有多少个字符才认为块几何可信
+
+    返回:
+        按阅读顺序排列的区域列表（像素坐标），块几何不可用时返回None，例如整页扫描、旋转页面、文字层太少
+    """
+    if page.rotation:
+        return None
+    rect = page.rect
+    page_area = rect.width * rect.height
+    blocks = page.get_text("blocks")
+    if sum(len(block[4].strip()) for block in blocks if block[6] == 0) < min_chars:
+        return None
+    scale = dpi / 72
+    width, height = round(rect.width * scale), round(rect.height * scale)
+    boxes = []
+    for x0, y0, x1, y1, _, _, kind in blocks:
+        x0, y0, x1, y1 = max(x0, rect.x0), max(y0, rect.y0), min(x1, rect.x1), min(y1, rect.y1)
+        if x1 <= x0 or y1 <= y0:
+            continue
+        # 占据大半页的图片说明是扫描页，块几何不能反映图片中的文字
+        if kind == 1 and (x1 - x0) * (y1 - y0) > 0.5 * page_area:
+            return None
+        boxes.append((round((x0 - rect.x0) * scale), round((y0 - rect.y0) * scale),
+                      round((x1 - rect.x0) * scale), round((y1 - rect.y0) * scale)))
+    # 先在加边距前排好阅读顺序，边距会填满较窄的栏间距
+    boxes = _reading_order(boxes, max(2, round(width * MIN_COLUMN_GAP)))
+    padding = max(8, round(width * REGION_PADDING))
+    regions = _merge_overlapping([(max(0, left - padding), max(0, top - padding),
+                                   min(width, right + padding), min(height, bottom + padding))
+                                  for left, top, right, bottom in boxes])
+    if not regions or len(regions) > MAX_REGIONS:
+        return None
+    return regions
+
+def _reading_order(boxes, column_gap):
+    """
+    按与 find_text_regions 相同的规则排列区域：先找把区域分成左右两组、不窄于column_gap的竖向空白，
+    没有再找上下的横向空白，都在最宽处一分为二后递归；PyMuPDF按坐标排序时分栏页面的两栏会交错
+    """
+    if len(boxes) <= 1:
+        return list(boxes)
+    for axis, min_gap in ((0, column_gap), (1, 1)):
+        gap = _widest_box_gap(boxes, axis, min_gap)
+        if gap is not None:
+            return (_reading_order([box for box in boxes if box[axis + 2] <= gap], column_gap) +
+                    _reading_order([box for box in boxes if box[axis + 2] > gap], column_gap))
+    return sorted(boxes, key=lambda box: (box[1], box[0]))
+
+def _widest_box_gap(boxes, axis, min_gap):
+    """区域在某一方向上的投影之间最宽空白的起点，没有不窄于min_gap的空白时返回None"""
+    spans = sorted((box[axis], box[axis + 2]) for box in boxes)
+    best = None
+    end = spans[0][1]
+    for start, stop in spans[1:]:
+        if start - end >= min_gap and (best is None or start - end > best[1] - best[0]):
+            best = (end, start)
+        end = max(end, stop)
+    return best[0] if best else None
+
+def _merge_overlapping(regions):
+    """加边距后相互重叠的区域合并为一个，避免同一段文字被识别两次；合并后的区域占据较早那个的位置"""
+    merged = list(regions)
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(i + 1, len(merged)):
+                a, b = merged[i], merged[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    merged[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    del merged[j]
+                    changed = True
+                    break
+            if changed:
+                break
+    return merged
+
+def region_area_ratio(regions, width, height):
+    """区域面积之和占整页的比例（重叠部分重复计算）"""
+    return sum((right - left) * (bottom - top) for left, top, right, bottom in regions) / max(1, width * height)
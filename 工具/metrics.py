@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+运行指标
+功能：记录各阶段的单页耗时、队列深度和缓存命中等计数，交给可插拔的输出端
+阶段名称：
+    load        载入PDF页面
+    text_layer  提取文字层
+    render      渲染页面
+    encode      编码PNG
+    write       写出图片
+    checksum    计算图片校验和
+    triage      OCR前的空白页和重复页预筛（见 page_triage.py）
+    layout      版面分析，找出页面中的文本区域（见 layout_regions.py）
+    ocr         识别文字
+    text_write  写出文本
+输出端：
+    JsonlSink        每个事件写一行JSON
+    PrometheusSink   Prometheus textfile格式，可交给 node_exporter 的 textfile collector
+    SummarySink      运行结束时打印各阶段耗时汇总表
+默认不启用任何输出端，只在内存中汇总；命令行工具通过 --metrics-jsonl、--metrics-prom、--metrics-summary 启用
+汇总中的页数、总耗时和最大值是精确的，P50/P95按每个阶段最近 DURATION_WINDOW 个样本计算，
+watch 这样常驻运行的进程内存占用不随处理的页数增长
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import collections
+from contextlib import contextmanager
+
+# 每个阶段保留的最近耗时样本数，用于计算百分位数
+DURATION_WINDOW = 10000
+
+def percentile(values, q):
+    """线性插值的百分位数，q取0-100"""
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+class Metrics:
+    """线程安全的指标汇总，每个事件同时转发给各输出端"""
+
+    def __init__(self, sinks=()):
+        self.sinks = list(sinks)
+        # 输出端在锁内收到事件，PrometheusSink 还会在锁内读取汇总，因此使用可重入锁
+        self._lock = threading.RLock()
+        # {阶段: 最近的耗时样本}，只用于百分位数
+        self.durations = {}
+        # {阶段: [页数, 总耗时, 最大值]}，累计全部样本
+        self.totals = {}
+        self.counters = {}
+        # {名称: (当前值, 最大值)}
+        self.gauges = {}
+
+    def add_sink(self, sink):
+        with self._lock:
+            self.sinks.append(sink)
+
+    def remove_sink(self, sink):
+        """移除输出端，不调用其close；输出端不存在时忽略"""
+        with self._lock:
+            if sink in self.sinks:
+                self.sinks.remove(sink)
+
+    def _emit(self, event):
+        for sink in self.sinks:
+            sink.event(event)
+
+    def observe(self, stage, seconds, page=None):
+        """记录某阶段处理一页的耗时（秒），page从0开始"""
+        with self._lock:
+            if stage not in self.durations:
+                self.durations[stage] = collections.deque(maxlen=DURATION_WINDOW)
+                self.totals[stage] = [0, 0.0, seconds]
+            self.durations[stage].append(seconds)
+            totals = self.totals[stage]
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+            if self.sinks:
+                self._emit({"type": "timing", "stage": stage, "page": page, "seconds": seconds})
+
+    @contextmanager
+    def timer(self, stage, page=None):
+        """计时上下文：with metrics.timer("render", page_num): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, page)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            if self.sinks:
+                self._emit({"type": "count", "name": name, "value": value})
+
+    def gauge(self, name, value):
+        """记录队列深度等瞬时值，汇总时保留最大值"""
+        with self._lock:
+            peak = max(value, self.gauges.get(name, (0, value))[1])
+            self.gauges[name] = (value, peak)
+            if self.sinks:
+                self._emit({"type": "gauge", "name": name, "value": value})
+
+    def stage_summary(self):
+        """
+        各阶段耗时汇总
+
+        返回:
+            列表，每项为 {'stage', 'pages', 'total', 'mean', 'p50', 'p95', 'max'}，时间单位为秒；
+            p50、p95 按最近 DURATION_WINDOW 个样本计算，其余各项累计全部样本
+        """
+        with self._lock:
+            durations = {stage: (list(values), tuple(self.totals[stage])) for stage, values in self.durations.items()}
+        rows = []
+        for stage, (values, (pages, total, longest)) in durations.items():
+            rows.append({
+                'stage': stage,
+                'pages': pages,
+                'total': total,
+                'mean': total / pages,
+                'p50': percentile(values, 50),
+                'p95': percentile(values, 95),
+                'max': longest,
+            })
+        return rows
+
+    def close(self):
+        """结束本次运行，让各输出端写出汇总"""
+        with self._lock:
+            sinks, self.sinks = self.sinks, []
+        for sink in sinks:
+            sink.close(self)
+
+class JsonlSink:
+    """每个事件写一行JSON，附带时间戳和进程号，便于事后分析"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+        self._pid = os.getpid()
+
+    def event(self, event):
+        event = dict(event, ts=round(time.time(), 6), pid=self._pid)
+        self._file.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    def close(self, metrics):
+        self._file.close()
+
+class PrometheusSink:
+    """
+    Prometheus textfile格式的汇总
+
+    运行期间每隔 interval 秒、结束时再写一次；先写临时文件再替换，采集方不会读到半个文件
+    """
+
+    def __init__(self, path, interval=10.0):
+        self.path = path
+        self.interval = interval
+        self._last_write = 0.0
+        self._metrics = None
+
+    def event(self, event):
+        now = time.monotonic()
+        if self._metrics is not None and now - self._last_write >= self.interval:
+            self._last_write = now
+            self.write(self._metrics)
+
+    def bind(self, metrics):
+        self._metrics = metrics
+
+    def close(self, metrics):
+        self.write(metrics)
+
+    def write(self, metrics):
+        lines = [
+            "# HELP tony_ocr_stage_seconds 各阶段单页耗时（秒）",
+            "# TYPE tony_ocr_stage_seconds summary",
+        ]
+        for row in metrics.stage_summary():
+            label = f'stage="{row["stage"]}"'
+            lines.append(f'tony_ocr_stage_seconds{{{label},quantile="0.5"}} {row["p50"]:.6f}')
+            lines.append(f'tony_ocr_stage_seconds{{{label},quantile="0.95"}} {row["p95"]:.6f}')
+            lines.append(f'tony_ocr_stage_seconds_sum{{{label}}} {row["total"]:.6f}')
+            lines.append(f'tony_ocr_stage_seconds_count{{{label}}} {row["pages"]}')
+        lines += ["# HELP tony_ocr_events_total 事件计数", "# TYPE tony_ocr_events_total counter"]
+        for name, value in sorted(dict(metrics.counters).items()):
+            lines.append(f'tony_ocr_events_total{{name="{name}"}} {value}')
+        lines += ["# HELP tony_ocr_queue_depth_max 队列深度的最大值", "# TYPE tony_ocr_queue_depth_max gauge"]
+        for name, (_, peak) in sorted(dict(metrics.gauges).items()):
+            lines.append(f'tony_ocr_queue_depth_max{{queue="{name}"}} {peak}')
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.path)
+
+class SummarySink:
+    """
+    运行结束时打印各阶段耗时汇总表，总耗时占比最高的阶段就是瓶颈
+
+    多线程并行时各阶段耗时会重叠，占比表示各阶段累计工作量的比例，而不是墙钟时间的比例
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def event(self, event):
+        pass
+
+    def close(self, metrics):
+        stream = self.stream or sys.stdout
+        rows = metrics.stage_summary()
+        if not rows:
+            return
+        grand_total = sum(row['total'] for row in rows) or 1.0
+        print(f"\n{'阶段':<12}{'页数':>6}{'总耗时(秒)':>12}{'占比':>8}{'平均(ms)':>10}"
+              f"{'P50(ms)':>10}{'P95(ms)':>10}{'最大(ms)':>10}", file=stream)
+        for row in sorted(rows, key=lambda r: r['total'], reverse=True):
+            print(f"{row['stage']:<12}{row['pages']:>6}{row['total']:>12.2f}{row['total'] / grand_total:>8.0%}"
+                  f"{row['mean'] * 1000:>10.1f}{row['p50'] * 1000:>10.1f}{row['p95'] * 1000:>10.1f}"
+                  f"{row['max'] * 1000:>10.1f}", file=stream)
+        for name, value in sorted(metrics.counters.items()):
+            print(f"计数 {name}: {value}", file=stream)
+        for name, (_, peak) in sorted(metrics.gauges.items()):
+            print(f"队列 {name}: 最大深度 {peak}", file=stream)
+
+_metrics = Metrics()
+
+def get_metrics():
+    """本进程共用的指标对象"""
+    return _metrics
+
+def configure_metrics(jsonl_path=None, prom_path=None, summary=False):
+    """
+    为本进程的指标对象添加输出端
+
+    参数:
+        jsonl_path: JSONL事件日志路径，追加写入
+        prom_path: Prometheus textfile路径
+        summary: 结束时是否打印汇总表
+    """
+    if jsonl_path:
+        _metrics.add_sink(JsonlSink(jsonl_path))
+    if prom_path:
+        sink = PrometheusSink(prom_path)
+        sink.bind(_metrics)
+        _metrics.add_sink(sink)
+    if summary:
+        _metrics.add_sink(SummarySink())
+
+def close_metrics():
+    """写出各输出端的汇总"""
+    _metrics.close()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+OCR存档
+功能：把一本书的识别结果保存为单个文件，代替上百个单页文本文件加一个重复全部内容的合并文本
+      存档中每页保存文本、单词位置和置信度、页面来源信息，末尾的偏移索引可以直接定位任意一页
+      需要原来的文件布局时，用 export_legacy 重新生成单页文本和 _完整文本.txt
+文件结构：
+    文件头  b"TONYOCR\x01"
+    页记录  每条为 4字节长度（大端）+ zlib压缩的JSON
+    索引    zlib压缩的JSON：{"meta": {...}, "pages": [[页码, 偏移, 长度], ...]}
+    文件尾  8字节索引偏移 + 4字节索引长度 + b"TONYIDX\x01"
+写到一半中断的存档没有索引，读取时顺序扫描页记录恢复
+使用方法：python3 tony_ocr.py export <存档> <输出目录> [--page 页码]
+"""
+
+import os
+import json
+import zlib
+import struct
+
+from text_output import CombinedTextWriter
+
+ARCHIVE_SUFFIX = ".tocr"
+
+_MAGIC = b"TONYOCR\x01"
+_FOOTER_MAGIC = b"TONYIDX\x01"
+_FOOTER = struct.Struct(">QI8s")
+_LENGTH = struct.Struct(">I")
+
+# 单词按列表保存，比逐个保存字段名的字典小得多
+WORD_FIELDS = ('text', 'conf', 'left', 'top', 'width', 'height', 'block', 'par', 'line')
+
+def _pack(obj):
+    return zlib.compress(json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+def _unpack(data):
+    return json.loads(zlib.decompress(data).decode('utf-8'))
+
+class OcrArchiveWriter:
+    """
+    边识别边追加写入存档，close时写出索引
+
+    参数:
+        path: 存档路径
+        meta: 整本书的信息，例如 {"name": 书名, "source": 源文件, "lang": 语言}
+    """
+
+    def __init__(self, path, meta=None):
+        self.path = path
+        self.meta = dict(meta or {})
+        self._index = {}
+        self._file = open(path, 'wb')
+        self._file.write(_MAGIC)
+
+    def add(self, page, name, text, words=None, info=None):
+        """
+        写入一页
+
+        参数:
+            page: 页码（从1开始），也是合并文本分隔行中的页码
+            name: 导出单页文本时的文件名（不含 .txt）
+            text: 页面文本
+            words: image_to_data 格式的单词列表，坐标为按 info["dpi"] 渲染的像素；没有时为None
+            info: 页面来源信息
+        """
+        record = {"page": page, "name": name, "text": text, "info": info,
+                  "words": [[word[field] for field in WORD_FIELDS] for word in words] if words else None}
+        data = _pack(record)
+        offset = self._file.tell()
+        self._file.write(_LENGTH.pack(len(data)) + data)
+        self._index[page] = (offset, len(data) + _LENGTH.size)
+        # 每页写完立即落盘，中途崩溃时已完成的页可以扫描恢复
+        self._file.flush()
+
+    def close(self):
+        if self._file.closed:
+            return
+        pages = [[page, offset, length] for page, (offset, length) in sorted(self._index.items())]
+        index = _pack({"meta": self.meta, "pages": pages})
+        offset = self._file.tell()
+        self._file.write(index)
+        self._file.write(_FOOTER.pack(offset, len(index), _FOOTER_MAGIC))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class OcrArchive:
+    """
+    读取存档：打开时只读索引，按页码随机读取单页
+
+    参数:
+        path: 存档路径
+
+    属性:
+        meta: 整本书的信息
+        complete: 存档是否正常写完；为False时索引由顺序扫描恢复，meta为空
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        if self._file.read(len(_MAGIC)) != _MAGIC:
+            self._file.close()
+            raise ValueError(f"不是OCR存档: {path}")
+        self.meta = {}
+        self.complete = self._read_index()
+        if not self.complete:
+            self._scan()
+
+    def _read_index(self):
+        size = os.fstat(self._file.fileno()).st_size
+        if size < len(_MAGIC) + _FOOTER.size:
+            return False
+        self._file.seek(size - _FOOTER.size)
+        offset, length, magic = _FOOTER.unpack(self._file.read(_FOOTER.size))
+        if magic != _FOOTER_MAGIC:
+            return False
+        self._file.seek(offset)
+        index = _unpack(self._file.read(length))
+        self.meta = index["meta"]
+        self._index = {page: (offset, length) for page, offset, length in index["pages"]}
+        return True
+
+    def _scan(self):
+        """没有索引时逐条读取页记录重建索引，遇到不完整的记录为止"""
+        self._index = {}
+        offset = len(_MAGIC)
+        self._file.seek(offset)
+        while True:
+            header = self._file.read(_LENGTH.size)
+            if len(header) < _LENGTH.size:
+                break
+            length, = _LENGTH.unpack(header)
+            data = self._file.read(length)
+            try:
+                record = _unpack(data)
+            except (zlib.error, ValueError):
+                break
+            self._index[record["page"]] = (offset, length + _LENGTH.size)
+            offset += length + _LENGTH.size
+
+    @property
+    def pages(self):
+        """存档中的页码，升序"""
+        return sorted(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def read_page(self, page):
+        """
+        读取一页
+
+        返回:
+            {'page', 'name', 'text', 'words', 'info'}，words为单词字典列表或None；页码不存在时抛出KeyError
+        """
+        offset, length = self._index[page]
+        self._file.seek(offset + _LENGTH.size)
+        record = _unpack(self._file.read(length - _LENGTH.size))
+        if record["words"] is not None:
+            record["words"] = [dict(zip(WORD_FIELDS, word)) for word in record["words"]]
+        return record
+
+    def text(self, page):
+        return self.read_page(page)["text"]
+
+    def iter_pages(self):
+        """按页码顺序逐页读取"""
+        for page in self.pages:
+            yield self.read_page(page)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def export_legacy(archive_path, output_dir):
+    """
+    从存档重新生成原来的文件布局：单页文本、_完整文本.txt 和 _页面来源.json
+
+    参数:
+        archive_path: 存档路径
+        output_dir: 输出目录
+
+    返回:
+        (是否成功, 提示信息)
+    """
+    try:
+        archive = OcrArchive(archive_path)
+    except (OSError, ValueError) as e:
+        return False, f"无法打开存档: {e}"
+
+    os.makedirs(output_dir, exist_ok=True)
+    name = archive.meta.get("name") or os.path.splitext(os.path.basename(archive_path))[0]
+    page_sources = {}
+    with archive, CombinedTextWriter(os.path.join(output_dir, f"{name}_完整文本.txt")) as combined:
+        for index, record in enumerate(archive.iter_pages()):
+            combined.add(index, record["page"], record["text"])
+            with open(os.path.join(output_dir, f"{record['name']}.txt"), 'w', encoding='utf-8') as f:
+                f.write(record["text"])
+            if record["info"] is not None:
+                page_sources[str(record["page"])] = record["info"]
+        page_count = len(archive)
+        complete = archive.complete
+
+    if page_sources:
+        with open(os.path.join(output_dir, f"{name}_页面来源.json"), 'w', encoding='utf-8') as f:
+            json.dump(page_sources, f, ensure_ascii=False, indent=2)
+
+    message = f"已导出 {page_count} 页到 '{output_dir}'"
+    if not complete:
+        message += "（存档没有正常写完，只导出了已完成的页）"
+    return True, message
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+异步OCR驱动
+功能：用asyncio子进程直接运行tesseract，信号量限制同时运行的进程数，每页有超时，
+      卡住的页到时被结束并记为出错，不会拖住整本书；取消时结束所有子进程
+结果由异步迭代器按页码顺序交出，提前提交的页数有上限，内存占用不随页数增长
+同步代码（命令行、图形界面的后台线程）通过 AsyncOCRRunner 使用，其他线程可随时调用 cancel()
+"""
+
+import os
+import time
+import signal
+import asyncio
+import weakref
+import tempfile
+
+from tesseract_path import find_tesseract
+from ocr_cache import get_ocr_cache, image_digest
+from ocr_backends import resolve_preprocess, cache_config_key, prepare_image
+from ocr_parallel import default_ocr_workers, limit_tesseract_threads
+from metrics import get_metrics
+from ocr_defaults import DEFAULT_PAGE_TIMEOUT
+# 缓存键中的后端名称，与 ocr_backends 中各后端的结果分开缓存
+BACKEND_NAME = 'async'
+
+async def run_tesseract(image_path, lang, config='', timeout=None):
+    """
+    在子进程中运行tesseract识别一张图片
+
+    超时或被取消时结束子进程并等待其退出，不会留下孤儿进程；
+    在类Unix系统上tesseract运行在单独的进程组中，通过包装脚本启动时连同脚本的子进程一起结束
+
+    返回:
+        识别文本（以分页符结尾，与 pytesseract 一致）
+    """
+    command = [find_tesseract(), image_path, 'stdout', '-l', lang]
+    if config:
+        command += config.split()
+    own_group = hasattr(os, 'killpg')
+    process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE,
+                                                   stderr=asyncio.subprocess.PIPE, start_new_session=own_group)
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except BaseException:
+        _kill(process, own_group)
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        raise RuntimeError(stderr.decode('utf-8', errors='replace').strip())
+    return stdout.decode('utf-8')
+
+def _kill(process, own_group):
+    if own_group:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+    elif process.returncode is None:
+        process.kill()
+
+class AsyncOCRDriver:
+    """
+    异步识别一组图片文件
+
+    参数:
+        lang: OCR语言
+        concurrency: 同时运行的tesseract进程数，None表示CPU核心数
+        timeout: 单页超时（秒），None表示不限制
+        config: 传给tesseract的额外参数
+        preprocess: 预处理步骤，None表示使用 image_preprocess 的默认设置
+    """
+
+    def __init__(self, lang='chi_sim+eng', concurrency=None, timeout=DEFAULT_PAGE_TIMEOUT, config='',
+                 preprocess=None):
+        self.lang = lang
+        self.concurrency = max(1, concurrency or default_ocr_workers())
+        self.timeout = timeout
+        self.config = config
+        self.preprocess = preprocess
+        # 信号量属于创建它的事件循环，AsyncOCRRunner 每次调用 results() 都新建事件循环，因此每个循环各用一个
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        return semaphore
+
+    def _steps(self):
+        return resolve_preprocess(self.preprocess)
+
+    async def recognize(self, image_path):
+        """
+        识别一张图片，先查OCR缓存；超时和识别错误记为出错文本，取消则向上传递
+
+        返回:
+            识别文本
+        """
+        steps = self._steps()
+        cache = get_ocr_cache()
+        key = None
+        if cache:
+            # 计算文件哈希要读整张图片，放到线程中进行，不阻塞事件循环
+            key = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: cache.make_key(image_digest(image_path), self.lang,
+                                             cache_config_key(self.config, steps), BACKEND_NAME))
+            text = cache.get(key)
+            if text is not None:
+                return text
+
+        async with self._semaphore():
+            start = time.perf_counter()
+            try:
+                text = await self._run(image_path, steps)
+            except asyncio.TimeoutError:
+                return f"处理图片时出错: 识别超过 {self.timeout} 秒，已终止"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                return f"处理图片时出错: {e}"
+            get_metrics().observe("ocr", time.perf_counter() - start)
+        if cache:
+            cache.put(key, text)
+        return text
+
+    async def _run(self, image_path, steps):
+        if not steps:
+            return await run_tesseract(image_path, self.lang, self.config, self.timeout)
+        # 预处理在线程中进行，结果存为临时文件交给tesseract
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            prepared_path = os.path.join(tmp_dir, "page.png")
+            await asyncio.get_running_loop().run_in_executor(
+                None, lambda: prepare_image(image_path, steps).save(prepared_path))
+            return await run_tesseract(prepared_path, self.lang, self.config, self.timeout)
+
+    async def iter_results(self, image_paths):
+        """
+        异步迭代器，按输入顺序产生 (序号, 识别文本)
+
+        最多提前提交并行数两倍的页；迭代器关闭或被取消时取消所有未完成的页并结束其子进程
+        """
+        metrics = get_metrics()
+        max_ahead = self.concurrency * 2
+        pending = {}
+        next_submit = 0
+        try:
+            for i in range(len(image_paths)):
+                while next_submit < len(image_paths) and len(pending) < max_ahead:
+                    pending[next_submit] = asyncio.ensure_future(self.recognize(image_paths[next_submit]))
+                    next_submit += 1
+                metrics.gauge("ocr_in_flight", len(pending))
+                text = await pending.pop(i)
+                yield i, text
+        finally:
+            for task in pending.values():
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending.values(), return_exceptions=True)
+
+class AsyncOCRRunner:
+    """
+    在调用线程中运行事件循环，把 AsyncOCRDriver 包装为普通生成器
+
+    cancel() 可以在任何线程调用：正在运行的tesseract进程立即被结束，results() 随即停止产生结果
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.cancelled = False
+        self._loop = None
+        self._current = None
+
+    def results(self, image_paths):
+        """
+        按输入顺序产生 (序号, 识别文本)，与 ocr_images_in_order 的用法相同
+
+        被取消时提前结束，调用方通过 cancelled 属性区分
+        """
+        loop = asyncio.new_event_loop()
+        iterator = self.driver.iter_results(image_paths)
+
+        async def next_result():
+            return await iterator.__anext__()
+
+        self._loop = loop
+        limit_tesseract_threads(self.driver.concurrency)
+        try:
+            while not self.cancelled:
+                self._current = loop.create_task(next_result())
+                try:
+                    result = loop.run_until_complete(self._current)
+                except (StopAsyncIteration, asyncio.CancelledError):
+                    return
+                yield result
+        finally:
+            # Ctrl+C 或取消时当前等待的任务可能还没结束，先取消它，迭代器随之清理未完成的页
+            if self._current is not None and not self._current.done():
+                self._current.cancel()
+                loop.run_until_complete(asyncio.gather(self._current, return_exceptions=True))
+            loop.run_until_complete(iterator.aclose())
+            self._loop = None
+            loop.close()
+
+    def cancel(self):
+        """取消识别，可在其他线程调用"""
+        self.cancelled = True
+        loop, current = self._loop, self._current
+        if loop is None or current is None:
+            return
+        try:
+            loop.call_soon_threadsafe(current.cancel)
+        except RuntimeError:
+            # 事件循环已经关闭，识别已经结束
+            pass
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+OCR后端
+功能：为 extract_text_from_image 提供可替换的识别后端
+    pytesseract  每页启动一次tesseract进程（原有方式，默认）
+    tesserocr    通过tesseract C API在进程内识别，每个工作线程只加载一次语言模型（需要 pip install tesserocr）
+    batch        使用tesseract的列表文件模式，一次进程识别多张图片，语言模型每批只加载一次
+可通过环境变量 TONY_OCR_BACKEND 或各工具的 --backend 参数选择
+"""
+
+import os
+import json
+import subprocess
+import tempfile
+import threading
+
+from ocr_cache import cached_ocr, image_digest, pixels_digest, get_ocr_cache
+from tesseract_path import find_tesseract, import_pytesseract
+from ocr_defaults import DEFAULT_BACKEND
+
+# tesseract每页文本末尾的分页符，各后端统一保留，保证结果格式一致
+PAGE_SEPARATOR = '\f'
+
+_backend_lock = threading.Lock()
+_backends = {}
+_default_backend_name = None
+
+class PytesseractBackend:
+    """每张图片调用一次 pytesseract.image_to_string，即每页启动一个tesseract进程"""
+
+    name = 'pytesseract'
+    batch_size = 1
+
+    def image_to_string(self, image, lang, config=''):
+        pytesseract = import_pytesseract()
+        from PIL import Image
+        if isinstance(image, str):
+            image = Image.open(image)
+        return pytesseract.image_to_string(image, lang=lang, config=config)
+
+    def images_to_strings(self, images, lang, config=''):
+        return [self.image_to_string(image, lang, config) for image in images]
+
+    def image_to_data(self, image, lang, config=''):
+        pytesseract = import_pytesseract()
+        from PIL import Image
+        if isinstance(image, str):
+            image = Image.open(image)
+        data = pytesseract.image_to_data(image, lang=lang, config=config, output_type=pytesseract.Output.DICT)
+        words = []
+        for i, text in enumerate(data['text']):
+            conf = float(data['conf'][i])
+            # conf为-1的是页、块、行等结构记录，不是单词
+            if conf < 0 or not text.strip():
+                continue
+            words.append({
+                'text': text, 'conf': conf,
+                'left': data['left'][i], 'top': data['top'][i],
+                'width': data['width'][i], 'height': data['height'][i],
+                'block': data['block_num'][i], 'par': data['par_num'][i], 'line': data['line_num'][i],
+            })
+        return words
+
+class TesserocrBackend:
+    """
+    常驻的tesseract引擎：每个线程为每种语言创建一个 PyTessBaseAPI 并反复使用
+
+    tesserocr识别时会释放GIL，多个线程可以同时识别
+    """
+
+    name = 'tesserocr'
+    batch_size = 1
+
+    def __init__(self):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self._local = threading.local()
+
+    def _get_api(self, lang):
+        apis = getattr(self._local, 'apis', None)
+        if apis is None:
+            apis = self._local.apis = {}
+        if lang not in apis:
+            kwargs = {'lang': lang}
+            if 'TESSDATA_PREFIX' in os.environ:
+                kwargs['path'] = os.environ['TESSDATA_PREFIX']
+            apis[lang] = self._tesserocr.PyTessBaseAPI(**kwargs)
+        return apis[lang]
+
+    def _set_image(self, image, lang, config):
+        api = self._get_api(lang)
+        # 只支持 --psm 参数，其余tesseract命令行参数在C API中没有对应
+        options = config.split()
+        psm = int(options[options.index('--psm') + 1]) if '--psm' in options else self._tesserocr.PSM.AUTO
+        api.SetPageSegMode(psm)
+        if isinstance(image, str):
+            api.SetImageFile(image)
+        else:
+            api.SetImage(image)
+        return api
+
+    def image_to_string(self, image, lang, config=''):
+        api = self._set_image(image, lang, config)
+        return api.GetUTF8Text() + PAGE_SEPARATOR
+
+    def images_to_strings(self, images, lang, config=''):
+        return [self.image_to_string(image, lang, config) for image in images]
+
+    def image_to_data(self, image, lang, config=''):
+        api = self._set_image(image, lang, config)
+        api.Recognize()
+        RIL = self._tesserocr.RIL
+        words = []
+        block = par = line = 0
+        iterator = api.GetIterator()
+        if iterator is None:
+            return words
+        for word in self._tesserocr.iterate_level(iterator, RIL.WORD):
+            if word.IsAtBeginningOf(RIL.BLOCK):
+                block, par, line = block + 1, 0, 0
+            if word.IsAtBeginningOf(RIL.PARA):
+                par, line = par + 1, 0
+            if word.IsAtBeginningOf(RIL.TEXTLINE):
+                line += 1
+            text = word.GetUTF8Text(RIL.WORD)
+            box = word.BoundingBox(RIL.WORD)
+            if not text or not text.strip() or box is None:
+                continue
+            left, top, right, bottom = box
+            words.append({
+                'text': text, 'conf': float(word.Confidence(RIL.WORD)),
+                'left': left, 'top': top, 'width': right - left, 'height': bottom - top,
+                'block': block, 'par': par, 'line': line,
+            })
+        return words
+
+class BatchBackend:
+    """
+    tesseract列表文件模式：把多张图片路径写进一个 .txt 列表文件，一次进程识别全部
+
+    输出中每页以分页符结尾，按分页符切分即可得到逐页文本
+    """
+
+    name = 'batch'
+
+    def __init__(self, batch_size=8):
+        self.batch_size = batch_size
+
+    def image_to_string(self, image, lang, config=''):
+        return self.images_to_strings([image], lang, config)[0]
+
+    def images_to_strings(self, images, lang, config=''):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = []
+            for i, image in enumerate(images):
+                if isinstance(image, str):
+                    paths.append(os.path.abspath(image))
+                else:
+                    path = os.path.join(tmp_dir, f"page_{i}.png")
+                    image.save(path)
+                    paths.append(path)
+
+            list_path = os.path.join(tmp_dir, "images.txt")
+            with open(list_path, 'w', encoding='utf-8') as f:
+                f.write("\n".join(paths) + "\n")
+
+            command = [find_tesseract(), list_path, 'stdout', '-l', lang]
+            if config:
+                command += config.split()
+            result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.decode('utf-8', errors='replace').strip())
+
+        pages = result.stdout.decode('utf-8').split(PAGE_SEPARATOR)
+        if len(pages) < len(images):
+            raise RuntimeError(f"tesseract只返回了 {len(pages)} 页结果，应为 {len(images)} 页")
+        return [page + PAGE_SEPARATOR for page in pages[:len(images)]]
+
+    def image_to_data(self, image, lang, config=''):
+        # 列表文件模式只输出纯文本，单词位置和置信度仍按单张调用获取
+        return PytesseractBackend().image_to_data(image, lang, config)
+
+BACKEND_CLASSES = {
+    'pytesseract': PytesseractBackend,
+    'tesserocr': TesserocrBackend,
+    'batch': BatchBackend,
+}
+
+def _is_cjk(char):
+    return '\u3000' <= char <= '\u9fff' or '\uf900' <= char <= '\ufaff' or '\uff00' <= char <= '\uffef'
+
+def words_to_text(words):
+    """
+    把 image_to_data 的单词还原为文本：同一行的单词用空格连接（相邻的中文之间不加空格），
+    行之间换行，段落和块之间空一行
+    """
+    parts = []
+    previous = None
+    for word in words:
+        if previous is None:
+            pass
+        elif (word['block'], word['par']) != (previous['block'], previous['par']):
+            parts.append("\n\n")
+        elif word['line'] != previous['line']:
+            parts.append("\n")
+        elif not (_is_cjk(previous['text'][-1]) and _is_cjk(word['text'][0])):
+            parts.append(" ")
+        parts.append(word['text'])
+        previous = word
+    return "".join(parts) + ("\n" if parts else "") + PAGE_SEPARATOR
+
+def group_blocks(words):
+    """
+    按tesseract的文本块分组
+
+    返回:
+        列表，每项为 {'block', 'bbox': (left, top, right, bottom), 'conf': 平均置信度, 'words': [...]}
+    """
+    blocks = {}
+    for word in words:
+        blocks.setdefault(word['block'], []).append(word)
+    result = []
+    for block, block_words in blocks.items():
+        result.append({
+            'block': block,
+            'bbox': (min(w['left'] for w in block_words), min(w['top'] for w in block_words),
+                     max(w['left'] + w['width'] for w in block_words),
+                     max(w['top'] + w['height'] for w in block_words)),
+            'conf': sum(w['conf'] for w in block_words) / len(block_words),
+            'words': block_words,
+        })
+    return result
+
+def set_ocr_backend(name):
+    """设置本进程默认使用的后端"""
+    global _default_backend_name
+    if name not in BACKEND_CLASSES:
+        raise ValueError(f"未知的OCR后端: {name}，可选: {', '.join(BACKEND_CLASSES)}")
+    _default_backend_name = name
+
+def default_backend_name():
+    """当前默认后端的名称"""
+    return _default_backend_name or os.environ.get('TONY_OCR_BACKEND', DEFAULT_BACKEND)
+
+def get_ocr_backend(name=None):
+    """
+    获取OCR后端实例，同名后端在进程内只创建一次
+
+    参数:
+        name: 后端名称，None时依次使用 set_ocr_backend 的设置、环境变量 TONY_OCR_BACKEND、默认值
+    """
+    if name is None:
+        name = default_backend_name()
+    if name not in BACKEND_CLASSES:
+        raise ValueError(f"未知的OCR后端: {name}，可选: {', '.join(BACKEND_CLASSES)}")
+    with _backend_lock:
+        if name not in _backends:
+            try:
+                _backends[name] = BACKEND_CLASSES[name]()
+            except ImportError as e:
+                raise RuntimeError(f"OCR后端 {name} 不可用: {e}") from e
+        return _backends[name]
+
+def cache_config_key(config, steps):
+    """
+    缓存键中的配置部分：预处理步骤不同，识别结果也不同
+
+    自己调用tesseract的驱动（如 ocr_async）用它与 OCRCache.make_key 组成缓存键，与本模块的识别函数共用缓存
+
+    参数:
+        config: 传给tesseract的配置参数
+        steps: resolve_preprocess 返回的预处理步骤
+    """
+    if not steps:
+        return config
+    return f"{config}|preprocess={','.join(steps)}"
+
+def resolve_preprocess(preprocess):
+    """
+    确定实际使用的预处理步骤
+
+    参数:
+        preprocess: 预处理步骤，None时使用 image_preprocess 的默认设置（--preprocess 或环境变量）
+
+    返回:
+        预处理步骤序列，空表示不做预处理
+    """
+    if preprocess is not None:
+        return preprocess
+    from image_preprocess import get_default_preprocess
+    return get_default_preprocess()
+
+def prepare_image(image, steps):
+    """
+    按预处理步骤处理图像
+
+    参数:
+        image: 图片文件路径或PIL图像
+        steps: resolve_preprocess 返回的预处理步骤
+
+    返回:
+        预处理后的PIL图像；不需要预处理时原样返回 image，文件路径可以直接交给后端
+    """
+    if not steps:
+        return image
+    from PIL import Image
+    from image_preprocess import preprocess_image
+    if isinstance(image, str):
+        image = Image.open(image)
+    return preprocess_image(image, steps)
+
+def recognize_file(image_path, lang, config='', preprocess=None):
+    """
+    识别单个图片文件，先查OCR缓存
+
+    参数:
+        preprocess: 预处理步骤，None表示使用 image_preprocess 的默认设置
+    """
+    backend = get_ocr_backend()
+    steps = resolve_preprocess(preprocess)
+    return cached_ocr(image_digest(image_path), lang,
+                      lambda: backend.image_to_string(prepare_image(image_path, steps), lang, config),
+                      cache_config_key(config, steps), backend.name)
+
+def recognize_image(img, lang, config='', preprocess=None):
+    """识别内存中的PIL图像，先查OCR缓存"""
+    backend = get_ocr_backend()
+    steps = resolve_preprocess(preprocess)
+    return cached_ocr(pixels_digest(img), lang,
+                      lambda: backend.image_to_string(prepare_image(img, steps), lang, config),
+                      cache_config_key(config, steps), backend.name)
+
+def recognize_image_data(img, lang, config='', preprocess=None):
+    """
+    识别内存中的PIL图像，返回带位置和置信度的单词列表（见 image_to_data），先查OCR缓存
+
+    预处理会裁边时单词坐标不再对应原图，因此这里只做不改变几何的灰度和二值化步骤
+    """
+    backend = get_ocr_backend()
+    steps = tuple(step for step in resolve_preprocess(preprocess) if step in ('gray', 'threshold'))
+    data = cached_ocr(pixels_digest(img), lang,
+                      lambda: json.dumps(backend.image_to_data(prepare_image(img, steps), lang, config),
+                                         ensure_ascii=False),
+                      cache_config_key(config, steps) + "|data", backend.name)
+    return json.loads(data)
+
+def recognize_files(image_paths, lang, config='', preprocess=None):
+    """
+    识别一组图片文件，缓存未命中的图片交给后端一次性识别
+
+    返回:
+        与 image_paths 顺序一致的文本列表
+    """
+    backend = get_ocr_backend()
+    cache = get_ocr_cache()
+    steps = resolve_preprocess(preprocess)
+    cache_config = cache_config_key(config, steps)
+    texts = [None] * len(image_paths)
+    keys = [None] * len(image_paths)
+
+    missing = []
+    for i, image_path in enumerate(image_paths):
+        if cache:
+            keys[i] = cache.make_key(image_digest(image_path), lang, cache_config, backend.name)
+            texts[i] = cache.get(keys[i])
+        if texts[i] is None:
+            missing.append(i)
+
+    if missing:
+        images = [prepare_image(image_paths[i], steps) for i in missing]
+        results = backend.images_to_strings(images, lang, config)
+        for i, text in zip(missing, results):
+            texts[i] = text
+            if cache:
+                cache.put(keys[i], text)
+    return texts
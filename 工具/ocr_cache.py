@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+OCR结果缓存
+功能：按 图片内容哈希 + 语言 + tesseract版本 + OCR后端 + 配置 缓存识别结果，重复识别未改动的图片时直接返回
+缓存保存在SQLite数据库中，超过容量上限时按最近最少使用（LRU）淘汰；
+总大小记在单行的 cache_meta 表中随写入更新，写入时不需要统计整张表
+默认位置：~/.cache/tony_ocr/ocr_cache.sqlite3，可用环境变量修改：
+    TONY_OCR_CACHE_DIR  缓存目录
+    TONY_OCR_CACHE_MB   容量上限（MB），默认512
+    TONY_OCR_CACHE=off  关闭缓存
+"""
+
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+
+from tesseract_path import tesseract_version
+from metrics import get_metrics
+
+DEFAULT_MAX_MB = 512
+
+_default_cache = None
+# 默认缓存打开失败后本进程不再尝试，也不再重复警告；只影响本进程，不修改环境变量
+_default_cache_failed = False
+_default_cache_lock = threading.Lock()
+
+def image_digest(image_path):
+    """计算图片文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def pixels_digest(img):
+    """计算内存中PIL图像像素的SHA-256，用于不落盘的图像"""
+    digest = hashlib.sha256(f"{img.mode}:{img.size}".encode('utf-8'))
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+class OCRCache:
+    """基于SQLite的OCR结果缓存，可在多个线程间共享"""
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        if cache_dir is None:
+            cache_dir = os.environ.get('TONY_OCR_CACHE_DIR',
+                                       os.path.join(os.path.expanduser('~'), '.cache', 'tony_ocr'))
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get('TONY_OCR_CACHE_MB', DEFAULT_MAX_MB)) * 1024 * 1024)
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.path = os.path.join(cache_dir, 'ocr_cache.sqlite3')
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS ocr_results ("
+                " key TEXT PRIMARY KEY,"
+                " text TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON ocr_results(last_used)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_meta ("
+                " id INTEGER PRIMARY KEY CHECK (id = 0),"
+                " total_size INTEGER NOT NULL)"
+            )
+            # 旧版本的缓存没有总大小记录，只在这里统计一次
+            self._conn.execute(
+                "INSERT OR IGNORE INTO cache_meta (id, total_size)"
+                " SELECT 0, COALESCE(SUM(size), 0) FROM ocr_results")
+
+    def make_key(self, digest, lang, config='', backend=''):
+        """
+        由图片哈希、语言、tesseract版本、OCR后端和配置组成缓存键
+
+        不同后端（命令行tesseract、常驻引擎、列表文件模式）的识别结果可能不同，互不共用
+        """
+        return "|".join([digest, lang, tesseract_version(), backend, config])
+
+    def get(self, key):
+        """查询缓存，命中时返回文本并更新使用时间，未命中返回None"""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT text FROM ocr_results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                get_metrics().count("ocr_cache_miss")
+                return None
+            self._conn.execute("UPDATE ocr_results SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            get_metrics().count("ocr_cache_hit")
+            return row[0]
+
+    def put(self, key, text):
+        """写入识别结果，超出容量时淘汰最久未使用的记录"""
+        size = len(key) + len(text.encode('utf-8'))
+        with self._lock, self._conn:
+            # 立即获取写锁：多个进程共用缓存时，读出旧记录大小和更新总大小之间不会插入别的写入
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute("SELECT size FROM ocr_results WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ocr_results (key, text, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, text, size, time.time()))
+            total = self._add_size(size - (row[0] if row else 0))
+            if total > self.max_bytes:
+                self._evict(total)
+
+    def _add_size(self, delta):
+        """更新并返回缓存总大小"""
+        self._conn.execute("UPDATE cache_meta SET total_size = total_size + ? WHERE id = 0", (delta,))
+        return self._conn.execute("SELECT total_size FROM cache_meta WHERE id = 0").fetchone()[0]
+
+    def _evict(self, total):
+        # 一次淘汰到容量的90%，避免之后每次写入都触发淘汰
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        rows = self._conn.execute("SELECT key, size FROM ocr_results ORDER BY last_used")
+        victims = []
+        for key, size in rows:
+            if freed >= target:
+                break
+            victims.append((key,))
+            freed += size
+        self._conn.executemany("DELETE FROM ocr_results WHERE key = ?", victims)
+        self._add_size(-freed)
+        self.evictions += len(victims)
+        if victims:
+            get_metrics().count("ocr_cache_eviction", len(victims))
+
+    def summary(self):
+        """命中统计的文字说明"""
+        return f"OCR缓存: 命中 {self.hits} 次，未命中 {self.misses} 次，淘汰 {self.evictions} 条"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def get_ocr_cache():
+    """获取进程内共享的默认缓存，设置 TONY_OCR_CACHE=off 或缓存无法打开时返回None"""
+    global _default_cache, _default_cache_failed
+    if _default_cache_failed or os.environ.get('TONY_OCR_CACHE', '').lower() in ('0', 'off', 'false', 'no'):
+        return None
+    with _default_cache_lock:
+        if _default_cache is None and not _default_cache_failed:
+            try:
+                _default_cache = OCRCache()
+            except (OSError, sqlite3.Error) as e:
+                print(f"警告: 无法打开OCR缓存，将不使用缓存: {e}")
+                _default_cache_failed = True
+        return _default_cache
+
+def cached_ocr(digest, lang, ocr_func, config='', backend=''):
+    """
+    先查缓存，未命中时调用 ocr_func() 识别并写入缓存
+
+    参数:
+        digest: 图片内容哈希
+        lang: OCR语言
+        ocr_func: 无参数的识别函数，返回文本；抛出异常时不写入缓存
+        config: tesseract配置参数
+        backend: OCR后端名称
+    """
+    cache = get_ocr_cache()
+    if cache is None:
+        return ocr_func()
+
+    key = cache.make_key(digest, lang, config, backend)
+    text = cache.get(key)
+    if text is None:
+        text = ocr_func()
+        cache.put(key, text)
+    return text
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+各工具共用的默认值和选项名称
+功能：tony_ocr 构建命令行参数时需要这些值，但 --help 和参数检查不能为此加载PyMuPDF、Pillow等依赖；
+      本模块不导入任何第三方库，定义选项的工具模块（pdf_to_text_pipeline、pdf_to_images、ocr_backends、
+      ocr_async）也从这里导入，命令行和实现只有一份定义
+      后端、图片预设和图片格式的实现是各模块中以名称为键的字典，tests/test_ocr_defaults.py 检查名称与键一致
+"""
+
+# 文字层至少要有这么多个非空白字符才直接采用
+DEFAULT_MIN_TEXT_CHARS = 50
+
+# 自适应DPI：先用低分辨率识别，置信度不足的部分再用高分辨率重新渲染
+DEFAULT_LOW_DPI = 150
+DEFAULT_MIN_CONFIDENCE = 70
+
+# 流水线的输出格式：单页文本加合并文本（原来的布局）、单文件存档，或两者都写
+OUTPUT_TEXT = "text"
+OUTPUT_ARCHIVE = "archive"
+OUTPUT_BOTH = "both"
+OUTPUT_FORMATS = (OUTPUT_TEXT, OUTPUT_ARCHIVE, OUTPUT_BOTH)
+
+# 异步OCR驱动单页识别的默认超时（秒）
+DEFAULT_PAGE_TIMEOUT = 300
+
+# OCR后端名称，与 ocr_backends.BACKEND_CLASSES 的键一致
+DEFAULT_BACKEND = 'pytesseract'
+BACKEND_NAMES = ('pytesseract', 'tesserocr', 'batch')
+
+# 渲染图片的颜色、格式和预设名称，与 pdf_to_images 中的 IMAGE_FORMATS、IMAGE_PRESETS 的键一致
+COLOR_MODES = ("rgb", "gray", "bw")
+IMAGE_FORMAT_NAMES = ("png", "webp", "tiff")
+IMAGE_PRESET_NAMES = ("original", "fast", "balanced", "small", "bw")
+DEFAULT_IMAGE_PRESET = "original"
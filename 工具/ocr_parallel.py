@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+并行OCR工具函数
+功能：用有界线程池同时运行多个tesseract进程，并按页码顺序返回识别结果
+供 images_to_text.py 和 images_to_text_cli.py 共用
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import get_metrics
+
+def default_ocr_workers():
+    """默认并行数：CPU核心数"""
+    return os.cpu_count() or 1
+
+def limit_tesseract_threads(workers):
+    """
+    并行运行时限制每个tesseract进程的OpenMP线程数
+
+    tesseract默认会用多个OpenMP线程识别一页，多个进程同时运行时会互相抢占CPU，
+    因此并行数大于1时把OMP_THREAD_LIMIT设为1；用户已自行设置时保持不变
+    设置后不再恢复：同一进程中可能同时运行多个任务（图形界面、收件箱监视、嵌套调用），
+    各自设置再恢复时，先结束的任务会把仍在运行的任务的设置一起去掉
+    """
+    if workers > 1:
+        os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+def ocr_images_in_order(extract_func, image_paths, lang, workers=1, batch_func=None, batch_size=1):
+    """
+    并行识别多张图片，按输入顺序逐个返回结果
+
+    pytesseract 每次调用都启动独立的tesseract进程，线程只负责等待子进程，
+    所以用线程池即可让多个进程同时运行。提交的任务数最多为并行数的两倍，
+    结果也按顺序逐个交出，内存占用不会随页数增长
+
+    参数:
+        extract_func: 识别单张图片的函数，签名为 extract_func(image_path, lang)
+        image_paths: 图片路径列表
+        lang: OCR语言
+        workers: 并行数，1表示在当前线程中逐张识别，None表示使用全部CPU核心
+        batch_func: 一次识别多张图片的函数，签名为 batch_func(image_paths, lang)，返回文本列表
+        batch_size: 每批图片数，大于1且提供了 batch_func 时按批识别
+
+    返回:
+        生成器，依次产生 (序号, 识别文本)
+    """
+    if workers is None:
+        workers = default_ocr_workers()
+
+    if batch_func is None or batch_size <= 1:
+        tasks = [(extract_func, [path], False) for path in image_paths]
+    else:
+        tasks = [(batch_func, image_paths[i:i + batch_size], True)
+                 for i in range(0, len(image_paths), batch_size)]
+    workers = max(1, min(workers, len(tasks)))
+
+    index = 0
+    if workers == 1:
+        for task in tasks:
+            for text in _run_task(*task, lang):
+                yield index, text
+                index += 1
+        return
+
+    metrics = get_metrics()
+    limit_tesseract_threads(workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        next_submit = 0
+        max_in_flight = workers * 2
+        for i in range(len(tasks)):
+            while next_submit < len(tasks) and len(pending) < max_in_flight:
+                pending[next_submit] = executor.submit(_run_task, *tasks[next_submit], lang)
+                next_submit += 1
+            metrics.gauge("ocr_in_flight", len(pending))
+            for text in pending.pop(i).result():
+                yield index, text
+                index += 1
+
+def _run_task(func, paths, is_batch, lang):
+    """执行一个识别任务，统一返回文本列表；批量识别的耗时平均分摊到每页记入指标"""
+    start = time.perf_counter()
+    if not is_batch:
+        texts = [func(paths[0], lang)]
+    else:
+        try:
+            texts = func(paths, lang)
+        except Exception as e:
+            texts = [f"处理图片时出错: {e}"] * len(paths)
+    seconds = (time.perf_counter() - start) / len(paths)
+    metrics = get_metrics()
+    for _ in paths:
+        metrics.observe("ocr", seconds)
+    return texts
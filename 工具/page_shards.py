@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+页码范围和分片
+功能：--pages 只处理指定的页码范围；--shard i/N 把页面分给N台机器中的第i台，
+      按页码取模分配：同一本书无论渲染还是识别，第i个分片分到的页总是相同，各机器之间不需要协调服务，
+      分到的页在全书中均匀分布，图片多、识别慢的章节不会集中在一台机器上
+      只处理部分页时，输出目录中写一个 <书名>_分片清单.json；merge 读取各分片的清单，
+      把单页文本合并为标准的单页文本和 _完整文本.txt，并检查没有缺页或重复页
+"""
+
+import os
+import json
+import shutil
+import collections
+
+from text_output import CombinedTextWriter
+
+SHARD_MANIFEST_SUFFIX = "_分片清单.json"
+
+def parse_page_ranges(spec):
+    """
+    解析页码范围
+
+    参数:
+        spec: 逗号分隔的页码或范围（页码从1开始），例如 "1-20,35,50-"；"50-" 表示第50页到最后
+
+    返回:
+        [(首页, 末页或None), ...]，格式不对时抛出ValueError
+    """
+    ranges = []
+    for part in spec.replace("，", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, dash, last = part.partition("-")
+        try:
+            first = int(first)
+            last = (int(last) if last.strip() else None) if dash else first
+        except ValueError:
+            raise ValueError(f"无法解析页码范围: {part}，格式如 1-20,35,50-")
+        if first < 1 or (last is not None and last < first):
+            raise ValueError(f"页码范围无效: {part}")
+        ranges.append((first, last))
+    if not ranges:
+        raise ValueError("页码范围为空")
+    return ranges
+
+def parse_shard(spec):
+    """
+    解析分片
+
+    参数:
+        spec: "i/N"，表示共N个分片中的第i个（从1开始）
+
+    返回:
+        (i, N)，格式不对时抛出ValueError
+    """
+    index, slash, count = spec.partition("/")
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise ValueError(f"无法解析分片: {spec}，格式如 2/4")
+    if not slash or count < 1 or not 1 <= index <= count:
+        raise ValueError(f"分片无效: {spec}，应为 i/N 且 1 <= i <= N")
+    return index, count
+
+def page_selected(number, ranges=None, shard=None):
+    """
+    判断页码是否被选中
+
+    参数:
+        number: 页码（从1开始）
+        ranges: parse_page_ranges 的返回值，None表示全部页
+        shard: parse_shard 的返回值，None表示不分片
+    """
+    if ranges is not None and not any(first <= number and (last is None or number <= last)
+                                      for first, last in ranges):
+        return False
+    if shard is not None and (number - 1) % shard[1] != shard[0] - 1:
+        return False
+    return True
+
+def select_pages(numbers, pages=None, shard=None):
+    """
+    从一组页中选出要处理的页
+
+    参数:
+        numbers: 各页的页码（从1开始）
+        pages: 页码范围字符串，None表示全部页
+        shard: 分片字符串 "i/N"，None表示不分片
+
+    返回:
+        被选中的页在numbers中的序号列表，参数格式不对时抛出ValueError
+    """
+    ranges = parse_page_ranges(pages) if pages else None
+    shard = parse_shard(shard) if shard else None
+    return [i for i, number in enumerate(numbers) if page_selected(number, ranges, shard)]
+
+def file_page_numbers(files, extract_page_number):
+    """
+    图片文件的页码，用于选页和分片清单
+
+    参数:
+        files: 按页码排好序的文件名
+        extract_page_number: 从文件名取页码的函数，没有页码时返回0
+
+    返回:
+        与files一一对应的页码列表。文件名中都有页码时用文件名中的页码，都没有时按排序后的位置编号；
+        只有部分文件有页码（位置编号会与真实页码相同）或页码重复时抛出ValueError
+    """
+    numbers = [extract_page_number(file) for file in files]
+    missing = [file for file, number in zip(files, numbers) if not number]
+    if len(missing) == len(files):
+        return list(range(1, len(files) + 1))
+    if missing:
+        raise ValueError(f"{len(missing)} 个文件名中没有页码（如 {missing[0]}），无法与其他页一起按页码选页或分片，"
+                         f"请把它们移出目录或按“第N页”重新命名")
+    _check_unique(numbers)
+    return numbers
+
+def _check_unique(numbers):
+    counts = collections.Counter(numbers)
+    duplicates = sorted(number for number, count in counts.items() if count > 1)
+    if duplicates:
+        raise ValueError(f"页码重复: {_page_list(duplicates)}，每个页码只能对应一个文件")
+
+def write_shard_manifest(output_dir, book_name, pages, shard, all_numbers, files, complete):
+    """
+    写出分片清单
+
+    参数:
+        pages: 页码范围字符串或None
+        shard: 分片字符串或None
+        all_numbers: 源目录或PDF中全部页的页码，merge 据此检查缺页
+        files: {页码: 单页文本文件名}，只包含本分片已完成的页
+        complete: 本分片是否全部完成，被取消时为False
+
+    返回:
+        清单文件路径；all_numbers中有重复页码时抛出ValueError，merge无法据此检查缺页和重复页
+    """
+    _check_unique(all_numbers)
+    manifest = {
+        "book": book_name,
+        "pages": pages,
+        "shard": shard,
+        "all_pages": sorted(all_numbers),
+        "files": {str(number): name for number, name in sorted(files.items())},
+        "complete": complete,
+    }
+    path = os.path.join(output_dir, f"{book_name}{SHARD_MANIFEST_SUFFIX}")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+def load_shard_manifest(shard_dir):
+    """
+    读取目录中的分片清单
+
+    返回:
+        清单字典，另加 'dir' 项；目录中没有或有多个清单、清单损坏时抛出ValueError
+    """
+    names = [name for name in os.listdir(shard_dir) if name.endswith(SHARD_MANIFEST_SUFFIX)]
+    if not names:
+        raise ValueError(f"'{shard_dir}' 中没有分片清单（*{SHARD_MANIFEST_SUFFIX}），该分片可能还没有完成")
+    if len(names) > 1:
+        raise ValueError(f"'{shard_dir}' 中有多本书的分片清单，请每本书使用单独的输出目录")
+    try:
+        with open(os.path.join(shard_dir, names[0]), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"无法读取分片清单 {names[0]}: {e}")
+    manifest["dir"] = shard_dir
+    return manifest
+
+def merge_shards(shard_dirs, output_dir, pages=None):
+    """
+    合并各分片的输出
+
+    参数:
+        shard_dirs: 各分片的输出目录
+        output_dir: 合并后的输出目录，也可以是其中一个分片的目录
+        pages: 只检查这个页码范围内的页是否齐全，None表示全书
+
+    返回:
+        (是否成功, 提示信息)；有缺页、重复页或分片没有完成时不写出任何文件
+
+    各分片应处理的页按其清单中记录的 pages 和 shard 重新计算：这些页合起来必须恰好覆盖要合并的页，
+    少了某个分片（如只给了 1/3 和 3/3）或同一范围给了两次都会报出具体页码，而不只是看已写出的文件
+    """
+    try:
+        manifests = [load_shard_manifest(shard_dir) for shard_dir in shard_dirs]
+        ranges = parse_page_ranges(pages) if pages else None
+    except ValueError as e:
+        return False, str(e)
+    if not manifests:
+        return False, "没有指定分片目录"
+
+    book_name = manifests[0]["book"]
+    all_pages = manifests[0]["all_pages"]
+    for manifest in manifests[1:]:
+        if manifest["book"] != book_name or manifest["all_pages"] != all_pages:
+            return False, (f"分片 '{manifest['dir']}' 与 '{manifests[0]['dir']}' 不是同一本书"
+                           f"或源页面不同（{manifest['book']} / {book_name}）")
+    incomplete = [manifest["dir"] for manifest in manifests if not manifest.get("complete")]
+    if incomplete:
+        return False, f"以下分片没有全部完成: {', '.join(incomplete)}"
+
+    # 各分片按清单中的选页和分片参数应处理的页
+    claimed = collections.Counter()
+    problems = []
+    for manifest in manifests:
+        try:
+            selection = set(_manifest_selection(manifest))
+        except ValueError as e:
+            return False, f"分片 '{manifest['dir']}' 的清单无效: {e}"
+        claimed.update(selection)
+        extra = sorted(int(number) for number in manifest["files"] if int(number) not in selection)
+        if extra:
+            problems.append(f"分片 '{manifest['dir']}' 的清单中有不属于该分片的页: {_page_list(extra)}")
+    expected = [number for number in all_pages if page_selected(number, ranges)]
+    uncovered = [number for number in expected if number not in claimed]
+    overlapping = [number for number in expected if claimed[number] > 1]
+    if uncovered:
+        hint = _missing_shards(manifests)
+        problems.append(f"没有分片负责的页 {len(uncovered)} 页: {_page_list(uncovered)}"
+                        + (f"（缺少分片 {hint}）" if hint else ""))
+    if overlapping:
+        problems.append(f"多个分片重复负责的页 {len(overlapping)} 页: {_page_list(overlapping)}")
+
+    # 页码 -> (分片目录, 文件名)
+    sources = {}
+    duplicates = []
+    for manifest in manifests:
+        for number, name in manifest["files"].items():
+            number = int(number)
+            if number in sources:
+                duplicates.append(number)
+                continue
+            sources[number] = (manifest["dir"], name)
+    # 负责范围的空缺和重叠已经在上面报出，这里只报分片负责但没有写出或写出两次的页
+    duplicates = sorted(set(number for number in duplicates if claimed[number] <= 1))
+    missing = [number for number in expected if number not in sources and number in claimed]
+    if duplicates:
+        problems.append(f"重复页 {len(duplicates)} 页: {_page_list(duplicates)}")
+    if missing:
+        problems.append(f"缺页 {len(missing)} 页: {_page_list(missing)}")
+    lost = [f"{directory}/{name}" for directory, name in sources.values()
+            if not os.path.isfile(os.path.join(directory, name))]
+    if lost:
+        problems.append(f"清单中的文本文件不存在: {', '.join(lost[:5])}{' 等' if len(lost) > 5 else ''}")
+    if problems:
+        return False, "无法合并，" + "；".join(problems)
+
+    os.makedirs(output_dir, exist_ok=True)
+    numbers = [number for number in sorted(sources) if page_selected(number, ranges)]
+    combined_path = os.path.join(output_dir, f"{book_name}_完整文本.txt")
+    with CombinedTextWriter(combined_path) as combined:
+        for index, number in enumerate(numbers):
+            directory, name = sources[number]
+            source_path = os.path.join(directory, name)
+            with open(source_path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            combined.add(index, number, text)
+            target_path = os.path.join(output_dir, name)
+            if os.path.abspath(source_path) != os.path.abspath(target_path):
+                shutil.copyfile(source_path, target_path)
+
+    return True, (f"已合并 {len(manifests)} 个分片，共 {len(numbers)} 页，没有缺页或重复页\n"
+                  f"已保存合并文本: {combined_path}")
+
+def _manifest_selection(manifest):
+    """分片清单中记录的选页和分片参数所选中的页码，参数格式不对时抛出ValueError"""
+    ranges = parse_page_ranges(manifest["pages"]) if manifest.get("pages") else None
+    shard = parse_shard(manifest["shard"]) if manifest.get("shard") else None
+    return [number for number in manifest["all_pages"] if page_selected(number, ranges, shard)]
+
+def _missing_shards(manifests):
+    """各清单都按同样的选页分成N片时，返回没有给出的分片，如 "2/3"；无法判断时返回空串"""
+    if not all(manifest.get("shard") for manifest in manifests):
+        return ""
+    shards = [parse_shard(manifest["shard"]) for manifest in manifests]
+    if len({(manifest.get("pages"), count) for manifest, (_, count) in zip(manifests, shards)}) != 1:
+        return ""
+    count = shards[0][1]
+    return ", ".join(f"{index}/{count}" for index in range(1, count + 1) if (index, count) not in shards)
+
+def _page_list(numbers, limit=20):
+    text = ", ".join(str(number) for number in numbers[:limit])
+    return text + (" 等" if len(numbers) > limit else "")
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+页面预筛
+功能：OCR之前快速检查每张图片，空白页不再识别，与前面某页几乎相同的重复页（重复的封面、版权页等）直接沿用那一页的文本
+做法：把图片缩小为每行 GRID_WIDTH 个格子的灰度网格（每格是原图一小块的平均亮度），
+      墨迹覆盖率 = 明显比纸色暗的格子所占比例；按格子平均而不是按像素计，灰尘和噪点不会被当成文字
+      感知哈希用16x16的差值哈希（dHash）找出候选的重复页，再逐格比较网格亮度确认，
+      同样版式但文字不同的两页哈希可能接近，逐格比较（整体平均差和局部最大差）会把它们区分开
+被跳过和沿用的页写入 <书名>_页面筛查.json，并列在运行结果中，便于核对
+"""
+
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import get_metrics
+
+# 网格宽度（格子数），300 DPI 的A4页面每格约20像素，一个汉字占几个格子
+GRID_WIDTH = 128
+# 测量前四边各裁掉的比例，避开扫描仪的黑边和阴影
+MARGIN = 0.04
+# 比纸色暗多少（0-255）的格子算有墨迹
+INK_CONTRAST = 32
+# 墨迹覆盖率低于该值的页视为空白页；128格宽的A4页约有两万多个格子，0.0002 约为4个格子
+DEFAULT_BLANK_THRESHOLD = 0.0002
+# dHash 位数为 HASH_SIZE 的平方
+HASH_SIZE = 16
+# 两页dHash的汉明距离不超过该值时才进一步比较网格
+DEFAULT_MAX_HASH_DISTANCE = 24
+# 有墨迹的格子亮度差的平均值（0-255）不超过该值才认为是重复页；
+# 同一页重新保存或轻微噪声约为1，只差一个字的标题页约为18，不同的正文页在40以上
+DEFAULT_MAX_GRID_DIFF = 8.0
+# 通过网格比较的候选页再用更细的网格确认：GRID_WIDTH 的格子与页码数字差不多大，只差页码的两页
+# 网格平均差只有1-2；细网格上任意3x3格子范围内亮度差的平均值不超过 DEFAULT_MAX_LOCAL_DIFF 才认为是重复页，
+# 同一页重新保存或轻微重扫不超过10，只差一个页码数字的在90以上
+FINE_GRID_WIDTH = 512
+DEFAULT_MAX_LOCAL_DIFF = 32
+
+# 筛查结果
+OCR = "ocr"
+BLANK = "blank"
+DUPLICATE = "duplicate"
+
+def _content_gray(image):
+    """转为灰度并裁掉四边"""
+    gray = image.convert("L")
+    dx, dy = int(gray.width * MARGIN), int(gray.height * MARGIN)
+    if gray.width - 2 * dx > 0 and gray.height - 2 * dy > 0:
+        gray = gray.crop((dx, dy, gray.width - dx, gray.height - dy))
+    return gray
+
+def brightness_grid(gray, width=GRID_WIDTH):
+    """缩小为每行 width 格的灰度网格，每格为对应区域的平均亮度"""
+    from PIL import Image
+    height = max(1, round(width * gray.height / gray.width))
+    return gray.resize((width, height), Image.BOX)
+
+def _load_content_gray(image_path, width):
+    """读取图片，先用整数倍的按块平均缩小到不小于网格宽度的4倍，再转为灰度并裁掉四边"""
+    from PIL import Image
+    # 不用 Image.draft 在解码时缩小JPEG：DCT缩放的结果与按格平均相差较大，同一页的PNG和JPEG会被判为不同
+    with Image.open(image_path) as image:
+        factor = image.width // (width * 4)
+        if factor > 1 and image.mode in ("L", "RGB", "RGBA", "LA"):
+            image = image.reduce(factor)
+        return _content_gray(image)
+
+def paper_level(histogram):
+    """
+    由灰度直方图估计纸色：最亮的5%像素的亮度，扫描件纸色发灰或发黄时也适用
+
+    参数:
+        histogram: 灰度图像的 histogram()，256项
+    """
+    total = sum(histogram)
+    count = 0
+    for level in range(255, -1, -1):
+        count += histogram[level]
+        if count >= total * 0.05:
+            return level
+    return 255
+
+def ink_coverage(grid):
+    """墨迹覆盖率：比纸色暗 INK_CONTRAST 以上的格子所占比例"""
+    histogram = grid.histogram()
+    paper = paper_level(histogram)
+    ink = sum(histogram[:max(0, paper - INK_CONTRAST)])
+    return ink / (grid.width * grid.height)
+
+def dhash(gray):
+    """差值哈希：缩小为 (HASH_SIZE+1)xHASH_SIZE，比较左右相邻像素的亮度，返回整数"""
+    from PIL import Image
+    small = gray.resize((HASH_SIZE + 1, HASH_SIZE), Image.BOX)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def analyze_image(image_path):
+    """
+    测量一张图片
+
+    返回:
+        {'coverage': 墨迹覆盖率, 'hash': dHash, 'grid': 灰度网格（PIL图像）}
+    """
+    # 后面的灰度转换和缩放都在缩小后的图上进行
+    gray = _load_content_gray(image_path, GRID_WIDTH)
+    grid = brightness_grid(gray)
+    return {'coverage': ink_coverage(grid), 'hash': dhash(gray), 'grid': grid}
+
+def _normalize_pair(a, b):
+    """各自拉伸对比度，形状不同时把b缩放到a的大小"""
+    from PIL import Image, ImageOps
+    a = ImageOps.autocontrast(a, cutoff=1)
+    b = ImageOps.autocontrast(b, cutoff=1)
+    if a.size != b.size:
+        b = b.resize(a.size, Image.BOX)
+    return a, b
+
+def grid_difference(a, b):
+    """
+    两个网格的差异：先各自拉伸对比度，再对任一页有墨迹的格子求亮度差的平均值
+
+    只看有墨迹的格子，否则大片空白会把差异平均掉，"第一章"和"第二章"这样的标题页会被当成重复页；
+    拉伸对比度后，重新扫描造成的整体明暗变化不影响结果。形状不同时先把b缩放到a的大小
+    """
+    from PIL import ImageChops, ImageStat
+    a, b = _normalize_pair(a, b)
+    ink = ImageChops.darker(a, b).point(lambda value: 255 if value < 255 - INK_CONTRAST else 0)
+    if not ImageStat.Stat(ink).sum[0]:
+        return 0.0
+    return ImageStat.Stat(ImageChops.difference(a, b), ink).mean[0]
+
+def fine_grid(image_path):
+    """每行 FINE_GRID_WIDTH 格的细网格，只在确认候选重复页时读取，不随 analyze_image 保存在内存中"""
+    return brightness_grid(_load_content_gray(image_path, FINE_GRID_WIDTH), FINE_GRID_WIDTH)
+
+def local_difference(a, b):
+    """两个网格差异最大的局部：拉伸对比度后，任意3x3格子范围内亮度差平均值的最大值"""
+    from PIL import ImageChops, ImageFilter
+    a, b = _normalize_pair(a, b)
+    return ImageChops.difference(a, b).filter(ImageFilter.BoxBlur(1)).getextrema()[1]
+
+def triage_pages(image_paths, workers=1, blank_threshold=DEFAULT_BLANK_THRESHOLD, dedupe=True,
+                 max_hash_distance=DEFAULT_MAX_HASH_DISTANCE, max_grid_diff=DEFAULT_MAX_GRID_DIFF,
+                 max_local_diff=DEFAULT_MAX_LOCAL_DIFF):
+    """
+    预筛一组图片
+
+    参数:
+        image_paths: 图片路径列表，按页码顺序
+        workers: 并行读取图片的线程数，None表示CPU核心数
+        blank_threshold: 空白页的墨迹覆盖率阈值，None表示不检测空白页
+        dedupe: 是否检测重复页
+        max_hash_distance: 候选重复页的最大dHash汉明距离
+        max_grid_diff: 确认重复页的最大网格平均亮度差
+        max_local_diff: 确认重复页的细网格最大局部亮度差，见 local_difference
+
+    返回:
+        与 image_paths 一一对应的列表，每项为字典：
+        {'kind': OCR/BLANK/DUPLICATE, 'coverage': 墨迹覆盖率, 'source': 重复页沿用的页序号, 'diff': 网格亮度差}
+        无法读取的图片一律标为 OCR，交给识别阶段报错
+    """
+    metrics = get_metrics()
+
+    def measure(index):
+        start = time.perf_counter()
+        try:
+            return analyze_image(image_paths[index])
+        except Exception:
+            return None
+        finally:
+            metrics.observe("triage", time.perf_counter() - start, index)
+
+    # 解码图片和缩放时Pillow会释放GIL，线程即可并行
+    workers = max(1, min(workers or os.cpu_count() or 1, len(image_paths) or 1))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        measurements = list(executor.map(measure, range(len(image_paths))))
+
+    decisions = []
+    originals = []
+    for index, measurement in enumerate(measurements):
+        decision = {'kind': OCR, 'coverage': None, 'source': None, 'diff': None}
+        decisions.append(decision)
+        if measurement is None:
+            continue
+        decision['coverage'] = measurement['coverage']
+        if blank_threshold is not None and measurement['coverage'] < blank_threshold:
+            decision['kind'] = BLANK
+            continue
+        if dedupe:
+            match = _find_duplicate(index, originals, measurements, image_paths, max_hash_distance,
+                                    max_grid_diff, max_local_diff)
+            if match:
+                decision['kind'] = DUPLICATE
+                decision['source'], decision['diff'] = match
+                continue
+        originals.append(index)
+    metrics.count("pages_blank", sum(1 for d in decisions if d['kind'] == BLANK))
+    metrics.count("pages_duplicate", sum(1 for d in decisions if d['kind'] == DUPLICATE))
+    return decisions
+
+def _find_duplicate(index, originals, measurements, image_paths, max_hash_distance, max_grid_diff, max_local_diff):
+    """在已确定需要识别的页中找最相似的重复页，返回 (页序号, 网格亮度差) 或None"""
+    measurement = measurements[index]
+    candidates = []
+    for original in originals:
+        other = measurements[original]
+        if bin(measurement['hash'] ^ other['hash']).count('1') > max_hash_distance:
+            continue
+        diff = grid_difference(measurement['grid'], other['grid'])
+        if diff <= max_grid_diff:
+            candidates.append((diff, original))
+    if not candidates:
+        return None
+
+    # 候选页很少，逐个读取细网格确认，只差页码这样的小块不同在粗网格上会被摊薄
+    try:
+        grid = fine_grid(image_paths[index])
+        for diff, original in sorted(candidates):
+            if local_difference(grid, fine_grid(image_paths[original])) <= max_local_diff:
+                return original, diff
+    except Exception:
+        pass
+    return None
+
+def merge_triaged(decisions, results):
+    """
+    把只包含需识别页的结果还原为全部页
+
+    参数:
+        decisions: triage_pages 的返回值
+        results: 依次产生 (序号, 文本) 的识别结果，只包含kind为OCR的页
+
+    返回:
+        生成器，按页序号依次产生 (页序号, 文本)；空白页的文本为空，重复页沿用原页的文本；
+        识别结果提前结束（被取消）时随之结束
+    """
+    needed = {decision['source'] for decision in decisions if decision['kind'] == DUPLICATE}
+    texts = {}
+    iterator = iter(results)
+    try:
+        for index, decision in enumerate(decisions):
+            if decision['kind'] == OCR:
+                try:
+                    _, text = next(iterator)
+                except StopIteration:
+                    # 识别被取消，提前结束
+                    return
+                if index in needed:
+                    texts[index] = text
+            elif decision['kind'] == BLANK:
+                text = ""
+            else:
+                text = texts[decision['source']]
+            yield index, text
+    finally:
+        # 本生成器被提前关闭时一并关闭识别结果，让线程池或异步驱动停止提交新页
+        if hasattr(iterator, 'close'):
+            iterator.close()
+
+def ocr_indices(decisions):
+    """需要识别的页序号"""
+    return [index for index, decision in enumerate(decisions) if decision['kind'] == OCR]
+
+def write_triage_report(output_dir, book_name, names, decisions):
+    """
+    把被跳过和沿用的页写入 <书名>_页面筛查.json，并返回运行结果中显示的摘要
+
+    参数:
+        names: 各页的图片文件名
+
+    返回:
+        摘要文字；没有跳过任何页时返回空字符串
+    """
+    blank = [names[i] for i, d in enumerate(decisions) if d['kind'] == BLANK]
+    duplicates = [(names[i], names[d['source']]) for i, d in enumerate(decisions) if d['kind'] == DUPLICATE]
+    report_path = os.path.join(output_dir, f"{book_name}_页面筛查.json")
+    if not blank and not duplicates:
+        # 上次运行留下的报告已经不对应当前结果
+        if os.path.exists(report_path):
+            os.remove(report_path)
+        return ""
+
+    report = {
+        "blank": [{"image": names[i], "coverage": round(d['coverage'], 6)}
+                  for i, d in enumerate(decisions) if d['kind'] == BLANK],
+        "duplicate": [{"image": names[i], "same_as": names[d['source']], "diff": round(d['diff'], 2)}
+                      for i, d in enumerate(decisions) if d['kind'] == DUPLICATE],
+    }
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    lines = []
+    if blank:
+        lines.append(f"跳过空白页 {len(blank)} 张: {_abbreviate(blank)}")
+    if duplicates:
+        pairs = [f"{name}→{source}" for name, source in duplicates]
+        lines.append(f"沿用重复页文本 {len(duplicates)} 张: {_abbreviate(pairs)}")
+    lines.append(f"详见 {report_path}")
+    return "\n".join(lines)
+
+def _abbreviate(items, limit=10):
+    if len(items) <= limit:
+        return ", ".join(items)
+    return ", ".join(items[:limit]) + " 等"
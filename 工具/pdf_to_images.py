@@ -8,15 +8,418 @@ PDF转图片工具
 """
 
 import os
+import io
 import sys
 import fitz  # PyMuPDF
-from PIL import Image
-import io
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
 import threading
+import multiprocessing
+import hashlib
+import json
+import time
+import zlib
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import get_metrics
+from progress_channel import JobCancelled, ProgressChannel
+from page_shards import select_pages
+from ocr_defaults import COLOR_MODES, DEFAULT_IMAGE_PRESET
+
+# 渲染清单文件名后缀，记录源文件哈希、渲染参数和每页图片的校验和，用于断点续传
+MANIFEST_SUFFIX = "_渲染清单.json"
+
+# 分条渲染：整页位图超过该内存预算（MB）时按横向条带逐条渲染，None表示总是整页渲染
+DEFAULT_TILE_BUDGET_MB = None
+
+# 输出图片格式及其扩展名，键与 ocr_defaults.IMAGE_FORMAT_NAMES 一致
+IMAGE_FORMATS = {"png": ".png", "webp": ".webp", "tiff": ".tif"}
+# 颜色（COLOR_MODES）：rgb 彩色；gray 直接以灰度渲染；bw 以灰度渲染后二值化为1位图像，
+# 二值化与OCR预处理的 binary 相同（自适应阈值，需要numpy），识别结果与对彩色图片做该预处理一致
+# 速度/体积预设。level：PNG为压缩级别0-9（None表示由PyMuPDF直接编码），WebP为无损压缩的method 0-6，
+# TIFF不使用（1位图像用CCITT G4压缩，其余用deflate）；键与 ocr_defaults.IMAGE_PRESET_NAMES 一致
+# 注释中为 tony.pdf（98页，300 DPI）的实测总体积和单页平均编码耗时，实际数值随页面内容变化
+IMAGE_PRESETS = {
+    # 与以前相同的彩色PNG（62MB，200ms）
+    "original": {"format": "png", "color": "rgb", "level": None},
+    # 灰度PNG低压缩级别，写得最快（49MB，105ms）
+    "fast": {"format": "png", "color": "gray", "level": 1},
+    # 灰度PNG默认压缩级别（42MB，200ms）
+    "balanced": {"format": "png", "color": "gray", "level": 6},
+    # 灰度无损WebP，编码较慢（23MB，640ms）
+    "small": {"format": "webp", "color": "gray", "level": 4},
+    # 1位TIFF G4，只适合文字页，照片会变成黑白点阵（5.4MB，含二值化400ms）
+    "bw": {"format": "tiff", "color": "bw", "level": None},
+}
+# level为None时Pillow使用的值
+_DEFAULT_LEVELS = {"png": 6, "webp": 4}
+_LEVEL_RANGES = {"png": (0, 9), "webp": (0, 6)}
+
+# 并行渲染时每个工作进程各自持有的PDF文档
+_worker_document = None
+_worker_options = None
+
+def _init_render_worker(pdf_path, options):
+    """工作进程初始化：每个进程单独打开一次PDF，避免在进程间传递文档对象"""
+    global _worker_document, _worker_options
+    _worker_document = fitz.open(pdf_path)
+    _worker_options = options
+
+def _render_page_in_worker(page_num):
+    """在工作进程中渲染单页，返回 (页码, 图片文件名, 校验和, 各步骤耗时)"""
+    output_dir, pdf_name, dpi, tile_budget_mb, image_options = _worker_options
+    return _render_and_checksum(_worker_document, page_num, output_dir, pdf_name, dpi, tile_budget_mb,
+                                image_options)
+
+def _render_and_checksum(pdf_document, page_num, output_dir, pdf_name, dpi, tile_budget_mb=None,
+                         image_options=None):
+    """
+    渲染单页、编码写出并计算输出文件的校验和
+
+    各步骤耗时随结果一起返回，由主进程统一记录指标（工作进程中的指标对象主进程看不到）
+    """
+    rendered = _render_page_image(pdf_document, page_num, output_dir, pdf_name, dpi, tile_budget_mb,
+                                  image_options)
+    return _save_and_checksum(output_dir, rendered, image_options)
+
+def _render_page_image(pdf_document, page_num, output_dir, pdf_name, dpi, tile_budget_mb, image_options):
+    """
+    载入并渲染单页；超过内存预算的页面在这里分条渲染并直接写出文件
+
+    返回:
+        (页码, 图片文件名, pix, 各步骤耗时)，已经写出文件时pix为None
+    """
+    image_options = image_options or IMAGE_PRESETS[DEFAULT_IMAGE_PRESET]
+    start = time.perf_counter()
+    page = pdf_document.load_page(page_num)
+    timings = {"load": time.perf_counter() - start}
+    img_name = page_image_name(pdf_name, page_num, IMAGE_FORMATS[image_options["format"]])
+    if needs_tiling(page, dpi, tile_budget_mb):
+        timings.update(render_page_to_strips_file(page, os.path.join(output_dir, img_name), dpi, tile_budget_mb,
+                                                  image_options))
+        return page_num, img_name, None, timings
+    start = time.perf_counter()
+    pix = render_pixmap(page, dpi, image_options)
+    timings["render"] = time.perf_counter() - start
+    return page_num, img_name, pix, timings
+
+def _save_and_checksum(output_dir, rendered, image_options):
+    """
+    编码写出 _render_page_image 渲染的页面并计算校验和，可以在渲染线程以外的线程中运行
+
+    返回:
+        (页码, 图片文件名, 校验和, 各步骤耗时)
+    """
+    page_num, img_name, pix, timings = rendered
+    img_path = os.path.join(output_dir, img_name)
+    if pix is not None:
+        timings.update(save_pixmap(pix, img_path, image_options))
+    start = time.perf_counter()
+    checksum = file_sha256(img_path)
+    timings["checksum"] = time.perf_counter() - start
+    return page_num, img_name, checksum, timings
+
+def page_image_name(pdf_name, page_num, extension=".png"):
+    """页面图片文件名，page_num从0开始"""
+    return f"{pdf_name}_第{page_num+1:03d}页{extension}"
+
+def resolve_image_options(preset=None, image_format=None, color=None, level=None):
+    """
+    由预设和单独指定的参数得到输出图片选项
+
+    参数:
+        preset: IMAGE_PRESETS 中的预设名，None表示 DEFAULT_IMAGE_PRESET
+        image_format: 覆盖预设的格式（png/webp/tiff），改变格式时预设的level不再沿用
+        color: 覆盖预设的颜色（rgb/gray/bw）
+        level: 覆盖预设的压缩级别
+
+    返回:
+        {'format', 'color', 'level'}，参数无效时抛出ValueError
+    """
+    preset = preset or DEFAULT_IMAGE_PRESET
+    if preset not in IMAGE_PRESETS:
+        raise ValueError(f"未知的图片预设: {preset}，可选: {', '.join(IMAGE_PRESETS)}")
+    options = dict(IMAGE_PRESETS[preset])
+    if image_format is not None and image_format != options["format"]:
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"未知的图片格式: {image_format}，可选: {', '.join(IMAGE_FORMATS)}")
+        options["format"] = image_format
+        options["level"] = None
+    if color is not None:
+        if color not in COLOR_MODES:
+            raise ValueError(f"未知的颜色: {color}，可选: {', '.join(COLOR_MODES)}")
+        options["color"] = color
+    if level is not None:
+        if options["format"] not in _LEVEL_RANGES:
+            raise ValueError(f"{options['format']} 格式没有压缩级别可选")
+        low, high = _LEVEL_RANGES[options["format"]]
+        if not low <= level <= high:
+            raise ValueError(f"{options['format']} 的压缩级别应在 {low}-{high} 之间")
+        options["level"] = level
+    return options
+
+def render_pixmap(page, dpi, image_options=None):
+    """按输出图片的颜色渲染页面：灰度和黑白直接以灰度渲染，像素量只有彩色的三分之一"""
+    colorspace = fitz.csRGB if not image_options or image_options["color"] == "rgb" else fitz.csGRAY
+    return page.get_pixmap(matrix=fitz.Matrix(dpi/72, dpi/72), colorspace=colorspace)
+
+def encode_pixmap(pix, image_options=None):
+    """
+    按输出图片选项编码pixmap
+
+    返回:
+        编码后的文件内容（bytes）
+    """
+    image_options = image_options or IMAGE_PRESETS[DEFAULT_IMAGE_PRESET]
+    image_format, level = image_options["format"], image_options["level"]
+    if image_format == "png" and level is None and image_options["color"] != "bw":
+        # 由PyMuPDF直接编码，避免 PNG编码→解码→再编码 的往返
+        return pix.tobytes("png")
+
+    img = pixmap_to_image(pix)
+    if image_options["color"] == "bw":
+        from image_preprocess import preprocess_image
+        img = preprocess_image(img, ("gray", "threshold"))
+    elif image_options["color"] == "gray" and img.mode != "L":
+        img = img.convert("L")
+    buffer = io.BytesIO()
+    if image_format == "png":
+        img.save(buffer, "PNG", compress_level=_DEFAULT_LEVELS["png"] if level is None else level)
+    elif image_format == "webp":
+        img.save(buffer, "WEBP", lossless=True, method=_DEFAULT_LEVELS["webp"] if level is None else level)
+    else:
+        img.save(buffer, "TIFF", compression="group4" if img.mode == "1" else "tiff_adobe_deflate")
+    return buffer.getvalue()
+
+def save_pixmap(pix, img_path, image_options=None):
+    """
+    编码并写出pixmap
+
+    返回:
+        编码、写盘各步骤的耗时（秒）
+    """
+    start = time.perf_counter()
+    data = encode_pixmap(pix, image_options)
+    encoded = time.perf_counter()
+    with open(img_path, 'wb') as f:
+        f.write(data)
+    return {"encode": encoded - start, "write": time.perf_counter() - encoded}
+
+def file_sha256(path):
+    """分块计算文件的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_render_manifest(manifest_path):
+    """读取渲染清单，不存在或已损坏时返回None"""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_render_manifest(manifest_path, manifest):
+    """先写临时文件再替换，保证中途崩溃时清单文件仍然完整"""
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def find_pages_to_render(manifest, output_dir, source_sha256, settings, page_count):
+    """
+    根据渲染清单找出需要重新渲染的页面
+
+    源文件变化时全部重渲染；否则只渲染清单中缺失、参数变化、图片丢失或校验和不符的页面
 
-def convert_pdf_to_images(pdf_path, output_dir, dpi=300, progress_callback=None):
+    返回:
+        需要渲染的页码列表（从0开始）
+    """
+    if not manifest or manifest.get("source_sha256") != source_sha256:
+        return list(range(page_count))
+
+    pages = manifest.get("pages", {})
+    pages_to_render = []
+    for page_num in range(page_count):
+        entry = pages.get(str(page_num + 1))
+        if not entry or entry.get("settings") != settings:
+            pages_to_render.append(page_num)
+            continue
+        img_path = os.path.join(output_dir, entry["path"])
+        if not os.path.isfile(img_path) or file_sha256(img_path) != entry.get("sha256"):
+            pages_to_render.append(page_num)
+    return pages_to_render
+
+def pixmap_to_image(pix):
+    """
+    将pixmap包装为PIL图像，不经过PNG编码/解码
+
+    Image.frombuffer直接引用pixmap的像素内存，只有需要在保存前做后处理时才使用；
+    返回的图像依赖pix的生命周期，pix释放前不能继续使用该图像
+    """
+    from PIL import Image
+    mode = "RGBA" if pix.alpha else ("L" if pix.n == 1 else "RGB")
+    samples = getattr(pix, "samples_mv", None) or pix.samples
+    return Image.frombuffer(mode, (pix.width, pix.height), samples, "raw", mode, pix.stride, 1)
+
+def page_pixel_size(page, dpi):
+    """页面按dpi渲染后的像素尺寸 (宽, 高)"""
+    irect = (page.rect * fitz.Matrix(dpi/72, dpi/72)).irect
+    return irect.width, irect.height
+
+def needs_tiling(page, dpi, tile_budget_mb):
+    """整页RGB位图是否超过内存预算"""
+    if not tile_budget_mb:
+        return False
+    width, height = page_pixel_size(page, dpi)
+    return width * height * 3 > tile_budget_mb * 1024 * 1024
+
+def iter_page_strips(page, dpi, tile_budget_mb, overlap=0, colorspace=None):
+    """
+    用裁剪矩形把页面按横向条带逐条渲染，同一时刻只有一条条带的位图在内存中
+
+    条带占满页宽，行数按内存预算计算；overlap为上下各多渲染的像素行数，
+    供OCR使用，保证跨条带边界的文字行在某一条带中是完整的；colorspace默认为RGB
+
+    矢量和文字内容与整页渲染逐像素一致；页面中的位图按条带分别缩放，边界附近可能有轻微差异
+
+    生成:
+        (条带首行, 负责区域首行, 负责区域末行（不含）, pix)，行号均为整页坐标；
+        各条带的负责区域首尾相接，恰好覆盖整页
+    """
+    matrix = fitz.Matrix(dpi/72, dpi/72)
+    irect = (page.rect * matrix).irect
+    width, height = irect.width, irect.height
+    # 预算太小时负责区域至少与重叠同高，否则条带数会成倍增加，此时内存占用会略超预算
+    rows = max(1, overlap, int(tile_budget_mb * 1024 * 1024) // (width * 3) - 2 * overlap)
+    inverse = ~matrix
+    # 页面内容只解析一次，各条带从显示列表渲染
+    display_list = page.get_displaylist()
+    for own_start in range(0, height, rows):
+        own_end = min(height, own_start + rows)
+        top = max(0, own_start - overlap)
+        bottom = min(height, own_end + overlap)
+        clip = fitz.Rect(irect.x0, irect.y0 + top, irect.x1, irect.y0 + bottom) * inverse
+        yield top, own_start, own_end, display_list.get_pixmap(matrix=matrix, clip=clip,
+                                                               colorspace=colorspace or fitz.csRGB)
+
+class PngStripWriter:
+    """
+    逐条写出PNG：每收到一段像素行就压缩写盘，不需要整页位图
+
+    只支持不带透明通道的灰度和RGB pixmap，每行使用 None 过滤器
+    """
+
+    def __init__(self, path, width, height, channels=3, level=6):
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(level)
+        self._file = open(path, 'wb')
+        self._file.write(b"\x89PNG\r\n\x1a\n")
+        color_type = 0 if channels == 1 else 2
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0))
+
+    def _chunk(self, kind, data):
+        self._file.write(struct.pack(">I", len(data)) + kind + data)
+        self._file.write(struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+
+    def write(self, pix, first_row=0, row_count=None):
+        """写出pix中从 first_row 开始的 row_count 行（默认到pix末尾）"""
+        if pix.alpha or pix.n != self.channels or pix.width != self.width:
+            raise ValueError("条带的宽度或颜色通道与PNG不一致")
+        if row_count is None:
+            row_count = pix.height - first_row
+        samples = getattr(pix, "samples_mv", None) or pix.samples
+        stride, row_bytes = pix.stride, self.width * self.channels
+        rows = b"".join(b"\x00" + bytes(samples[r * stride:r * stride + row_bytes])
+                        for r in range(first_row, first_row + row_count))
+        data = self._compressor.compress(rows)
+        if data:
+            self._chunk(b"IDAT", data)
+        self.rows_written += row_count
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._chunk(b"IDAT", self._compressor.flush())
+        self._chunk(b"IEND", b"")
+        self._file.close()
+        if self.rows_written != self.height:
+            raise ValueError(f"PNG只写出了 {self.rows_written}/{self.height} 行")
+
+    def abort(self):
+        """放弃写出，删除不完整的文件"""
+        self._file.close()
+        if os.path.exists(self._file.name):
+            os.remove(self._file.name)
+
+def render_page_to_strips_file(page, img_path, dpi, tile_budget_mb, image_options=None):
+    """
+    按条带渲染页面并流式写出PNG，内存占用取决于预算而不是页面大小
+
+    只支持彩色和灰度PNG（见 check_tiling_options），level为None时使用zlib的默认压缩级别
+
+    返回:
+        渲染、编码各步骤的耗时（秒）；压缩和写盘逐条交替进行，写盘耗时计入编码
+    """
+    image_options = image_options or IMAGE_PRESETS[DEFAULT_IMAGE_PRESET]
+    gray = image_options["color"] == "gray"
+    level = _DEFAULT_LEVELS["png"] if image_options["level"] is None else image_options["level"]
+    width, height = page_pixel_size(page, dpi)
+    timings = {"render": 0.0, "encode": 0.0}
+    writer = PngStripWriter(img_path, width, height, 1 if gray else 3, level)
+    try:
+        start = time.perf_counter()
+        for _, _, _, pix in iter_page_strips(page, dpi, tile_budget_mb, colorspace=fitz.csGRAY if gray else None):
+            rendered = time.perf_counter()
+            timings["render"] += rendered - start
+            writer.write(pix)
+            pix = None
+            start = time.perf_counter()
+            timings["encode"] += start - rendered
+        writer.close()
+    except Exception:
+        # 不留下只写了一半的图片，否则断点续传时可能被当成已完成
+        writer.abort()
+        raise
+    return timings
+
+def check_tiling_options(image_options):
+    """分条渲染只能流式写出彩色或灰度PNG，其他输出选项返回错误信息，可用时返回None"""
+    if image_options["format"] != "png" or image_options["color"] == "bw":
+        return "分条渲染（--tile-mb）只支持彩色或灰度PNG，不能与WebP、TIFF或黑白图片同时使用"
+    return None
+
+def render_page_to_file(page, img_path, dpi=300, tile_budget_mb=DEFAULT_TILE_BUDGET_MB, image_options=None):
+    """
+    将单个PDF页面渲染并保存为图片
+    
+    参数:
+        page: fitz页面对象
+        img_path: 图片保存路径
+        dpi: 图像分辨率
+        tile_budget_mb: 整页位图超过该大小（MB）时分条渲染并流式写出，None表示总是整页渲染
+        image_options: resolve_image_options 返回的输出图片选项，None表示彩色PNG
+    
+    返回:
+        渲染、编码、写盘各步骤的耗时（秒）
+    """
+    if needs_tiling(page, dpi, tile_budget_mb):
+        return render_page_to_strips_file(page, img_path, dpi, tile_budget_mb, image_options)
+
+    # 渲染页面为图像；编码和写盘分开以便分别计时
+    start = time.perf_counter()
+    pix = render_pixmap(page, dpi, image_options)
+    timings = {"render": time.perf_counter() - start}
+    timings.update(save_pixmap(pix, img_path, image_options))
+    return timings
+
+def convert_pdf_to_images(pdf_path, output_dir, dpi=300, progress_callback=None, workers=1, resume=True,
+                          tile_budget_mb=DEFAULT_TILE_BUDGET_MB, image_options=None, pages=None, shard=None):
     """
     将PDF文件的每一页转换为图片
     
@@ -24,8 +427,21 @@ def convert_pdf_to_images(pdf_path, output_dir, dpi=300, progress_callback=None)
         pdf_path: PDF文件路径
         output_dir: 输出目录
         dpi: 图像分辨率，默认300
-        progress_callback: 进度回调函数
+        progress_callback: 进度回调函数，抛出 progress_channel.JobCancelled 时停止渲染，已完成的页保留在清单中
+        workers: 并行渲染的进程数，1表示在当前进程中逐页渲染，None表示使用全部CPU核心
+        resume: 是否根据渲染清单跳过已完成且校验通过的页面
+        tile_budget_mb: 单页位图的内存预算（MB），超过时分条渲染并流式写出PNG，None表示不限制
+        image_options: resolve_image_options 返回的输出图片选项（格式、颜色、压缩级别），None表示彩色PNG
+        pages: 只渲染这些页，例如 "1-20,35,50-"（页码从1开始），None表示全部页
+        shard: 分片 "i/N"，只渲染页码除以N余i-1的页，多台机器各渲染一个分片，见 page_shards
     """
+    if image_options is None:
+        image_options = IMAGE_PRESETS[DEFAULT_IMAGE_PRESET]
+    if tile_budget_mb:
+        error = check_tiling_options(image_options)
+        if error:
+            return False, error
+    
     # 确保输出目录存在
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
@@ -42,32 +458,137 @@ def convert_pdf_to_images(pdf_path, output_dir, dpi=300, progress_callback=None)
     # 获取PDF页数
     page_count = pdf_document.page_count
     
-    # 转换每一页
-    for page_num in range(page_count):
-        if progress_callback:
-            progress_callback(page_num, page_count)
+    # 页码范围和分片
+    try:
+        selected = select_pages(range(1, page_count + 1), pages, shard)
+    except ValueError as e:
+        pdf_document.close()
+        return False, str(e)
+    
+    # 对照渲染清单，找出需要渲染的页面
+    manifest_path = os.path.join(output_dir, f"{pdf_name}{MANIFEST_SUFFIX}")
+    source_sha256 = file_sha256(pdf_path)
+    settings = {"dpi": dpi}
+    # 默认的彩色PNG不写入设置，以前渲染的页面续传时仍然有效
+    if image_options != IMAGE_PRESETS[DEFAULT_IMAGE_PRESET]:
+        settings["image"] = image_options
+    previous = load_render_manifest(manifest_path)
+    manifest = previous if resume else None
+    pages_to_render = find_pages_to_render(manifest, output_dir, source_sha256, settings, page_count)
+    if len(selected) < page_count:
+        selected_set = set(selected)
+        pages_to_render = [page_num for page_num in pages_to_render if page_num in selected_set]
+    # 换了图片格式时旧图片的扩展名不同，不会被覆盖，写出新图片后删除，免得OCR时同一页出现两次
+    previous_paths = {key: entry.get("path") for key, entry in (previous or {}).get("pages", {}).items()}
+    
+    if not manifest or manifest.get("source_sha256") != source_sha256:
+        manifest = {"source": os.path.basename(pdf_path), "source_sha256": source_sha256, "pages": {}}
+    manifest["page_count"] = page_count
+    manifest["dpi"] = dpi
+    
+    metrics = get_metrics()
+    
+    def record_page(page_num, img_name, checksum, timings):
+        # 每完成一页就更新清单，中途崩溃后重跑只需补齐剩余页面
+        key = str(page_num + 1)
+        old_name = previous_paths.get(key)
+        if old_name and old_name != img_name and os.path.isfile(os.path.join(output_dir, old_name)):
+            os.remove(os.path.join(output_dir, old_name))
+        manifest["pages"][key] = {"path": img_name, "sha256": checksum, "settings": settings}
+        save_render_manifest(manifest_path, manifest)
+        for stage, seconds in timings.items():
+            metrics.observe(stage, seconds, page_num)
+    
+    render_total = len(pages_to_render)
+    
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, render_total))
+    
+    rendered = 0
+    try:
+        if workers == 1:
+            # 编码、写盘和校验在单独的线程中进行，与下一页的渲染重叠（Pillow编码时释放GIL）；
+            # 最多一页在等待编码，内存中至多同时有两页的位图
+            try:
+                with ThreadPoolExecutor(max_workers=1) as encoder:
+                    pending = deque()
+                    try:
+                        for i, page_num in enumerate(pages_to_render):
+                            if progress_callback:
+                                progress_callback(i, render_total)
+                            
+                            page_image = _render_page_image(pdf_document, page_num, output_dir, pdf_name, dpi,
+                                                            tile_budget_mb, image_options)
+                            pending.append(encoder.submit(_save_and_checksum, output_dir, page_image, image_options))
+                            page_image = None
+                            if len(pending) > 1:
+                                record_page(*pending.popleft().result())
+                                rendered += 1
+                    finally:
+                        # 取消或出错时已经渲染的页仍会写完，一并记入清单
+                        while pending:
+                            record_page(*pending.popleft().result())
+                            rendered += 1
+            finally:
+                pdf_document.close()
+        else:
+            pdf_document.close()
             
-        page = pdf_document.load_page(page_num)
-        
-        # 渲染页面为图像
-        pix = page.get_pixmap(matrix=fitz.Matrix(dpi/72, dpi/72))
-        
-        # 将pixmap转换为PIL图像
-        img_data = pix.tobytes("png")
-        img = Image.open(io.BytesIO(img_data))
-        
-        # 保存图像
-        img_path = os.path.join(output_dir, f"{pdf_name}_第{page_num+1:03d}页.png")
-        img.save(img_path)
+            # 多进程渲染：每个进程打开自己的文档，按页码顺序取结果，保证进度回调有序；
+            # 提交的页数最多为进程数的两倍，进度回调暂停时工作进程也随之停下
+            options = (output_dir, pdf_name, dpi, tile_budget_mb, image_options)
+            try:
+                with multiprocessing.Pool(workers, initializer=_init_render_worker,
+                                          initargs=(pdf_path, options)) as pool:
+                    pending = deque()
+                    next_submit = 0
+                    for i in range(render_total):
+                        while next_submit < render_total and len(pending) < workers * 2:
+                            pending.append(pool.apply_async(_render_page_in_worker, (pages_to_render[next_submit],)))
+                            next_submit += 1
+                        record_page(*pending.popleft().get())
+                        rendered += 1
+                        if progress_callback:
+                            progress_callback(i, render_total)
+            except JobCancelled:
+                raise
+            except Exception as e:
+                return False, f"并行渲染失败: {e}"
+    except JobCancelled:
+        return False, f"已取消，本次渲染了 {rendered}/{render_total} 页，已完成的页已记入渲染清单，续传时会跳过"
     
-    pdf_document.close()
-    return True, f"转换完成! 共转换 {page_count} 页，图像已保存到 '{output_dir}'"
+    # 清单中删除超出当前页数的旧记录
+    for key in list(manifest["pages"]):
+        if int(key) > page_count:
+            del manifest["pages"][key]
+    save_render_manifest(manifest_path, manifest)
+    
+    skipped = len(selected) - render_total
+    message = f"转换完成! 共转换 {render_total} 页"
+    if len(selected) < page_count:
+        message += f"（选中 {len(selected)}/{page_count} 页）"
+    if skipped:
+        message += f"（跳过已完成的 {skipped} 页）"
+    return True, message + f"，图像已保存到 '{output_dir}'"
+
+# 图形界面只在用到时加载tkinter，命令行工具导入本模块时不需要它；由 _load_tkinter 赋值
+tk = filedialog = messagebox = ttk = None
+
+def _load_tkinter():
+    """导入tkinter并绑定到模块级名称，供 PDFConverterApp 使用，重复调用时什么也不做"""
+    global tk, filedialog, messagebox, ttk
+    if tk is None:
+        import tkinter
+        from tkinter import filedialog, messagebox, ttk
+        tk = tkinter
 
 class PDFConverterApp:
     def __init__(self, root):
+        _load_tkinter()
         self.root = root
         self.root.title("PDF转图片工具")
-        self.root.geometry("600x400")
+        self.root.geometry("600x500")
         self.root.resizable(True, True)
         
         # 设置样式
@@ -109,6 +630,28 @@ class PDFConverterApp:
         dpi_combo.pack(side=tk.LEFT, padx=5)
         ttk.Label(dpi_frame, text="(较高的DPI会产生更清晰但更大的图像)").pack(side=tk.LEFT, padx=5)
         
+        # 并行进程数设置
+        workers_frame = ttk.Frame(main_frame)
+        workers_frame.pack(fill=tk.X, pady=10)
+        
+        ttk.Label(workers_frame, text="并行进程数:").pack(side=tk.LEFT)
+        self.workers_var = tk.IntVar(value=os.cpu_count() or 1)
+        ttk.Spinbox(workers_frame, textvariable=self.workers_var, from_=1, to=64, width=8).pack(side=tk.LEFT, padx=5)
+        ttk.Label(workers_frame, text="(1为单进程逐页渲染)").pack(side=tk.LEFT, padx=5)
+        
+        self.resume_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(workers_frame, text="跳过已完成的页面", variable=self.resume_var).pack(side=tk.RIGHT)
+        
+        # 输出图片格式预设
+        format_frame = ttk.Frame(main_frame)
+        format_frame.pack(fill=tk.X, pady=10)
+        
+        ttk.Label(format_frame, text="图片格式:").pack(side=tk.LEFT)
+        self.preset_var = tk.StringVar(value=DEFAULT_IMAGE_PRESET)
+        ttk.Combobox(format_frame, textvariable=self.preset_var, values=list(IMAGE_PRESETS),
+                     state="readonly", width=10).pack(side=tk.LEFT, padx=5)
+        ttk.Label(format_frame, text="(original彩色PNG, fast/balanced灰度PNG, small灰度WebP, bw黑白TIFF)").pack(side=tk.LEFT, padx=5)
+        
         # 进度条
         progress_frame = ttk.Frame(main_frame)
         progress_frame.pack(fill=tk.X, pady=20)
@@ -121,6 +664,9 @@ class PDFConverterApp:
         status_label = ttk.Label(progress_frame, textvariable=self.status_var)
         status_label.pack(fill=tk.X, pady=5)
         
+        self.stage_var = tk.StringVar()
+        ttk.Label(progress_frame, textvariable=self.stage_var).pack(fill=tk.X)
+        
         # 转换按钮
         button_frame = ttk.Frame(main_frame)
         button_frame.pack(fill=tk.X, pady=10)
@@ -128,7 +674,18 @@ class PDFConverterApp:
         self.convert_button = ttk.Button(button_frame, text="开始转换", command=self.start_conversion)
         self.convert_button.pack(side=tk.RIGHT, padx=5)
         
-        ttk.Button(button_frame, text="退出", command=root.quit).pack(side=tk.RIGHT, padx=5)
+        self.cancel_button = ttk.Button(button_frame, text="取消", command=self.cancel_conversion, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.RIGHT, padx=5)
+        
+        self.pause_button = ttk.Button(button_frame, text="暂停", command=self.toggle_pause, state=tk.DISABLED)
+        self.pause_button.pack(side=tk.RIGHT, padx=5)
+        
+        ttk.Button(button_frame, text="退出", command=self.quit).pack(side=tk.RIGHT, padx=5)
+        
+        # 当前任务的进度通道，工作线程只通过它与界面通信
+        self.channel = None
+        self.last_progress = None
+        root.protocol("WM_DELETE_WINDOW", self.quit)
     
     def browse_pdf(self):
         file_path = filedialog.askopenfilename(
@@ -147,16 +704,49 @@ class PDFConverterApp:
         if dir_path:
             self.output_dir_var.set(dir_path)
     
-    def update_progress(self, current, total):
-        progress = (current + 1) / total * 100
-        self.progress_var.set(progress)
-        self.status_var.set(f"正在处理第 {current + 1}/{total} 页 ({int(progress)}%)")
-        self.root.update_idletasks()
+    def poll_progress(self):
+        """在主线程中定时取出进度事件并更新界面，任务结束后停止"""
+        progress, finished = self.channel.poll()
+        if progress:
+            self.last_progress = progress
+            done, total = progress
+            self.progress_var.set(done / total * 100)
+            self.status_var.set("正在渲染" + self.channel.describe(done, total))
+        self.stage_var.set(self.channel.stage_text())
+        if finished:
+            self.conversion_complete(*finished)
+        else:
+            self.root.after(100, self.poll_progress)
+    
+    def toggle_pause(self):
+        if self.channel.control.paused:
+            self.channel.resume()
+            self.pause_button.config(text="暂停")
+        else:
+            self.channel.pause()
+            self.pause_button.config(text="继续")
+        if self.last_progress:
+            self.status_var.set("正在渲染" + self.channel.describe(*self.last_progress))
+    
+    def quit(self):
+        # 转换线程可能正在暂停中，先取消，让它完成当前页后退出
+        if self.channel:
+            self.channel.cancel()
+        self.root.quit()
+    
+    def cancel_conversion(self):
+        self.channel.cancel()
+        self.pause_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.DISABLED)
+        self.status_var.set("正在取消，等待当前页完成...")
     
     def start_conversion(self):
         pdf_path = self.pdf_path_var.get()
         output_dir = self.output_dir_var.get()
         dpi = self.dpi_var.get()
+        workers = self.workers_var.get()
+        resume = self.resume_var.get()
+        image_options = resolve_image_options(self.preset_var.get())
         
         if not pdf_path or not output_dir:
             messagebox.showerror("错误", "请选择PDF文件和输出目录")
@@ -168,22 +758,39 @@ class PDFConverterApp:
         
         # 禁用按钮，防止重复点击
         self.convert_button.config(state=tk.DISABLED)
+        self.pause_button.config(state=tk.NORMAL, text="暂停")
+        self.cancel_button.config(state=tk.NORMAL)
         self.status_var.set("正在准备转换...")
+        self.stage_var.set("")
         self.progress_var.set(0)
+        self.last_progress = None
+        
+        channel = self.channel = ProgressChannel()
+        channel.start()
         
-        # 在新线程中执行转换，避免界面卡死
+        # 在新线程中执行转换，避免界面卡死；结果也经进度通道交给主线程
         def conversion_thread():
-            success, message = convert_pdf_to_images(pdf_path, output_dir, dpi, self.update_progress)
-            
-            # 更新UI（必须在主线程中进行）
-            self.root.after(0, lambda: self.conversion_complete(success, message))
+            try:
+                success, message = convert_pdf_to_images(pdf_path, output_dir, dpi, channel.progress, workers, resume,
+                                                         image_options=image_options)
+            except Exception as e:
+                success, message = False, f"转换过程中出错: {e}"
+            channel.finish(success, message)
         
         threading.Thread(target=conversion_thread).start()
+        self.poll_progress()
     
     def conversion_complete(self, success, message):
         self.convert_button.config(state=tk.NORMAL)
+        self.pause_button.config(state=tk.DISABLED, text="暂停")
+        self.cancel_button.config(state=tk.DISABLED)
+        cancelled = self.channel.control.cancelled
+        self.channel = None
         
-        if success:
+        if cancelled:
+            self.status_var.set("已取消")
+            messagebox.showinfo("已取消", message)
+        elif success:
             self.status_var.set("转换完成!")
             messagebox.showinfo("成功", message)
         else:
@@ -191,6 +798,7 @@ class PDFConverterApp:
             messagebox.showerror("错误", message)
 
 def main():
+    _load_tkinter()
     root = tk.Tk()
     app = PDFConverterApp(root)
     root.mainloop()
@@ -0,0 +1,883 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+PDF转文字流水线 - 命令行版本
+功能：逐页渲染PDF并直接在内存中OCR，只写出文本文件，不再需要先把所有页面保存成图片
+      页面自带可用的文字层时直接提取文字，跳过渲染和OCR
+      自适应模式下先用低分辨率识别，只对置信度低的页面或文本块用高分辨率重新渲染
+      版面模式下先找出页面中的文本区域，只把这些区域裁剪下来识别，同一页的各区域可由不同OCR线程并行识别
+      可以用多个进程渲染，页面像素经共享内存交给OCR线程（见 shared_pages），进程之间只传递元数据
+使用方法：python3 pdf_to_text_pipeline.py <PDF文件> <输出目录> [--lang 语言] [--workers 并行数] [--dpi DPI] [--save-images 图片目录] [--no-text-layer] [--adaptive | --layout] [--render-workers N]
+例如：python3 pdf_to_text_pipeline.py ../tony/pdf存档/源文件不要解析/tony.pdf ../tony/pdf存档/文本 --workers 4
+也可以使用统一入口：python3 tony_ocr.py pipeline <PDF文件> <输出目录> [参数]
+"""
+
+import os
+import sys
+import queue
+import threading
+import json
+import time
+import contextlib
+import unicodedata
+import multiprocessing
+
+import fitz  # PyMuPDF
+
+from pdf_to_images import (pixmap_to_image, page_image_name, page_pixel_size, needs_tiling,
+                           iter_page_strips, PngStripWriter)
+from ocr_parallel import limit_tesseract_threads, default_ocr_workers
+from ocr_cache import get_ocr_cache
+from ocr_backends import (recognize_image, recognize_image_data, group_blocks, words_to_text,
+                          PAGE_SEPARATOR)
+from text_output import CombinedTextWriter
+from ocr_archive import OcrArchiveWriter, ARCHIVE_SUFFIX
+from layout_regions import find_text_regions, page_block_regions, region_area_ratio
+from shared_pages import SharedPageRing, PageSlot, shared_memory_available
+from metrics import get_metrics
+from ocr_defaults import (DEFAULT_MIN_TEXT_CHARS, DEFAULT_LOW_DPI, DEFAULT_MIN_CONFIDENCE,
+                          OUTPUT_TEXT, OUTPUT_ARCHIVE, OUTPUT_BOTH, OUTPUT_FORMATS)
+
+# 队列中的结束标记
+_STOP = object()
+
+# 页面文字来源
+SOURCE_TEXT_LAYER = "text_layer"
+SOURCE_OCR = "ocr"
+
+# 可用字符（文字、数字、标点）占比低于该值时认为文字层是乱码，例如缺少ToUnicode映射的字体
+MIN_USABLE_RATIO = 0.9
+
+def usable_text_layer(text, min_chars=DEFAULT_MIN_TEXT_CHARS):
+    """
+    判断PDF页面的文字层是否可以直接使用
+
+    参数:
+        text: page.get_text() 提取的文字
+        min_chars: 最少非空白字符数
+
+    返回:
+        True表示文字层足够且不是乱码
+    """
+    chars = [c for c in text if not c.isspace()]
+    if len(chars) < min_chars:
+        return False
+    # 替换字符、私用区字符和控制字符通常意味着字体编码无法还原为文字
+    usable = sum(1 for c in chars
+                 if c != '\ufffd' and unicodedata.category(c)[0] in ('L', 'N', 'P', 'S'))
+    return usable / len(chars) >= MIN_USABLE_RATIO
+
+# 自适应DPI：先用低分辨率识别，置信度不足的部分再用高分辨率重新渲染（默认分辨率和置信度见 ocr_defaults）
+# 低置信度文本块中的单词超过该比例时整页重新渲染，否则只重新渲染这些文本块
+FULL_RERENDER_RATIO = 0.5
+# 重新渲染文本块时四周多留的边距（点）
+REGION_MARGIN = 4
+# 单个文本块按统一文本块识别，不再做版面分析
+REGION_CONFIG = '--psm 6'
+
+# 分条OCR时条带上下各多渲染的高度（点），不超过两倍该高度的文字行总能在某一条带中完整识别
+STRIP_OVERLAP = 36
+
+# 多进程渲染时共享内存槽位的大小上限（MB），更大的页面由渲染线程在本进程中渲染
+MAX_SLOT_MB = 128
+
+def _render_worker(pdf_path, options, ring_handle, tasks, results):
+    """
+    渲染进程：从任务队列取页码，渲染为灰度像素写入共享内存槽位，只把槽位号和尺寸送回主进程
+
+    送回的消息为 (页码, 类型, 数据, 各步骤耗时)，类型为：
+        "pixels"  数据为 (槽位布局, 版面块区域或None)
+        "text"    文字层可用，数据为文字
+        "local"   页面需要分条渲染或放不进槽位，由主进程的渲染线程处理
+        "error"   数据为错误信息
+    各步骤耗时由主进程统一记录指标（工作进程中的指标对象主进程看不到）
+    """
+    image_dir, pdf_name, dpi, page_dpi, min_text_chars, tile_budget_mb, layout = options
+    ring = SharedPageRing.attach(ring_handle)
+    try:
+        pdf_document, open_error = fitz.open(pdf_path), None
+    except Exception as e:
+        pdf_document, open_error = None, f"渲染进程无法打开PDF: {e}"
+    try:
+        for page_num in iter(tasks.get, None):
+            timings = {}
+            try:
+                if pdf_document is None:
+                    raise RuntimeError(open_error)
+                kind, data = _render_in_worker(pdf_document, page_num, ring, image_dir, pdf_name, dpi, page_dpi,
+                                               min_text_chars, tile_budget_mb, layout, timings)
+            except Exception as e:
+                kind, data = "error", str(e)
+            results.put((page_num, kind, data, timings))
+    finally:
+        if pdf_document is not None:
+            pdf_document.close()
+        ring.close()
+
+def _render_in_worker(pdf_document, page_num, ring, image_dir, pdf_name, dpi, page_dpi, min_text_chars,
+                      tile_budget_mb, layout, timings):
+    """在渲染进程中处理一页，判断条件与 _PdfTextPipeline._render_page 相同，返回 (类型, 数据)"""
+    start = time.perf_counter()
+    page = pdf_document.load_page(page_num)
+    timings["load"] = time.perf_counter() - start
+
+    use_text_layer = False
+    if min_text_chars is not None:
+        start = time.perf_counter()
+        text = page.get_text()
+        use_text_layer = usable_text_layer(text, min_text_chars)
+        timings["text_layer"] = time.perf_counter() - start
+    if use_text_layer and not image_dir:
+        return "text", text
+    if needs_tiling(page, dpi, tile_budget_mb) or not ring.fits(*page_pixel_size(page, page_dpi)):
+        return "local", None
+
+    start = time.perf_counter()
+    matrix = fitz.Matrix(page_dpi/72, page_dpi/72)
+    if image_dir:
+        # 保存的图片与在本进程中渲染时一样是彩色的，OCR用的像素再转为灰度
+        pix = page.get_pixmap(matrix=matrix)
+        pix.save(os.path.join(image_dir, page_image_name(pdf_name, page_num)))
+        if use_text_layer:
+            timings["render"] = time.perf_counter() - start
+            return "text", text
+        pix = fitz.Pixmap(fitz.csGRAY, pix)
+    else:
+        pix = page.get_pixmap(matrix=matrix, colorspace=fitz.csGRAY)
+    timings["render"] = time.perf_counter() - start
+
+    block_regions = page_block_regions(page, dpi, min_text_chars or DEFAULT_MIN_TEXT_CHARS) if layout else None
+    return "pixels", (ring.write(pix), block_regions)
+
+def ocr_image(img, lang='chi_sim+eng', config=''):
+    """识别内存中的PIL图像"""
+    try:
+        return recognize_image(img, lang, config)
+    except Exception as e:
+        return f"处理图片时出错: {e}"
+
+def merge_block_texts(blocks, replacements):
+    """
+    按原顺序拼接各文本块的文字，重新识别过的块用新结果替换
+
+    参数:
+        blocks: group_blocks 返回的文本块列表
+        replacements: {块号: 重新识别的文字}
+    """
+    texts = []
+    for block in blocks:
+        if block['block'] in replacements:
+            text = replacements[block['block']].strip()
+        else:
+            text = words_to_text(block['words']).strip()
+        if text:
+            texts.append(text)
+    return "\n\n".join(texts) + "\n" + PAGE_SEPARATOR
+
+class _PdfTextPipeline:
+    """
+    一次转换的共享状态：渲染线程、OCR线程和写出循环通过队列交换页面
+
+    页面队列中的任务为 (类型, 页码, 来源信息, 数据)：
+        "page"     首次渲染的整页，数据为 (pix, 图像)；多进程渲染时为 (PageSlot, 图像)，识别完后释放槽位
+        "full"     以高分辨率重新渲染的整页，数据为 (pix, 图像)
+        "regions"  以高分辨率重新渲染的文本块，数据为 (文本块列表, [(块号, pix, 图像), ...])
+        "strip"    超过内存预算的页面中的一条横向条带，数据为 (条带首行, 负责区域首行, 负责区域末行, pix, 图像)
+        "region"   版面模式下页面中的一个文本区域，数据为 (区域序号, (left, top, right, bottom), 裁剪出的图像)
+    PyMuPDF的文档对象不能跨线程使用，OCR线程需要重新渲染时把请求放进重渲染队列，由渲染线程处理
+    多进程渲染时渲染线程只分发页码、接收渲染进程送回的槽位，重新渲染、分条渲染和过大的页面仍在本进程中处理
+    """
+
+    def __init__(self, pdf_document, pdf_name, lang, dpi, workers, max_in_flight, image_dir,
+                 min_text_chars, low_dpi=None, min_confidence=DEFAULT_MIN_CONFIDENCE, tile_budget_mb=None,
+                 output_format=OUTPUT_TEXT, layout=False, render_workers=0):
+        self.pdf_document = pdf_document
+        self.pdf_name = pdf_name
+        self.lang = lang
+        self.dpi = dpi
+        self.workers = workers
+        self.image_dir = image_dir
+        self.min_text_chars = min_text_chars
+        # low_dpi为None时不启用自适应DPI
+        self.low_dpi = low_dpi
+        self.min_confidence = min_confidence
+        self.tile_budget_mb = tile_budget_mb
+        self.write_text = output_format in (OUTPUT_TEXT, OUTPUT_BOTH)
+        # 写存档时OCR保留单词位置和置信度
+        self.keep_words = output_format in (OUTPUT_ARCHIVE, OUTPUT_BOTH)
+        # 分条OCR的页面：{页码: {'rows': 已识别的行数, 'strips': [(负责区域首行, 单词列表)], 'seconds', 'error'}}
+        self.strip_pages = {}
+        self.strip_lock = threading.Lock()
+        self.layout = layout
+        # 分区域OCR的页面：{页码: {'remaining': 未识别的区域数, 'regions': {区域序号: (文字, 单词列表)}, 'seconds', 'error'}}
+        self.region_pages = {}
+        self.region_lock = threading.Lock()
+
+        # 渲染进程数，0表示在渲染线程中渲染；进程、共享内存和队列在 run 中创建
+        self.render_workers = render_workers
+        self.ring = None
+        self.render_tasks = None
+        self.render_results = None
+        self.render_processes = []
+        # 已经分发给渲染进程、还没有收到结果的页数
+        self.outstanding = 0
+
+        # 在途页数上限：渲染前获取，写出文本后释放，内存占用与总页数无关
+        self.max_in_flight = max_in_flight
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.page_queue = queue.Queue(maxsize=workers)
+        self.retry_queue = queue.Queue()
+        self.result_queue = queue.Queue()
+        self.stop_event = threading.Event()
+        # 所有页都已写出，渲染线程不会再收到重渲染请求
+        self.done_event = threading.Event()
+        self.errors = []
+        self.metrics = get_metrics()
+
+    @property
+    def adaptive(self):
+        return self.low_dpi is not None
+
+    def _render(self, page, dpi, clip=None, page_num=None):
+        with self.metrics.timer("render", page_num):
+            return page.get_pixmap(matrix=fitz.Matrix(dpi/72, dpi/72), clip=clip)
+
+    def _put_page(self, item):
+        self.page_queue.put(item)
+        self.metrics.gauge("page_queue", self.page_queue.qsize())
+
+    def _save_image(self, pix, page_num):
+        if self.image_dir:
+            pix.save(os.path.join(self.image_dir, page_image_name(self.pdf_name, page_num)))
+
+    def render_stage(self):
+        """
+        渲染线程：逐页渲染放入有界队列，在途页数达到上限时等待，等待期间处理重渲染请求
+
+        文字层可用的页直接把文字交给写出阶段，不经过OCR；不需要保存图片时连渲染也跳过
+        """
+        try:
+            for page_num in range(self.pdf_document.page_count):
+                if not self._acquire_slot():
+                    break
+                if self.render_workers:
+                    self.render_tasks.put(page_num)
+                    self.outstanding += 1
+                    self._receive_pages()
+                else:
+                    self._render_page(page_num)
+            while self.outstanding and not self.stop_event.is_set():
+                self._serve_retries()
+                self._receive_pages(timeout=0.05)
+            # 已经发出的页仍可能要求以高分辨率重新渲染，直到全部写出为止
+            while self.adaptive and not self.done_event.is_set() and not self.stop_event.is_set():
+                self._serve_retries(timeout=0.05)
+        except Exception as e:
+            self.errors.append(f"渲染失败: {e}")
+        finally:
+            self.page_queue.put(_STOP)
+
+    def _acquire_slot(self):
+        """获取一个在途名额，返回False表示已经停止"""
+        while not self.in_flight.acquire(timeout=0.05):
+            if self.stop_event.is_set():
+                return False
+            # 在途的页可能正等着重新渲染或等着从渲染进程取回，不处理就永远不会释放名额
+            self._serve_retries()
+            self._receive_pages()
+        return not self.stop_event.is_set()
+
+    def _receive_pages(self, timeout=0):
+        """接收渲染进程送回的页面并放入页面队列，timeout为0时只处理已经到达的结果"""
+        while self.outstanding:
+            try:
+                if timeout:
+                    message = self.render_results.get(timeout=timeout)
+                else:
+                    message = self.render_results.get_nowait()
+            except queue.Empty:
+                self._check_render_processes()
+                return
+            self.outstanding -= 1
+            self._accept_rendered(*message)
+            timeout = 0
+
+    def _check_render_processes(self):
+        """渲染进程只在结束时退出，还有页未取回时进程已经退出（崩溃或被系统杀掉），这些页再也不会送回，记录错误并停止"""
+        for process in self.render_processes:
+            if not process.is_alive():
+                self.errors.append(f"渲染失败: 渲染进程意外退出（退出码 {process.exitcode}），"
+                                   f"还有 {self.outstanding} 页未取回")
+                self.outstanding = 0
+                self.stop_event.set()
+                return
+
+    def _accept_rendered(self, page_num, kind, data, timings):
+        for stage, seconds in timings.items():
+            self.metrics.observe(stage, seconds, page_num)
+        if kind == "error":
+            raise RuntimeError(f"第 {page_num + 1} 页: {data}")
+        if kind == "local":
+            self._render_page(page_num)
+            return
+        if kind == "text":
+            self.result_queue.put((page_num, data, {"source": SOURCE_TEXT_LAYER}, None))
+            return
+
+        layout, block_regions = data
+        info = {"source": SOURCE_OCR, "dpi": self.low_dpi if self.adaptive else self.dpi}
+        slot = self.ring.read(layout)
+        if self.layout and self._put_regions(None, page_num, info, slot.image, block_regions):
+            slot.release()
+            return
+        self._put_page(("page", page_num, info, (slot, slot.image)))
+
+    def _render_page(self, page_num):
+        with self.metrics.timer("load", page_num):
+            page = self.pdf_document.load_page(page_num)
+
+        use_text_layer = False
+        if self.min_text_chars is not None:
+            with self.metrics.timer("text_layer", page_num):
+                text = page.get_text()
+                use_text_layer = usable_text_layer(text, self.min_text_chars)
+
+        if use_text_layer and not self.image_dir:
+            self.result_queue.put((page_num, text, {"source": SOURCE_TEXT_LAYER}, None))
+            return
+
+        # 超过内存预算的页面按条带以最终分辨率渲染识别，不再走自适应DPI
+        if needs_tiling(page, self.dpi, self.tile_budget_mb):
+            self._render_strips(page, page_num, not use_text_layer)
+            if use_text_layer:
+                self.result_queue.put((page_num, text, {"source": SOURCE_TEXT_LAYER}, None))
+            return
+
+        dpi = self.low_dpi if self.adaptive else self.dpi
+        pix = self._render(page, dpi, page_num=page_num)
+        self._save_image(pix, page_num)
+
+        if use_text_layer:
+            self.result_queue.put((page_num, text, {"source": SOURCE_TEXT_LAYER}, None))
+            return
+
+        info = {"source": SOURCE_OCR, "dpi": dpi}
+        img = pixmap_to_image(pix)
+        if self.layout and self._put_regions(page, page_num, info, img):
+            return
+        # 图像直接引用pix的像素内存，pix随任务一起传递以保持有效
+        self._put_page(("page", page_num, info, (pix, img)))
+
+    def _put_regions(self, page, page_num, info, img, block_regions=None):
+        """
+        找出页面中的文本区域，每个区域作为一个任务放入页面队列
+
+        文字层被忽略或是乱码时优先用PyMuPDF的块几何，否则对渲染出的图像做投影分析；
+        多进程渲染时page为None，块几何由渲染进程算好，即block_regions
+
+        返回:
+            False表示没有合适的区域，调用方整页识别
+        """
+        with self.metrics.timer("layout", page_num):
+            if page is not None:
+                block_regions = page_block_regions(page, self.dpi, self.min_text_chars or DEFAULT_MIN_TEXT_CHARS)
+            regions = block_regions
+            method = "blocks"
+            if regions is None:
+                regions = find_text_regions(img)
+                method = "projection"
+        if regions is None:
+            return False
+
+        info = dict(info, layout=method, regions=len(regions),
+                    region_area=round(region_area_ratio(regions, img.width, img.height), 3))
+        with self.region_lock:
+            self.region_pages[page_num] = {'remaining': len(regions), 'regions': {}, 'seconds': 0.0, 'error': None}
+        self.metrics.count("layout_pages")
+        # 裁剪出的图像是独立的副本，不再需要保留pix
+        for index, box in enumerate(regions):
+            self._put_page(("region", page_num, info, (index, box, img.crop(box))))
+        return True
+
+    def _render_strips(self, page, page_num, ocr):
+        """按条带渲染页面，需要保存图片时流式写出PNG，需要OCR时把每条带放入页面队列"""
+        width, height = page_pixel_size(page, self.dpi)
+        overlap = int(STRIP_OVERLAP * self.dpi / 72) if ocr else 0
+        writer = None
+        if self.image_dir:
+            writer = PngStripWriter(os.path.join(self.image_dir, page_image_name(self.pdf_name, page_num)),
+                                    width, height)
+        if ocr:
+            with self.strip_lock:
+                self.strip_pages[page_num] = {'rows': 0, 'strips': [], 'seconds': 0.0, 'error': None}
+        info = {"source": SOURCE_OCR, "dpi": self.dpi, "height": height}
+        render_seconds = 0.0
+        try:
+            strips = iter_page_strips(page, self.dpi, self.tile_budget_mb, overlap)
+            while True:
+                start = time.perf_counter()
+                strip = next(strips, None)
+                render_seconds += time.perf_counter() - start
+                if strip is None:
+                    break
+                top, own_start, own_end, pix = strip
+                if writer:
+                    writer.write(pix, own_start - top, own_end - own_start)
+                if ocr:
+                    self._put_page(("strip", page_num, info, (top, own_start, own_end, pix, pixmap_to_image(pix))))
+            if writer:
+                writer.close()
+        except Exception:
+            if writer:
+                writer.abort()
+            raise
+        finally:
+            self.metrics.observe("render", render_seconds, page_num)
+
+    def _ocr_strip(self, page_num, info, strip):
+        """
+        识别一条条带，只保留中心落在本条带负责区域内的单词，重叠区域的文字不会重复
+
+        返回:
+            整页所有条带都识别完时返回 (页码, 文字, 来源信息, 单词列表)，否则返回None
+        """
+        top, own_start, own_end, pix, img = strip
+        start = time.perf_counter()
+        words, error = [], None
+        try:
+            for word in recognize_image_data(img, self.lang):
+                center = top + word['top'] + word['height'] / 2
+                if own_start <= center < own_end:
+                    # 块号加上条带位置，各条带的块、段落互不混淆
+                    words.append(dict(word, top=word['top'] + top, block=(own_start, word['block'])))
+        except Exception as e:
+            error = f"处理图片时出错: {e}"
+        seconds = time.perf_counter() - start
+
+        with self.strip_lock:
+            state = self.strip_pages[page_num]
+            state['rows'] += own_end - own_start
+            state['strips'].append((own_start, words))
+            state['seconds'] += seconds
+            state['error'] = state['error'] or error
+            if state['rows'] < info['height']:
+                return None
+            del self.strip_pages[page_num]
+
+        self.metrics.observe("ocr", state['seconds'], page_num)
+        if state['error']:
+            return page_num, state['error'], info, None
+        words = [word for _, strip_words in sorted(state['strips'], key=lambda s: s[0]) for word in strip_words]
+        info = {"source": SOURCE_OCR, "dpi": info["dpi"], "strips": len(state['strips'])}
+        return page_num, words_to_text(words), info, words
+
+    def _ocr_region(self, page_num, info, region):
+        """
+        识别一个文本区域，按统一文本块识别，不再做整页版面分析
+
+        返回:
+            整页所有区域都识别完时按阅读顺序拼接，返回 (页码, 文字, 来源信息, 单词列表)，否则返回None
+        """
+        index, (left, top, _, _), img = region
+        start = time.perf_counter()
+        text, words, error = "", None, None
+        try:
+            if self.keep_words:
+                # 单词坐标换算回整页，块号加上区域序号，各区域的块、段落互不混淆
+                words = [dict(word, left=word['left'] + left, top=word['top'] + top, block=(index, word['block']))
+                         for word in recognize_image_data(img, self.lang, REGION_CONFIG)]
+            else:
+                text = recognize_image(img, self.lang, REGION_CONFIG)
+        except Exception as e:
+            error = f"处理图片时出错: {e}"
+        seconds = time.perf_counter() - start
+
+        with self.region_lock:
+            state = self.region_pages[page_num]
+            state['remaining'] -= 1
+            state['regions'][index] = (text, words)
+            state['seconds'] += seconds
+            state['error'] = state['error'] or error
+            if state['remaining']:
+                return None
+            del self.region_pages[page_num]
+
+        self.metrics.observe("ocr", state['seconds'], page_num)
+        if state['error']:
+            return page_num, state['error'], info, None
+        ordered = [state['regions'][i] for i in sorted(state['regions'])]
+        if self.keep_words:
+            words = [word for _, region_words in ordered for word in region_words]
+            return page_num, words_to_text(words), info, words
+        texts = [text.strip() for text, _ in ordered if text.strip()]
+        return page_num, "\n\n".join(texts) + "\n" + PAGE_SEPARATOR, info, None
+
+    def _serve_retries(self, timeout=0):
+        """处理OCR线程提交的重渲染请求，timeout为0时只处理已经到达的请求"""
+        while True:
+            try:
+                if timeout:
+                    request = self.retry_queue.get(timeout=timeout)
+                else:
+                    request = self.retry_queue.get_nowait()
+            except queue.Empty:
+                return
+            self._rerender(*request)
+            timeout = 0
+
+    def _rerender(self, page_num, info, blocks, weak):
+        """以高分辨率重新渲染整页（weak为None）或指定的文本块"""
+        page = self.pdf_document.load_page(page_num)
+        # 旋转页面的裁剪坐标与低分辨率图像的坐标方向不一致，直接整页重新渲染
+        if weak is None or page.rotation:
+            pix = self._render(page, self.dpi, page_num=page_num)
+            self._save_image(pix, page_num)
+            info = dict(info, dpi=self.dpi, rerender="page")
+            self._put_page(("full", page_num, info, (pix, pixmap_to_image(pix))))
+            return
+
+        # 低分辨率图像的像素坐标换算为PDF坐标（点）
+        scale = 72 / self.low_dpi
+        regions = []
+        for block in blocks:
+            if block['block'] not in weak:
+                continue
+            left, top, right, bottom = block['bbox']
+            clip = fitz.Rect(left * scale - REGION_MARGIN, top * scale - REGION_MARGIN,
+                             right * scale + REGION_MARGIN, bottom * scale + REGION_MARGIN) & page.rect
+            pix = self._render(page, self.dpi, clip, page_num)
+            regions.append((block['block'], pix, pixmap_to_image(pix)))
+        info = dict(info, rerender="regions", regions=len(regions), region_dpi=self.dpi)
+        self._put_page(("regions", page_num, info, (blocks, regions)))
+
+    def ocr_stage(self):
+        """
+        OCR线程：从队列取出页面图像识别，结果放入结果队列
+
+        意外的异常记为错误并停止流水线；无论如何退出都向结果队列放入结束标记，写出阶段不会一直等待
+        """
+        try:
+            self._ocr_pages()
+        except Exception as e:
+            self.errors.append(f"OCR失败: {e}")
+            self.stop_event.set()
+            # 继续取走剩下的页面直到结束标记，渲染线程不会因为页面队列满而卡住
+            self._discard_pages()
+        finally:
+            self.result_queue.put(_STOP)
+
+    def _discard_pages(self):
+        while True:
+            item = self.page_queue.get()
+            if item is _STOP:
+                self.page_queue.put(_STOP)
+                return
+            data = item[3]
+            if item[0] == "page" and isinstance(data[0], PageSlot):
+                data[0].release()
+
+    def _ocr_pages(self):
+        while True:
+            item = self.page_queue.get()
+            if item is _STOP:
+                # 把结束标记传给其余OCR线程
+                self.page_queue.put(_STOP)
+                return
+            kind, page_num, info, data = item
+            item = None
+            if kind in ("strip", "region"):
+                # 整页识别完时才计时，见 _ocr_strip 和 _ocr_region
+                if kind == "strip":
+                    result = self._ocr_strip(page_num, info, data)
+                else:
+                    result = self._ocr_region(page_num, info, data)
+                data = None
+                if result:
+                    self.result_queue.put(result)
+                continue
+            with self.metrics.timer("ocr", page_num):
+                if kind == "regions":
+                    blocks, regions = data
+                    replacements = {block_id: ocr_image(img, self.lang, REGION_CONFIG)
+                                    for block_id, pix, img in regions}
+                    result = (page_num, merge_block_texts(blocks, replacements), info, None)
+                elif kind == "page" and self.adaptive:
+                    result = self._ocr_adaptive(page_num, info, data[1])
+                elif self.keep_words:
+                    result = self._ocr_words(page_num, info, data[1])
+                else:
+                    result = (page_num, ocr_image(data[1], self.lang), info, None)
+            slot = data[0] if kind == "page" and isinstance(data[0], PageSlot) else None
+            data = None
+            if slot:
+                slot.release()
+            if result:
+                self.result_queue.put(result)
+
+    def _ocr_words(self, page_num, info, img):
+        """识别并保留单词位置和置信度，供存档使用"""
+        try:
+            words = recognize_image_data(img, self.lang)
+        except Exception as e:
+            return page_num, f"处理图片时出错: {e}", info, None
+        return page_num, words_to_text(words), info, words
+
+    def _ocr_adaptive(self, page_num, info, img):
+        """
+        低分辨率识别并检查置信度
+
+        返回:
+            (页码, 文字, 来源信息, 单词列表)，需要重新渲染时提交请求并返回None
+        """
+        try:
+            words = recognize_image_data(img, self.lang)
+        except Exception as e:
+            return page_num, f"处理图片时出错: {e}", info, None
+        if not words:
+            return page_num, words_to_text(words), info, words
+
+        confidence = sum(word['conf'] for word in words) / len(words)
+        info = dict(info, confidence=round(confidence, 1))
+        blocks = group_blocks(words)
+        weak = {block['block'] for block in blocks if block['conf'] < self.min_confidence}
+        if not weak:
+            return page_num, words_to_text(words), info, words
+
+        weak_words = sum(len(block['words']) for block in blocks if block['block'] in weak)
+        if confidence < self.min_confidence or weak_words > len(words) * FULL_RERENDER_RATIO:
+            weak = None
+        self.retry_queue.put((page_num, info, blocks, weak))
+        self.metrics.count("rerender_page" if weak is None else "rerender_regions")
+        return None
+
+    def write_stage(self, output_dir, progress_callback=None):
+        """
+        写出阶段：按页码顺序写文本，乱序到达的结果暂存等待前面的页
+
+        返回:
+            {页码字符串: 来源信息}
+        """
+        page_count = self.pdf_document.page_count
+        page_sources = {}
+        pending = {}
+        next_page = 0
+        finished_workers = 0
+        if page_count == 0:
+            self.done_event.set()
+        with contextlib.ExitStack() as stack:
+            combined = archive = None
+            if self.write_text:
+                combined = stack.enter_context(
+                    CombinedTextWriter(os.path.join(output_dir, f"{self.pdf_name}_完整文本.txt")))
+            if self.keep_words:
+                meta = {"name": self.pdf_name, "source": os.path.basename(self.pdf_document.name),
+                        "lang": self.lang, "page_count": page_count}
+                archive = stack.enter_context(
+                    OcrArchiveWriter(os.path.join(output_dir, self.pdf_name + ARCHIVE_SUFFIX), meta))
+            while finished_workers < self.workers:
+                item = self.result_queue.get()
+                if item is _STOP:
+                    finished_workers += 1
+                    continue
+                page_num, text, info, words = item
+                pending[page_num] = (text, info, words)
+                self.metrics.gauge("pending_results", len(pending))
+                while next_page in pending:
+                    text, info, words = pending.pop(next_page)
+                    page_sources[str(next_page + 1)] = info
+                    if progress_callback:
+                        progress_callback(next_page, page_count)
+
+                    with self.metrics.timer("text_write", next_page):
+                        base_name = os.path.splitext(page_image_name(self.pdf_name, next_page))[0]
+                        if archive:
+                            archive.add(next_page + 1, base_name, text, words, info)
+                        if combined:
+                            combined.add(next_page, next_page + 1, text)
+                            with open(os.path.join(output_dir, f"{base_name}.txt"), 'w', encoding='utf-8') as f:
+                                f.write(text)
+
+                    next_page += 1
+                    self.in_flight.release()
+                    if next_page == page_count:
+                        self.done_event.set()
+        return page_sources
+
+    def run(self, output_dir, progress_callback=None):
+        """启动渲染和OCR线程，在当前线程写出结果"""
+        limit_tesseract_threads(self.workers)
+        with self._render_processes():
+            threads = [threading.Thread(target=self.render_stage, daemon=True)]
+            threads += [threading.Thread(target=self.ocr_stage, daemon=True) for _ in range(self.workers)]
+            for thread in threads:
+                thread.start()
+            try:
+                return self.write_stage(output_dir, progress_callback)
+            finally:
+                self.stop_event.set()
+                # 唤醒可能仍在等待的渲染线程
+                try:
+                    self.in_flight.release()
+                except ValueError:
+                    pass
+                for thread in threads:
+                    thread.join()
+
+    @contextlib.contextmanager
+    def _render_processes(self):
+        """多进程渲染时创建共享内存槽位和渲染进程，OCR线程全部结束后再删除共享内存"""
+        if not self.render_workers:
+            yield
+            return
+        page_dpi = self.low_dpi if self.adaptive else self.dpi
+        context = multiprocessing.get_context()
+        self.ring = SharedPageRing.create(self.max_in_flight, self._slot_bytes(page_dpi), context)
+        self.render_tasks = context.Queue()
+        self.render_results = context.Queue()
+        options = (self.image_dir, self.pdf_name, self.dpi, page_dpi, self.min_text_chars, self.tile_budget_mb,
+                   self.layout)
+        self.render_processes = [context.Process(target=_render_worker, daemon=True,
+                                     args=(self.pdf_document.name, options, self.ring.handle(),
+                                           self.render_tasks, self.render_results))
+                     for _ in range(self.render_workers)]
+        try:
+            for process in self.render_processes:
+                process.start()
+            yield
+        finally:
+            # 此时所有页都已写出或已经停止，渲染进程可能还在等待任务或空闲槽位，直接结束
+            self.render_tasks.cancel_join_thread()
+            for process in self.render_processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+            self.ring.close()
+
+    def _slot_bytes(self, dpi):
+        """
+        槽位大小：能放下最大的一页（分条渲染和超过 MAX_SLOT_MB 的页面除外）的灰度像素
+
+        只读取页面字典中的裁剪框，不载入页面，大部头的书也不会在开始渲染前逐页解析；
+        裁剪框是旋转前的尺寸，旋转只交换宽高，像素数不变
+        """
+        largest = 1
+        for page_num in range(self.pdf_document.page_count):
+            rect = self.pdf_document.page_cropbox(page_num)
+            full = (rect * fitz.Matrix(self.dpi/72, self.dpi/72)).irect
+            if self.tile_budget_mb and full.width * full.height * 3 > self.tile_budget_mb * 1024 * 1024:
+                continue
+            irect = (rect * fitz.Matrix(dpi/72, dpi/72)).irect
+            if irect.width * irect.height <= MAX_SLOT_MB * 1024 * 1024:
+                largest = max(largest, irect.width * irect.height)
+        return largest
+
+def convert_pdf_to_text(pdf_path, output_dir, lang='chi_sim+eng', dpi=300, workers=None,
+                        image_dir=None, progress_callback=None, max_in_flight=None,
+                        min_text_chars=DEFAULT_MIN_TEXT_CHARS, adaptive=False,
+                        low_dpi=DEFAULT_LOW_DPI, min_confidence=DEFAULT_MIN_CONFIDENCE, tile_budget_mb=None,
+                        output_format=OUTPUT_TEXT, layout=False, render_workers=0):
+    """
+    流式地把PDF转换为文字：渲染 → OCR → 写文本，三个阶段通过有界队列连接
+
+    参数:
+        pdf_path: PDF文件路径
+        output_dir: 输出文本目录
+        lang: OCR语言
+        dpi: 渲染分辨率；自适应模式下为重新渲染时使用的高分辨率
+        workers: 并行OCR数，None表示使用全部CPU核心
+        image_dir: 同时保存页面图片的目录，None表示不保存
+        progress_callback: 进度回调函数，按页码顺序调用
+        max_in_flight: 同时在内存中的最大页数，默认为并行数的两倍
+        min_text_chars: 文字层至少有多少个字符才直接采用，None表示所有页都走OCR
+        adaptive: 是否启用自适应DPI：先以 low_dpi 识别，平均置信度低于 min_confidence 的
+                  文本块（或大部分文字置信度都低时整页）再以 dpi 重新渲染识别
+        low_dpi: 自适应模式首次渲染的分辨率
+        min_confidence: 自适应模式可接受的最低平均置信度（0-100）
+        tile_budget_mb: 单页位图的内存预算（MB），超过时按带重叠的横向条带渲染和识别，None表示不限制
+        output_format: OUTPUT_TEXT 写单页文本和合并文本；OUTPUT_ARCHIVE 只写单文件存档（见 ocr_archive），
+                       其中保存每页文本、单词位置和置信度；OUTPUT_BOTH 两者都写
+        layout: 是否启用版面分析：只识别页面中的文本区域，页边、装饰线和大块图片不交给OCR，
+                各区域按阅读顺序拼接（见 layout_regions）；不能与自适应DPI同时使用
+        render_workers: 渲染进程数，页面以灰度像素经共享内存交给OCR线程（见 shared_pages）；
+                        0表示在本进程的一个渲染线程中渲染，当前Python不支持共享内存时也退回这种方式
+
+    返回:
+        (是否成功, 提示信息)
+    """
+    if adaptive and low_dpi >= dpi:
+        return False, f"自适应模式的低分辨率 {low_dpi} 必须小于 {dpi}"
+    if adaptive and layout:
+        return False, "版面分析不能与自适应DPI同时使用"
+    if output_format not in OUTPUT_FORMATS:
+        return False, f"未知的输出格式: {output_format}"
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    if image_dir and not os.path.exists(image_dir):
+        os.makedirs(image_dir)
+
+    pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+
+    try:
+        pdf_document = fitz.open(pdf_path)
+    except Exception as e:
+        return False, f"无法打开PDF文件: {e}"
+
+    page_count = pdf_document.page_count
+    if workers is None:
+        workers = default_ocr_workers()
+    workers = max(1, workers)
+    if max_in_flight is None:
+        max_in_flight = workers * 2
+
+    render_note = None
+    if render_workers and not shared_memory_available():
+        render_workers = 0
+        render_note = "当前Python不支持共享内存（需要3.8或更高版本），已改为在本进程中渲染"
+
+    pipeline = _PdfTextPipeline(pdf_document, pdf_name, lang, dpi, workers, max_in_flight, image_dir,
+                                min_text_chars, low_dpi if adaptive else None, min_confidence, tile_budget_mb,
+                                output_format, layout, max(0, render_workers))
+    try:
+        page_sources = pipeline.run(output_dir, progress_callback)
+    finally:
+        pdf_document.close()
+
+    # 记录每页文字来自文字层还是OCR，以及OCR使用的分辨率；存档中每页已自带这些信息
+    if pipeline.write_text:
+        sources_file_path = os.path.join(output_dir, f"{pdf_name}_页面来源.json")
+        with open(sources_file_path, 'w', encoding='utf-8') as f:
+            json.dump(page_sources, f, ensure_ascii=False, indent=2)
+
+    if pipeline.errors:
+        return False, pipeline.errors[0]
+    text_layer_pages = sum(1 for info in page_sources.values() if info["source"] == SOURCE_TEXT_LAYER)
+    message = (f"处理完成! 共处理 {page_count} 页（文字层 {text_layer_pages} 页，"
+               f"OCR {len(page_sources) - text_layer_pages} 页），文本已保存到 '{output_dir}'")
+    if pipeline.keep_words:
+        message += f"\n存档: {os.path.join(output_dir, pdf_name + ARCHIVE_SUFFIX)}"
+    if adaptive:
+        full = sum(1 for info in page_sources.values() if info.get("rerender") == "page")
+        regions = sum(1 for info in page_sources.values() if info.get("rerender") == "regions")
+        message += f"\n自适应DPI: 整页重新渲染 {full} 页，局部重新渲染 {regions} 页"
+    if layout:
+        layout_infos = [info for info in page_sources.values() if "layout" in info]
+        if layout_infos:
+            area = sum(info["region_area"] for info in layout_infos) / len(layout_infos)
+            message += (f"\n版面分析: {len(layout_infos)} 页分区域识别，平均只识别页面的 {area:.0%}，"
+                        f"其余 {len(page_sources) - text_layer_pages - len(layout_infos)} 页整页识别")
+    if render_note:
+        message += f"\n{render_note}"
+    cache = get_ocr_cache()
+    if cache:
+        message += f"\n{cache.summary()}"
+    return True, message
+
+def main():
+    # 参数与 tony-ocr pipeline 子命令相同，由 tony_ocr 统一解析
+    from tony_ocr import main as tony_ocr_main
+    sys.exit(tony_ocr_main(["pipeline"] + sys.argv[1:]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+图形界面的进度通道和任务控制
+功能：工作线程不直接操作Tk变量，而是把进度事件放入队列，由Tk主线程定时取出后更新界面；
+      相邻进度事件间隔太短时只保留最新的一个，快速任务和并行任务也不会刷屏卡住界面
+      JobControl 提供暂停和取消：转换函数每页调用一次进度回调，回调中暂停时阻塞、取消时抛出 JobCancelled
+      通道同时作为指标输出端（见 metrics.py）接收各阶段耗时，界面据此显示每页在各阶段的平均耗时
+本模块不导入tkinter，转换函数可以直接导入 JobCancelled
+"""
+
+import time
+import queue
+import threading
+from collections import deque
+
+from metrics import get_metrics
+
+# 界面上显示的阶段名称，与 metrics.py 中的阶段对应
+STAGE_LABELS = {
+    "load": "载入",
+    "text_layer": "文字层",
+    "render": "渲染",
+    "encode": "编码",
+    "write": "写图片",
+    "checksum": "校验",
+    "triage": "预筛",
+    "layout": "版面",
+    "ocr": "识别",
+    "text_write": "写文本",
+}
+
+class JobCancelled(Exception):
+    """用户取消了任务"""
+
+class JobControl:
+    """暂停和取消标志，可在任何线程设置，由工作线程在 checkpoint() 处响应"""
+
+    def __init__(self):
+        self._cancel = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def cancel(self):
+        self._cancel.set()
+        # 唤醒暂停中的工作线程，让它看到取消标志
+        self._running.set()
+
+    def checkpoint(self):
+        """暂停时阻塞直到继续；已取消时抛出 JobCancelled"""
+        self._running.wait()
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+def format_duration(seconds):
+    """把秒数格式化为 "1小时02分" "3分05秒" "12秒" 这样的文字"""
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}小时{seconds % 3600 // 60:02d}分"
+    if seconds >= 60:
+        return f"{seconds // 60}分{seconds % 60:02d}秒"
+    return f"{seconds}秒"
+
+class ProgressChannel:
+    """
+    工作线程与Tk主线程之间的进度通道
+
+    工作线程：把 progress 当作 progress_callback 传给转换函数，结束时调用 finish
+    Tk主线程：用 root.after 定时调用 poll，在主线程中更新界面；describe 和 stage_text 生成状态文字
+
+    参数:
+        min_interval: 相邻两个进度事件的最短间隔（秒），更快的进度只保留最新的一个
+        window: 计算速度时使用最近多少秒内的进度
+    """
+
+    def __init__(self, min_interval=0.1, window=20.0):
+        self.control = JobControl()
+        self.min_interval = min_interval
+        self.window = window
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._last_post = 0.0
+        self._pending = None
+        self._stages = {}
+        self._samples = deque()
+
+    def start(self):
+        """开始一次任务：登记为指标输出端以接收各阶段耗时"""
+        get_metrics().add_sink(self)
+
+    def progress(self, current, total):
+        """
+        进度回调，在工作线程中调用，签名与各转换函数的 progress_callback 相同
+
+        参数:
+            current: 当前页序号（从0开始）
+            total: 总页数
+        """
+        done = current + 1
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_post >= self.min_interval or done >= total:
+                self._last_post = now
+                self._pending = None
+                self._queue.put(("progress", done, total))
+            else:
+                self._pending = (done, total)
+        self.control.checkpoint()
+
+    def pause(self):
+        self.control.pause()
+
+    def resume(self):
+        # 暂停前后的进度不连续，重新开始计算速度
+        self._samples.clear()
+        self.control.resume()
+
+    def cancel(self):
+        self.control.cancel()
+
+    def finish(self, success, message):
+        """任务结束，在工作线程中调用"""
+        get_metrics().remove_sink(self)
+        self._queue.put(("finished", success, message))
+
+    def poll(self):
+        """
+        在Tk主线程中调用，取出队列中的全部事件
+
+        返回:
+            (最新进度 (完成数, 总数) 或None, 结束事件 (是否成功, 提示信息) 或None)
+        """
+        latest = None
+        finished = None
+        with self._lock:
+            pending, self._pending = self._pending, None
+        while True:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] == "progress":
+                latest = event[1:]
+            else:
+                finished = event[1:]
+        # 被节流暂存的进度一定比队列中的更新
+        if pending is not None:
+            latest = pending
+        if latest is not None:
+            self._add_sample(latest[0])
+        return latest, finished
+
+    def _add_sample(self, done):
+        now = time.monotonic()
+        self._samples.append((now, done))
+        while len(self._samples) > 2 and now - self._samples[0][0] > self.window:
+            self._samples.popleft()
+
+    def rate(self):
+        """最近一段时间的速度（页/秒），数据不足时返回None"""
+        if len(self._samples) < 2:
+            return None
+        (start, first), (end, last) = self._samples[0], self._samples[-1]
+        if end <= start or last <= first:
+            return None
+        return (last - first) / (end - start)
+
+    def describe(self, done, total, unit="页"):
+        """生成 "第 12/300 页 (4%) · 3.2 页/秒 · 剩余约 1分30秒" 这样的状态文字"""
+        text = f"第 {done}/{total} {unit} ({int(done / total * 100) if total else 100}%)"
+        if self.control.paused:
+            return text + " · 已暂停"
+        rate = self.rate()
+        if rate:
+            text += f" · {rate:.1f} {unit}/秒"
+            if done < total:
+                text += f" · 剩余约 {format_duration((total - done) / rate)}"
+        return text
+
+    def stage_text(self):
+        """生成 "每页平均: 渲染 120ms · 编码 40ms" 这样的各阶段耗时文字，还没有数据时返回空字符串"""
+        with self._lock:
+            stages = [(stage, total / count) for stage, (count, total) in self._stages.items()]
+        if not stages:
+            return ""
+        parts = [f"{STAGE_LABELS.get(stage, stage)} {mean * 1000:.0f}ms" for stage, mean in stages]
+        return "每页平均: " + " · ".join(parts)
+
+    # 指标输出端接口，在记录指标的线程中调用
+    def event(self, event):
+        if event["type"] != "timing":
+            return
+        with self._lock:
+            entry = self._stages.setdefault(event["stage"], [0, 0.0])
+            entry[0] += 1
+            entry[1] += event["seconds"]
+
+    def close(self, metrics):
+        pass
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+全文检索索引
+功能：把OCR输出的文本建成保存在SQLite中的倒排索引，检索结果按BM25排序，精确到书和页，并附带上下文摘录
+分词：中文按相邻两字切分（二元组），每段中文的最后一个字另记一个单字词，单字查询也能命中；
+      英文和数字按单词切分，不区分大小写
+增量更新：按每页文本的校验和判断，重新OCR过的页才更新倒排记录，已删除的页从索引中移除
+书按 书名 + 来源路径 区分：watch 输出的“书名”和“书名_2”、不同目录下同名的图片文件夹是不同的书
+可以索引的来源：单页文本目录（*_第N页.txt，与 _完整文本.txt 同目录）、OCR存档（.tocr），
+               或包含多个这样的子目录的书库目录（例如 watch 的输出目录）
+使用方法：
+    python3 tony_ocr.py search-index <索引文件> <文本目录或存档>...
+    python3 tony_ocr.py search <索引文件> <查询> [--limit 10] [--book 书名]
+"""
+
+import os
+import re
+import heapq
+import math
+import hashlib
+import sqlite3
+import collections
+
+from create_text_files import extract_page_number
+from ocr_archive import OcrArchive, ARCHIVE_SUFFIX
+
+# BM25参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 摘录中命中位置前后保留的字符数
+SNIPPET_CONTEXT = 30
+
+# 文本目录中不是单页文本的文件
+COMBINED_SUFFIX = "_完整文本.txt"
+_NON_PAGE_SUFFIXES = (COMBINED_SUFFIX, "_图片索引.txt")
+
+_CJK = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_TOKEN_RE = re.compile(f'([{_CJK}]+)|([0-9A-Za-z\u00c0-\u024f]+)')
+
+def tokenize(text):
+    """
+    索引用的分词
+
+    中文每两个相邻的字为一个词，再加上每段中文的最后一个字，这样任意一个汉字要么是某个二元组的首字，
+    要么是单字词，单字查询按前缀即可找到；英文和数字按单词切分并转为小写
+    """
+    for cjk, latin in _TOKEN_RE.findall(text):
+        if cjk:
+            for i in range(len(cjk) - 1):
+                yield cjk[i:i + 2]
+            yield cjk[-1]
+        else:
+            yield latin.lower()
+
+def query_terms(query):
+    """
+    查询用的分词：与 tokenize 相同，但不加每段末尾的单字词
+
+    返回:
+        [(词, 是否按前缀匹配)]，只有单个汉字的查询段按前缀匹配
+    """
+    terms = []
+    for cjk, latin in _TOKEN_RE.findall(query):
+        if cjk and len(cjk) == 1:
+            terms.append((cjk, True))
+        elif cjk:
+            terms.extend((cjk[i:i + 2], False) for i in range(len(cjk) - 1))
+        else:
+            terms.append((latin.lower(), False))
+    return list(dict.fromkeys(terms))
+
+def make_snippet(text, query, context=SNIPPET_CONTEXT):
+    """
+    取出命中位置附近的文字，命中部分用【】标出
+
+    优先找完整的查询串，找不到时（例如查询中有多个词）找第一个出现的查询词
+    """
+    lowered = text.lower()
+    candidates = [query.strip().lower()] + [term for term, _ in query_terms(query)]
+    for candidate in candidates:
+        position = lowered.find(candidate) if candidate else -1
+        if position >= 0:
+            break
+    else:
+        return " ".join(text[:context * 2].split())
+    end = position + len(candidate)
+    before = " ".join(text[max(0, position - context):position].split())
+    after = " ".join(text[end:end + context].split())
+    prefix = "…" if position > context else ""
+    suffix = "…" if end + context < len(text) else ""
+    return f"{prefix}{before}【{text[position:end]}】{after}{suffix}"
+
+def normalize_source(source):
+    """来源路径的规范形式：绝对路径、解析符号链接，不区分大小写的系统上统一大小写；None为空串"""
+    if not source:
+        return ""
+    return os.path.normcase(os.path.realpath(source))
+
+def read_text_dir(text_dir, prefix=None):
+    """
+    读取单页文本目录
+
+    参数:
+        text_dir: 文本目录
+        prefix: 只读取以该前缀开头的文件，用于同一目录中有多本书的情况
+
+    返回:
+        [(页码, 文件名（不含.txt）, 文本)]。文件名中没有“第N页”（如封面 cover.txt）或页码与前面的文件重复时，
+        按文件名顺序接在最大页码之后编号，不会占用真实的页码；都没有页码时即为 1..n
+    """
+    files = sorted(file for file in os.listdir(text_dir)
+                   if file.endswith(".txt") and not file.endswith(_NON_PAGE_SUFFIXES)
+                   and (prefix is None or file.startswith(prefix)))
+    files.sort(key=extract_page_number)
+    numbers = [extract_page_number(file) for file in files]
+    next_number = max(numbers, default=0) + 1
+    used = set()
+    pages = []
+    for file, number in zip(files, numbers):
+        if not number or number in used:
+            number = next_number
+            next_number += 1
+        used.add(number)
+        with open(os.path.join(text_dir, file), 'r', encoding='utf-8') as f:
+            text = f.read()
+        pages.append((number, os.path.splitext(file)[0], text))
+    return pages
+
+def read_archive(archive_path):
+    """读取OCR存档，返回书名和 [(页码, 文件名, 文本)]"""
+    with OcrArchive(archive_path) as archive:
+        name = archive.meta.get("name") or os.path.splitext(os.path.basename(archive_path))[0]
+        return name, [(record["page"], record["name"], record["text"]) for record in archive.iter_pages()]
+
+def find_books(path):
+    """
+    找出路径下可以索引的书
+
+    返回:
+        [(书名, 来源路径, 单页文件名前缀)]；path为存档、单页文本目录，或其子目录中包含这些的书库目录。
+        单页文本目录以其中的“书名_完整文本.txt”确定书名，同目录下的存档是同一本书，不再重复索引
+    """
+    if os.path.isfile(path):
+        return [(None, path, None)] if path.endswith(ARCHIVE_SUFFIX) else []
+    entries = sorted(os.listdir(path))
+    names = [entry[:-len(COMBINED_SUFFIX)] for entry in entries if entry.endswith(COMBINED_SUFFIX)]
+    if names:
+        return [(name, path, f"{name}_" if len(names) > 1 else None) for name in names]
+    books = [(None, os.path.join(path, entry), None) for entry in entries if entry.endswith(ARCHIVE_SUFFIX)]
+    for entry in entries:
+        child = os.path.join(path, entry)
+        if os.path.isdir(child) and not entry.startswith("."):
+            books.extend(find_books(child))
+    return books
+
+class SearchIndex:
+    """
+    保存在SQLite中的倒排索引
+
+    books     书名和来源路径（规范化后），两者一起唯一确定一本书
+    pages     每页的文本、校验和与词数，文本用于生成摘录和增量更新时删除旧的倒排记录
+    postings  词 → 页 的倒排记录及词频，按 (词, 页) 聚簇存储，查一个词只读一段连续记录
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS books ("
+                " id INTEGER PRIMARY KEY, name TEXT NOT NULL, source TEXT NOT NULL,"
+                " UNIQUE (source, name))")
+            self._migrate_books()
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                " id INTEGER PRIMARY KEY, book_id INTEGER NOT NULL, page INTEGER NOT NULL,"
+                " name TEXT NOT NULL, checksum TEXT NOT NULL, length INTEGER NOT NULL, text TEXT NOT NULL,"
+                " UNIQUE (book_id, page))")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS postings ("
+                " term TEXT NOT NULL, page_id INTEGER NOT NULL, tf INTEGER NOT NULL,"
+                " PRIMARY KEY (term, page_id)) WITHOUT ROWID")
+
+    def _migrate_books(self):
+        """旧版本的索引只按书名区分书，改为按书名和来源路径区分，已有的页保留"""
+        sql, = self._conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'books'").fetchone()
+        if "UNIQUE (source, name)" in sql:
+            return
+        rows = self._conn.execute("SELECT id, name, source FROM books").fetchall()
+        self._conn.execute("DROP TABLE books")
+        self._conn.execute(
+            "CREATE TABLE books ("
+            " id INTEGER PRIMARY KEY, name TEXT NOT NULL, source TEXT NOT NULL,"
+            " UNIQUE (source, name))")
+        self._conn.executemany("INSERT INTO books (id, name, source) VALUES (?, ?, ?)",
+                               ((book_id, name, normalize_source(source)) for book_id, name, source in rows))
+
+    def index_book(self, name, pages, source=None):
+        """
+        增量更新一本书
+
+        参数:
+            name: 书名，用于显示和 --book 过滤
+            pages: [(页码, 文件名, 文本)]
+            source: 来源路径；与书名一起确定是哪一本书，同名但来源不同的书互不影响
+
+        返回:
+            {'added', 'updated', 'removed', 'unchanged'} 各类页数
+        """
+        stats = dict.fromkeys(('added', 'updated', 'removed', 'unchanged'), 0)
+        with self._conn:
+            source = normalize_source(source)
+            self._conn.execute("INSERT OR IGNORE INTO books (name, source) VALUES (?, ?)", (name, source))
+            book_id = self._conn.execute("SELECT id FROM books WHERE name = ? AND source = ?",
+                                         (name, source)).fetchone()[0]
+            existing = {page: (page_id, checksum) for page_id, page, checksum in self._conn.execute(
+                "SELECT id, page, checksum FROM pages WHERE book_id = ?", (book_id,))}
+
+            for page, page_name, text in pages:
+                checksum = hashlib.sha1(text.encode('utf-8')).hexdigest()
+                old = existing.pop(page, None)
+                if old and old[1] == checksum:
+                    stats['unchanged'] += 1
+                    continue
+                if old:
+                    self._delete_page(old[0])
+                    stats['updated'] += 1
+                else:
+                    stats['added'] += 1
+                counts = collections.Counter(tokenize(text))
+                page_id = self._conn.execute(
+                    "INSERT INTO pages (book_id, page, name, checksum, length, text) VALUES (?, ?, ?, ?, ?, ?)",
+                    (book_id, page, page_name, checksum, sum(counts.values()), text)).lastrowid
+                self._conn.executemany("INSERT INTO postings (term, page_id, tf) VALUES (?, ?, ?)",
+                                       ((term, page_id, tf) for term, tf in counts.items()))
+
+            for page_id, _ in existing.values():
+                self._delete_page(page_id)
+                stats['removed'] += 1
+        return stats
+
+    def _delete_page(self, page_id):
+        # 由旧文本重新分词得到要删除的倒排记录，倒排表不需要再按页建索引
+        text, = self._conn.execute("SELECT text FROM pages WHERE id = ?", (page_id,)).fetchone()
+        self._conn.executemany("DELETE FROM postings WHERE term = ? AND page_id = ?",
+                               ((term, page_id) for term in set(tokenize(text))))
+        self._conn.execute("DELETE FROM pages WHERE id = ?", (page_id,))
+
+    def index_path(self, path):
+        """
+        索引存档、单页文本目录或书库目录
+
+        返回:
+            [(书名, 统计)]
+        """
+        results = []
+        for name, source, prefix in find_books(path):
+            if source.endswith(ARCHIVE_SUFFIX):
+                name, pages = read_archive(source)
+            else:
+                pages = read_text_dir(source, prefix)
+            results.append((name, self.index_book(name, pages, source)))
+        return results
+
+    def _postings(self, term, prefix):
+        if prefix:
+            # 单字：该字本身和所有以它开头的二元组
+            rows = self._conn.execute("SELECT page_id, tf FROM postings WHERE term >= ? AND term < ?",
+                                      (term, chr(ord(term) + 1)))
+        else:
+            rows = self._conn.execute("SELECT page_id, tf FROM postings WHERE term = ?", (term,))
+        postings = collections.Counter()
+        for page_id, tf in rows:
+            postings[page_id] += tf
+        return postings
+
+    def search(self, query, limit=10, book=None):
+        """
+        检索包含所有查询词的页，按BM25排序
+
+        参数:
+            query: 查询文字
+            limit: 最多返回的条数
+            book: 只在这本书中检索，None表示全部
+
+        返回:
+            列表，每项为 {'book', 'source', 'page', 'name', 'score', 'snippet'}
+        """
+        terms = query_terms(query)
+        if not terms:
+            return []
+        page_count, average_length = self._conn.execute("SELECT COUNT(*), AVG(length) FROM pages").fetchone()
+        if not page_count:
+            return []
+        average_length = average_length or 1
+
+        term_postings = sorted((self._postings(term, prefix) for term, prefix in terms), key=len)
+        candidates = set(term_postings[0])
+        for postings in term_postings[1:]:
+            candidates &= postings.keys()
+        if book is not None:
+            candidates &= {page_id for page_id, in self._conn.execute(
+                "SELECT pages.id FROM pages JOIN books ON books.id = pages.book_id WHERE books.name = ?", (book,))}
+        if not candidates:
+            return []
+
+        lengths = self._page_lengths(candidates)
+        scores = {}
+        for postings in term_postings:
+            idf = math.log(1 + (page_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for page_id in candidates:
+                tf = postings[page_id]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[page_id] / average_length)
+                scores[page_id] = scores.get(page_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        results = []
+        for page_id, score in heapq.nlargest(limit, scores.items(), key=lambda item: item[1]):
+            book_name, source, page, name, text = self._conn.execute(
+                "SELECT books.name, books.source, pages.page, pages.name, pages.text FROM pages "
+                "JOIN books ON books.id = pages.book_id WHERE pages.id = ?", (page_id,)).fetchone()
+            results.append({'book': book_name, 'source': source, 'page': page, 'name': name, 'score': score,
+                            'snippet': make_snippet(text, query)})
+        return results
+
+    def _page_lengths(self, page_ids):
+        lengths = {}
+        page_ids = list(page_ids)
+        # SQLite单条语句的参数个数有限，分批查询
+        for start in range(0, len(page_ids), 500):
+            batch = page_ids[start:start + 500]
+            lengths.update(self._conn.execute(
+                f"SELECT id, length FROM pages WHERE id IN ({','.join('?' * len(batch))})", batch))
+        return lengths
+
+    def stats(self):
+        """返回 (书数, 页数, 倒排记录数)"""
+        return tuple(self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                     for table in ("books", "pages", "postings"))
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def update_search_index(index_path, path):
+    """
+    把刚生成的文本加入索引，供OCR命令在完成后调用
+
+    返回:
+        提示信息
+    """
+    with SearchIndex(index_path) as index:
+        results = index.index_path(path)
+    lines = []
+    for name, stats in results:
+        lines.append(f"已更新索引 {name}: 新增 {stats['added']} 页，更新 {stats['updated']} 页，"
+                     f"删除 {stats['removed']} 页，未变 {stats['unchanged']} 页")
+    return "\n".join(lines) or f"在 '{path}' 中没有找到可以索引的文本"
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+共享内存页面槽位环
+功能：渲染进程把页面像素写入共享内存中固定大小的槽位，进程之间只传递槽位号和宽、高、行跨度等元数据；
+      OCR线程用 Image.frombuffer 在槽位上原地构造图像，不再pickle整页位图或编码为PNG；
+      识别完后槽位号放回空闲队列，供下一页重复使用，共享内存的大小与总页数无关
+槽位中保存灰度像素：Pillow只能原地引用单通道等几种格式的缓冲区，RGB图像总会被复制一份，
+灰度也只有RGB三分之一的大小，对tesseract的识别结果没有影响
+需要Python 3.8或更高版本（multiprocessing.shared_memory），不可用时 shared_memory_available() 返回False
+"""
+
+from PIL import Image
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python 3.8 之前没有共享内存模块
+    shared_memory = None
+
+def shared_memory_available():
+    """当前Python是否支持共享内存"""
+    return shared_memory is not None
+
+class SharedPageRing:
+    """
+    固定数量、固定大小槽位的共享内存缓冲
+
+    主进程用 create 创建并在最后删除，渲染进程用 attach 按 handle() 的返回值连接；
+    空闲槽位号放在进程间队列中，没有空闲槽位时写入方等待，OCR跟不上时渲染进程也随之停下
+    """
+
+    def __init__(self, memory, slot_count, slot_bytes, free_slots, owner):
+        self.memory = memory
+        self.slot_count = slot_count
+        self.slot_bytes = slot_bytes
+        self.free_slots = free_slots
+        self.owner = owner
+
+    @classmethod
+    def create(cls, slot_count, slot_bytes, context):
+        """
+        创建共享内存和空闲槽位队列
+
+        参数:
+            slot_count: 槽位数，应不少于同时在途的页数，否则渲染进程会一直等待空闲槽位
+            slot_bytes: 每个槽位的字节数，即能放下的最大页面的像素数（灰度每像素一个字节）
+            context: multiprocessing 上下文，用来创建进程间队列
+        """
+        memory = shared_memory.SharedMemory(create=True, size=max(1, slot_count * slot_bytes))
+        free_slots = context.Queue()
+        for slot in range(slot_count):
+            free_slots.put(slot)
+        return cls(memory, slot_count, slot_bytes, free_slots, True)
+
+    def handle(self):
+        """传给渲染进程的连接信息"""
+        return self.memory.name, self.slot_count, self.slot_bytes, self.free_slots
+
+    @classmethod
+    def attach(cls, handle):
+        """在渲染进程中按 handle() 的返回值连接共享内存"""
+        name, slot_count, slot_bytes, free_slots = handle
+        return cls(shared_memory.SharedMemory(name=name), slot_count, slot_bytes, free_slots, False)
+
+    def fits(self, width, height):
+        """灰度页面能否放进一个槽位"""
+        return width * height <= self.slot_bytes
+
+    def write(self, pix):
+        """
+        等待一个空闲槽位，把灰度pixmap的像素复制进去
+
+        返回:
+            (槽位号, 宽, 高, 行跨度)，供 read 在另一个进程中构造图像
+        """
+        size = pix.stride * pix.height
+        if pix.n != 1 or pix.alpha or size > self.slot_bytes:
+            raise ValueError(f"页面像素不能放进共享内存槽位: {pix.width}x{pix.height}，{pix.n} 通道")
+        slot = self.free_slots.get()
+        start = slot * self.slot_bytes
+        self.memory.buf[start:start + size] = getattr(pix, "samples_mv", None) or pix.samples
+        return slot, pix.width, pix.height, pix.stride
+
+    def read(self, layout):
+        """
+        在槽位上原地构造灰度图像，不复制像素
+
+        参数:
+            layout: write 的返回值
+
+        返回:
+            PageSlot，其 image 在 release 之前有效
+        """
+        slot, width, height, stride = layout
+        start = slot * self.slot_bytes
+        image = Image.frombuffer("L", (width, height), self.memory.buf[start:start + stride * height],
+                                 "raw", "L", stride, 1)
+        return PageSlot(self, slot, image)
+
+    def close(self):
+        """断开共享内存，创建方同时删除它；仍有图像引用槽位时，映射要等进程退出才释放"""
+        try:
+            self.memory.close()
+        except BufferError:
+            pass
+        if self.owner:
+            self.memory.unlink()
+
+class PageSlot:
+    """一个已写入页面的槽位：image 直接引用共享内存，release 后槽位可以写入下一页"""
+
+    def __init__(self, ring, slot, image):
+        self.ring = ring
+        self.slot = slot
+        self.image = image
+
+    def release(self):
+        """丢弃图像并把槽位号放回空闲队列，重复调用时什么也不做"""
+        if self.ring is not None:
+            self.image = None
+            self.ring.free_slots.put(self.slot)
+            self.ring = None
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+查找tesseract
+功能：定位tesseract可执行文件并查询版本号，供各OCR工具共用
+查找结果在进程内缓存；版本号按可执行文件的路径、大小和修改时间缓存在
+~/.cache/tony_ocr/tesseract.json（与OCR缓存同一目录），未更换tesseract时启动不再运行 tesseract --version
+"""
+
+import os
+import json
+import shutil
+import subprocess
+import threading
+
+# 常见安装路径
+DEFAULT_PATHS = [
+    r'C:\Program Files\Tesseract-OCR\tesseract.exe',  # Windows
+    r'C:\Program Files (x86)\Tesseract-OCR\tesseract.exe',  # Windows 32位
+    '/usr/bin/tesseract',  # Linux
+    '/usr/local/bin/tesseract',  # macOS
+    '/opt/homebrew/bin/tesseract'  # macOS Homebrew
+]
+
+_lock = threading.Lock()
+_tesseract_cmd = None
+_tesseract_version = None
+_pytesseract_configured = False
+
+def find_tesseract():
+    """
+    尝试找到tesseract可执行文件的路径，每个进程只查找一次
+
+    依次检查环境变量 TESSERACT_CMD、常见安装路径和PATH，都找不到时返回 'tesseract'
+    """
+    global _tesseract_cmd
+    with _lock:
+        if _tesseract_cmd is not None:
+            return _tesseract_cmd
+
+        if 'TESSERACT_CMD' in os.environ:
+            _tesseract_cmd = os.environ['TESSERACT_CMD']
+            return _tesseract_cmd
+
+        for path in DEFAULT_PATHS:
+            if os.path.isfile(path):
+                print(f"找到Tesseract: {path}")
+                _tesseract_cmd = path
+                return _tesseract_cmd
+
+        # 如果找不到，返回默认命令名，让系统在PATH中查找
+        _tesseract_cmd = shutil.which('tesseract') or 'tesseract'
+        if _tesseract_cmd == 'tesseract':
+            print("未找到Tesseract安装路径，将使用系统PATH中的tesseract命令")
+        return _tesseract_cmd
+
+def import_pytesseract():
+    """导入pytesseract并设置tesseract路径；pytesseract导入较慢，只在真正需要时调用"""
+    global _pytesseract_configured
+    import pytesseract
+    if not _pytesseract_configured:
+        pytesseract.pytesseract.tesseract_cmd = find_tesseract()
+        _pytesseract_configured = True
+    return pytesseract
+
+def _version_cache_path():
+    cache_dir = os.environ.get('TONY_OCR_CACHE_DIR',
+                               os.path.join(os.path.expanduser('~'), '.cache', 'tony_ocr'))
+    return os.path.join(cache_dir, 'tesseract.json')
+
+def _binary_stamp(cmd):
+    """可执行文件的 (路径, 大小, 修改时间)，找不到文件时返回None"""
+    path = cmd if os.path.isfile(cmd) else shutil.which(cmd)
+    if not path:
+        return None
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime]
+
+def _query_version(cmd):
+    """运行 tesseract --version，返回第一行中的版本号"""
+    result = subprocess.run([cmd, '--version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    first_line = result.stdout.decode('utf-8', errors='replace').strip().splitlines()[0]
+    return first_line.split()[1]
+
+def tesseract_version():
+    """tesseract版本号；可执行文件未变化时直接读取磁盘缓存，无法获取时返回 'unknown'"""
+    global _tesseract_version
+    if _tesseract_version is not None:
+        return _tesseract_version
+
+    cmd = find_tesseract()
+    try:
+        stamp = _binary_stamp(cmd)
+    except OSError:
+        stamp = None
+    cache_path = _version_cache_path()
+
+    if stamp:
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get('binary') == stamp:
+                _tesseract_version = cached['version']
+                return _tesseract_version
+        except (OSError, ValueError, KeyError):
+            pass
+
+    try:
+        version = _query_version(cmd)
+    except Exception:
+        # 查询失败时不写缓存，下次启动重新查询
+        _tesseract_version = "unknown"
+        return _tesseract_version
+
+    _tesseract_version = version
+    if stamp:
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = cache_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'binary': stamp, 'version': version}, f)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+    return _tesseract_version
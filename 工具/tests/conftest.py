@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+
+"""
+测试配置：工具目录中的脚本互相按模块名导入，测试前把工具目录加入 sys.path
+运行：python3 -m pytest 工具/tests（需要pytest；不需要tesseract，OCR相关的测试使用替身函数）
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
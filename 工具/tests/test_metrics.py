@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+"""metrics 的耗时汇总"""
+
+import metrics
+from metrics import Metrics, percentile
+
+def test_percentile_interpolates():
+    assert percentile([4, 1, 3, 2], 50) == 2.5
+    assert percentile([], 50) is None
+
+def test_stage_summary():
+    m = Metrics()
+    for seconds in (0.1, 0.2, 0.3):
+        m.observe("ocr", seconds)
+    row, = m.stage_summary()
+    assert row["stage"] == "ocr" and row["pages"] == 3 and row["max"] == 0.3
+    assert abs(row["total"] - 0.6) < 1e-9 and abs(row["p50"] - 0.2) < 1e-9
+
+def test_durations_bounded_but_totals_exact(monkeypatch):
+    monkeypatch.setattr(metrics, "DURATION_WINDOW", 10)
+    m = Metrics()
+    for i in range(1000):
+        m.observe("ocr", float(i))
+    assert len(m.durations["ocr"]) == 10
+    row, = m.stage_summary()
+    assert row["pages"] == 1000 and row["total"] == sum(range(1000)) and row["max"] == 999.0
+    # 百分位数只看最近的样本
+    assert row["p50"] == 994.5
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""ocr_archive 的写入、随机读取、中断恢复和导出"""
+
+import os
+
+import pytest
+
+from ocr_archive import OcrArchiveWriter, OcrArchive, export_legacy
+
+WORDS = [{'text': '你好', 'conf': 91.5, 'left': 10, 'top': 20, 'width': 30, 'height': 12,
+          'block': 1, 'par': 1, 'line': 1}]
+
+def write_archive(path, pages, close=True):
+    writer = OcrArchiveWriter(path, {"name": "书", "lang": "chi_sim"})
+    for page in pages:
+        writer.add(page, f"书_第{page}页", f"第{page}页的文字", WORDS if page == 1 else None,
+                   {"source": "ocr"})
+    if close:
+        writer.close()
+    else:
+        writer._file.close()
+
+def test_write_and_read(tmp_path):
+    path = str(tmp_path / "书.tocr")
+    write_archive(path, [3, 1, 2])
+    with OcrArchive(path) as archive:
+        assert archive.complete and archive.meta == {"name": "书", "lang": "chi_sim"}
+        assert archive.pages == [1, 2, 3] and len(archive) == 3
+        assert archive.text(2) == "第2页的文字"
+        record = archive.read_page(1)
+        assert record["words"] == WORDS and record["info"] == {"source": "ocr"} and record["name"] == "书_第1页"
+        assert archive.read_page(3)["words"] is None
+        assert [record["page"] for record in archive.iter_pages()] == [1, 2, 3]
+        with pytest.raises(KeyError):
+            archive.read_page(4)
+
+def test_recovers_unfinished_archive(tmp_path):
+    path = str(tmp_path / "书.tocr")
+    write_archive(path, [1, 2, 3], close=False)
+    # 再截掉最后一条记录的一部分，模拟写到一半中断
+    size = os.path.getsize(path)
+    with open(path, 'r+b') as f:
+        f.truncate(size - 5)
+    with OcrArchive(path) as archive:
+        assert not archive.complete and archive.meta == {}
+        assert archive.pages == [1, 2]
+        assert archive.text(2) == "第2页的文字"
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "other.tocr"
+    path.write_bytes(b"not an archive")
+    with pytest.raises(ValueError):
+        OcrArchive(str(path))
+
+def test_export_legacy(tmp_path):
+    path = str(tmp_path / "书.tocr")
+    write_archive(path, [2, 1])
+    output_dir = tmp_path / "out"
+    success, message = export_legacy(path, str(output_dir))
+    assert success, message
+    assert (output_dir / "书_第1页.txt").read_text(encoding='utf-8') == "第1页的文字"
+    combined = (output_dir / "书_完整文本.txt").read_text(encoding='utf-8')
+    assert combined == "\n\n--- 第1页 ---\n\n第1页的文字\n\n--- 第2页 ---\n\n第2页的文字"
+    assert (output_dir / "书_页面来源.json").exists()
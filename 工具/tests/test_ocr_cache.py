@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+"""ocr_cache 的读写、容量统计和默认缓存"""
+
+import os
+
+import ocr_cache
+from ocr_cache import OCRCache
+
+def total_size(cache):
+    (recorded,), = cache._conn.execute("SELECT total_size FROM cache_meta").fetchall()
+    (actual,), = cache._conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_results").fetchall()
+    assert recorded == actual
+    return recorded
+
+def test_put_get_and_running_total(tmp_path):
+    cache = OCRCache(str(tmp_path), max_bytes=1 << 20)
+    cache.put("a", "第一页")
+    cache.put("b", "第二页")
+    cache.put("a", "重新识别的第一页")
+    assert cache.get("a") == "重新识别的第一页" and cache.get("missing") is None
+    assert total_size(cache) > 0
+    cache.close()
+
+def test_evicts_to_capacity(tmp_path):
+    cache = OCRCache(str(tmp_path), max_bytes=100)
+    for i in range(20):
+        cache.put(f"key{i}", "x" * 30)
+    assert total_size(cache) <= 100
+    assert cache.get("key19") == "x" * 30
+    cache.close()
+
+def test_unavailable_default_cache_does_not_touch_environment(tmp_path, monkeypatch):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    monkeypatch.setenv("TONY_OCR_CACHE_DIR", str(blocker / "cache"))
+    monkeypatch.delenv("TONY_OCR_CACHE", raising=False)
+    monkeypatch.setattr(ocr_cache, "_default_cache", None)
+    monkeypatch.setattr(ocr_cache, "_default_cache_failed", False)
+    assert ocr_cache.get_ocr_cache() is None
+    assert ocr_cache.get_ocr_cache() is None
+    assert "TONY_OCR_CACHE" not in os.environ
+    assert ocr_cache.cached_ocr("digest", "eng", lambda: "文字") == "文字"
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+"""ocr_defaults 中的选项名称与各模块的实现一致"""
+
+import os
+import sys
+import subprocess
+
+import ocr_defaults
+
+def test_backend_names_match_backend_classes():
+    from ocr_backends import BACKEND_CLASSES
+    assert ocr_defaults.BACKEND_NAMES == tuple(BACKEND_CLASSES)
+    assert ocr_defaults.DEFAULT_BACKEND in BACKEND_CLASSES
+
+def test_image_names_match_pdf_to_images():
+    from pdf_to_images import IMAGE_FORMATS, IMAGE_PRESETS
+    assert ocr_defaults.IMAGE_FORMAT_NAMES == tuple(IMAGE_FORMATS)
+    assert ocr_defaults.IMAGE_PRESET_NAMES == tuple(IMAGE_PRESETS)
+    assert ocr_defaults.DEFAULT_IMAGE_PRESET in IMAGE_PRESETS
+    for options in IMAGE_PRESETS.values():
+        assert options["format"] in IMAGE_FORMATS and options["color"] in ocr_defaults.COLOR_MODES
+
+def test_tony_ocr_imports_without_heavy_dependencies():
+    # 在新进程中检查，本进程中其他测试已经导入过这些模块
+    code = ("import sys, tony_ocr; tony_ocr.build_parser().parse_args(['pipeline', 'a.pdf', 'out']); "
+            "print(sorted(m for m in ('fitz', 'PIL', 'numpy', 'pytesseract') if m in sys.modules))")
+    tool_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", code], cwd=tool_dir, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == "[]"
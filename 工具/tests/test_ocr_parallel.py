@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""ocr_parallel.ocr_images_in_order 的结果顺序"""
+
+import random
+import threading
+import time
+
+import pytest
+
+from ocr_parallel import ocr_images_in_order
+
+@pytest.fixture(autouse=True)
+def restore_thread_limit(monkeypatch):
+    # 并行识别时会设置 OMP_THREAD_LIMIT，测试结束后恢复
+    monkeypatch.delenv("OMP_THREAD_LIMIT", raising=False)
+
+def slow_extract(path, lang):
+    # 随机延迟，让后提交的页先完成
+    time.sleep(random.uniform(0, 0.01))
+    return f"{lang}:{path}"
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_results_in_input_order(workers):
+    paths = [f"第{i}页.png" for i in range(30)]
+    results = list(ocr_images_in_order(slow_extract, paths, "chi_sim", workers=workers))
+    assert results == [(i, f"chi_sim:{path}") for i, path in enumerate(paths)]
+
+def test_batches_in_order():
+    paths = [f"p{i}" for i in range(7)]
+    batches = []
+
+    def batch(batch_paths, lang):
+        batches.append(list(batch_paths))
+        time.sleep(random.uniform(0, 0.01))
+        return [path.upper() for path in batch_paths]
+
+    results = list(ocr_images_in_order(slow_extract, paths, "eng", workers=3, batch_func=batch, batch_size=3))
+    assert results == [(i, path.upper()) for i, path in enumerate(paths)]
+    assert sorted(map(len, batches)) == [1, 3, 3]
+
+def test_failed_batch_marks_each_page():
+    def batch(batch_paths, lang):
+        raise RuntimeError("tesseract 退出")
+
+    results = list(ocr_images_in_order(slow_extract, ["a", "b"], "eng", workers=1, batch_func=batch, batch_size=2))
+    assert results == [(0, "处理图片时出错: tesseract 退出"), (1, "处理图片时出错: tesseract 退出")]
+
+def test_bounded_in_flight():
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def extract(path, lang):
+        with lock:
+            running.append(path)
+            peak.append(len(running))
+        time.sleep(0.002)
+        with lock:
+            running.remove(path)
+        return path
+
+    results = ocr_images_in_order(extract, [str(i) for i in range(40)], "eng", workers=2)
+    # 只取前几个结果时，提交的任务数不超过并行数的两倍
+    for _ in range(3):
+        next(results)
+    time.sleep(0.05)
+    with lock:
+        submitted = len(peak)
+    assert submitted <= 3 + 2 * 2
+    assert max(peak) <= 2
+    results.close()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+"""page_shards 的页码范围、分片、页码检查和分片合并"""
+
+import os
+
+import pytest
+
+from page_shards import (parse_page_ranges, parse_shard, select_pages, file_page_numbers,
+                         write_shard_manifest, merge_shards)
+from create_text_files import extract_page_number
+
+def test_parse_page_ranges():
+    assert parse_page_ranges("1-20, 35，50-") == [(1, 20), (35, 35), (50, None)]
+
+@pytest.mark.parametrize("spec", ["", "a", "0-3", "5-2", "1-x"])
+def test_parse_page_ranges_invalid(spec):
+    with pytest.raises(ValueError):
+        parse_page_ranges(spec)
+
+def test_parse_shard():
+    assert parse_shard("2/4") == (2, 4)
+
+@pytest.mark.parametrize("spec", ["2", "0/4", "5/4", "1/0", "a/b"])
+def test_parse_shard_invalid(spec):
+    with pytest.raises(ValueError):
+        parse_shard(spec)
+
+def test_select_pages_by_range_and_shard():
+    numbers = list(range(1, 11))
+    assert select_pages(numbers, pages="3-6,9-") == [2, 3, 4, 5, 8, 9]
+    assert select_pages(numbers, shard="2/3") == [1, 4, 7]
+    assert select_pages(numbers, pages="1-5", shard="1/2") == [0, 2, 4]
+
+def test_shards_partition_all_pages():
+    numbers = [2, 3, 5, 7, 11, 13]
+    selected = sorted(i for index in range(1, 4) for i in select_pages(numbers, shard=f"{index}/3"))
+    assert selected == list(range(len(numbers)))
+
+def test_file_page_numbers():
+    assert file_page_numbers(["书_第3页.png", "书_第10页.png"], extract_page_number) == [3, 10]
+    assert file_page_numbers(["a.png", "b.png"], extract_page_number) == [1, 2]
+    with pytest.raises(ValueError):
+        file_page_numbers(["cover.png", "书_第1页.png"], extract_page_number)
+    with pytest.raises(ValueError):
+        file_page_numbers(["书_第1页.png", "书（副本）_第1页.png"], extract_page_number)
+
+def make_shard(shard_dir, shard, all_numbers, pages=None, book="书", skip=()):
+    """按 ocr --shard 的方式写出一个分片的单页文本和清单"""
+    os.makedirs(shard_dir, exist_ok=True)
+    files = {}
+    for i in select_pages(all_numbers, pages, shard):
+        number = all_numbers[i]
+        if number in skip:
+            continue
+        name = f"{book}_第{number}页.txt"
+        with open(os.path.join(shard_dir, name), 'w', encoding='utf-8') as f:
+            f.write(f"第{number}页的文字\n")
+        files[number] = name
+    write_shard_manifest(shard_dir, book, pages, shard, all_numbers, files, True)
+
+def test_merge_shards(tmp_path):
+    numbers = list(range(1, 8))
+    dirs = [str(tmp_path / f"shard{i}") for i in range(1, 4)]
+    for i, shard_dir in enumerate(dirs, 1):
+        make_shard(shard_dir, f"{i}/3", numbers)
+    success, message = merge_shards(dirs, str(tmp_path / "merged"))
+    assert success, message
+    with open(tmp_path / "merged" / "书_完整文本.txt", encoding='utf-8') as f:
+        combined = f.read()
+    positions = [combined.index(f"第{number}页的文字") for number in numbers]
+    assert positions == sorted(positions)
+
+def test_merge_reports_missing_shard(tmp_path):
+    numbers = list(range(1, 8))
+    dirs = [str(tmp_path / f"shard{i}") for i in (1, 3)]
+    for shard_dir, shard in zip(dirs, ("1/3", "3/3")):
+        make_shard(shard_dir, shard, numbers)
+    success, message = merge_shards(dirs, str(tmp_path / "merged"))
+    assert not success
+    assert "没有分片负责的页 2 页: 2, 5" in message and "缺少分片 2/3" in message
+    assert not os.path.exists(tmp_path / "merged")
+
+def test_merge_reports_overlapping_shards(tmp_path):
+    numbers = list(range(1, 7))
+    make_shard(str(tmp_path / "a"), "1/2", numbers)
+    make_shard(str(tmp_path / "b"), "2/2", numbers)
+    make_shard(str(tmp_path / "c"), None, numbers, pages="1-2")
+    success, message = merge_shards([str(tmp_path / name) for name in "abc"], str(tmp_path / "merged"))
+    assert not success and "多个分片重复负责的页 2 页: 1, 2" in message
+
+def test_merge_reports_pages_not_written(tmp_path):
+    numbers = list(range(1, 5))
+    make_shard(str(tmp_path / "a"), "1/2", numbers, skip=(3,))
+    make_shard(str(tmp_path / "b"), "2/2", numbers)
+    success, message = merge_shards([str(tmp_path / "a"), str(tmp_path / "b")], str(tmp_path / "merged"))
+    assert not success and "缺页 1 页: 3" in message and "没有分片负责" not in message
+
+def test_merge_with_page_range(tmp_path):
+    numbers = list(range(1, 11))
+    make_shard(str(tmp_path / "a"), "1/2", numbers, pages="1-4")
+    make_shard(str(tmp_path / "b"), "2/2", numbers, pages="1-4")
+    assert merge_shards([str(tmp_path / "a"), str(tmp_path / "b")], str(tmp_path / "m"), pages="1-4")[0]
+    success, message = merge_shards([str(tmp_path / "a"), str(tmp_path / "b")], str(tmp_path / "m2"))
+    assert not success and "没有分片负责的页 6 页: 5, 6, 7, 8, 9, 10" in message
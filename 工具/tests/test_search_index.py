@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""search_index 的分词、文本目录读取和检索"""
+
+import os
+
+from search_index import SearchIndex, tokenize, query_terms, read_text_dir
+
+def write_pages(text_dir, pages):
+    os.makedirs(text_dir, exist_ok=True)
+    for name, text in pages.items():
+        with open(os.path.join(text_dir, name), 'w', encoding='utf-8') as f:
+            f.write(text)
+
+def test_tokenize_cjk_bigrams_and_last_char():
+    assert list(tokenize("全文检索")) == ["全文", "文检", "检索", "索"]
+
+def test_tokenize_latin_lowercase():
+    assert list(tokenize("BM25 Search，中文")) == ["bm25", "search", "中文", "文"]
+
+def test_query_terms_single_char_is_prefix():
+    assert query_terms("书") == [("书", True)]
+
+def test_query_terms_bigrams_without_last_char_and_deduplicated():
+    assert query_terms("检索 检索 OCR") == [("检索", False), ("ocr", False)]
+
+def test_read_text_dir_unnumbered_files_after_last_page(tmp_path):
+    write_pages(str(tmp_path), {"cover.txt": "封面", "书_第1页.txt": "第一页", "书_第2页.txt": "第二页",
+                                "书_完整文本.txt": "不是单页"})
+    pages = read_text_dir(str(tmp_path))
+    assert sorted((page, name) for page, name, _ in pages) == [(1, "书_第1页"), (2, "书_第2页"), (3, "cover")]
+
+def test_read_text_dir_without_page_numbers_counts_from_one(tmp_path):
+    write_pages(str(tmp_path), {"a.txt": "甲", "b.txt": "乙"})
+    assert [(page, name) for page, name, _ in read_text_dir(str(tmp_path))] == [(1, "a"), (2, "b")]
+
+def test_index_directory_with_cover_and_numbered_pages(tmp_path):
+    # cover.txt 曾被编为第1页，与 书_第1页.txt 冲突，整个索引因唯一约束而失败
+    text_dir = str(tmp_path / "书")
+    write_pages(text_dir, {"书_完整文本.txt": "", "cover.txt": "封面文字", "书_第1页.txt": "全文检索的第一页", "书_第2页.txt": "第二页内容"})
+    with SearchIndex(str(tmp_path / "index.sqlite3")) as index:
+        (name, stats), = index.index_path(text_dir)
+        assert stats["added"] == 3
+        results = index.search("检索")
+        assert [(result["page"], result["name"]) for result in results] == [(1, "书_第1页")]
+        assert "【检索】" in results[0]["snippet"]
+
+def test_incremental_update(tmp_path):
+    text_dir = str(tmp_path / "书")
+    write_pages(text_dir, {"书_完整文本.txt": "", "书_第1页.txt": "第一页", "书_第2页.txt": "第二页"})
+    with SearchIndex(str(tmp_path / "index.sqlite3")) as index:
+        index.index_path(text_dir)
+        write_pages(text_dir, {"书_第2页.txt": "重新识别的第二页"})
+        os.remove(os.path.join(text_dir, "书_第1页.txt"))
+        (_, stats), = index.index_path(text_dir)
+        assert stats == {"added": 0, "updated": 1, "removed": 1, "unchanged": 0}
+        assert [result["page"] for result in index.search("识别")] == [2]
+        assert index.search("第一") == []
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+"""text_output.CombinedTextWriter 的页序"""
+
+from text_output import CombinedTextWriter
+
+def read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+def test_out_of_order_pages_written_in_order(tmp_path):
+    path = str(tmp_path / "书_完整文本.txt")
+    with CombinedTextWriter(path) as writer:
+        writer.add(2, 3, "三")
+        writer.add(1, 2, "二")
+        # 第0页之前什么也不写，后面的页暂存
+        assert writer.pages_written == 0 and read(path) == ""
+        writer.add(0, 1, "一")
+        assert writer.pages_written == 3
+    assert read(path) == "\n\n--- 第1页 ---\n\n一\n\n--- 第2页 ---\n\n二\n\n--- 第3页 ---\n\n三"
+
+def test_page_numbers_independent_of_index(tmp_path):
+    path = str(tmp_path / "out.txt")
+    with CombinedTextWriter(path) as writer:
+        writer.add(1, 40, "b")
+        writer.add(0, 7, "a")
+    assert read(path) == "\n\n--- 第7页 ---\n\na\n\n--- 第40页 ---\n\nb"
+
+def test_flushes_each_page(tmp_path):
+    path = str(tmp_path / "out.txt")
+    writer = CombinedTextWriter(path)
+    writer.add(0, 1, "已完成的页")
+    # 不关闭也能读到已写出的页，中途崩溃时不会丢失
+    assert "已完成的页" in read(path)
+    writer.close()
+    writer.close()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+合并文本输出
+功能：边识别边追加写入 _完整文本.txt，不在内存中拼接整本书
+"""
+
+class CombinedTextWriter:
+    """
+    按页码顺序增量写入合并文本文件
+
+    并行识别时结果可能乱序到达，先到的后续页暂存，等前面的页写出后再依次写入，
+    内存中只保留尚未轮到的页。每页的格式与原来完全一致：
+    "\\n\\n--- 第N页 ---\\n\\n" + 页面文本
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'w', encoding='utf-8')
+        self._pending = {}
+        self._next_index = 0
+
+    def add(self, index, page_num, text):
+        """
+        提交一页的识别结果
+
+        参数:
+            index: 该页在本次处理中的顺序号（从0开始，连续）
+            page_num: 写在分隔行中的页码
+            text: 页面文本
+        """
+        self._pending[index] = (page_num, text)
+        while self._next_index in self._pending:
+            page_num, text = self._pending.pop(self._next_index)
+            self._file.write(f"\n\n--- 第{page_num}页 ---\n\n")
+            self._file.write(text)
+            self._next_index += 1
+        # 每页写完立即落盘，中途崩溃时已完成的部分仍然保留
+        self._file.flush()
+
+    @property
+    def pages_written(self):
+        return self._next_index
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
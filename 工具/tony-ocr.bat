@@ -0,0 +1,3 @@
+@echo off
+REM tony-ocr 统一命令行入口，用法见 python tony_ocr.py --help
+python "%~dp0tony_ocr.py" %*
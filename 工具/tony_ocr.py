@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+tony-ocr 统一命令行入口
+功能：
+    render    把PDF每页渲染为图片
+    ocr       识别图片目录中的文字
+    pipeline  PDF直接转文字（渲染和OCR流水线，不保存中间图片）
+    index     生成图片索引
+    watch     监视收件箱目录，自动把放入的PDF和图片文件夹转为文字
+    export    把OCR存档导出为单页文本和合并文本，或打印其中一页
+    merge     把多台机器按 --shard 分别识别的输出合并为完整的单页文本和合并文本
+    search-index  把OCR输出的文本加入全文检索索引
+    search    在全文检索索引中查找，按相关度列出命中的书和页
+PyMuPDF、Pillow、pytesseract、numpy等依赖只在用到它们的子命令中导入，
+--help 和参数错误不会加载任何重量级模块，也不会自动安装软件包
+各子命令都支持 --metrics-jsonl / --metrics-prom / --metrics-summary 输出逐页各阶段耗时，见 metrics.py
+使用方法：python3 tony_ocr.py <子命令> [参数]，或 ./tony-ocr <子命令> [参数]
+例如：python3 tony_ocr.py pipeline ../tony/pdf存档/源文件不要解析/tony.pdf ../tony/pdf存档/文本 --workers 4
+"""
+
+import os
+import sys
+import argparse
+
+# 默认值和选项名称来自不导入第三方库的 ocr_defaults，不必为构建参数加载PyMuPDF等模块
+from ocr_defaults import (DEFAULT_MIN_TEXT_CHARS, DEFAULT_LOW_DPI, DEFAULT_MIN_CONFIDENCE, DEFAULT_PAGE_TIMEOUT,
+                          OUTPUT_FORMATS, OUTPUT_TEXT, DEFAULT_BACKEND, BACKEND_NAMES, COLOR_MODES,
+                          IMAGE_FORMAT_NAMES, IMAGE_PRESET_NAMES, DEFAULT_IMAGE_PRESET)
+
+def _apply_ocr_options(parser, args):
+    """设置OCR后端和预处理步骤，参数无效时报错退出"""
+    from ocr_backends import set_ocr_backend, get_ocr_backend
+    from image_preprocess import set_default_preprocess
+    try:
+        if args.backend:
+            set_ocr_backend(args.backend)
+            get_ocr_backend()
+        if args.preprocess:
+            set_default_preprocess(args.preprocess)
+    except (ValueError, RuntimeError) as e:
+        parser.error(str(e))
+
+def _check_page_arguments(parser, args):
+    """检查 --pages 和 --shard 的格式，无效时报错退出"""
+    from page_shards import parse_page_ranges, parse_shard
+    try:
+        if args.pages:
+            parse_page_ranges(args.pages)
+        if args.shard:
+            parse_shard(args.shard)
+    except ValueError as e:
+        parser.error(str(e))
+
+def run_render(parser, args):
+    if not os.path.isfile(args.pdf_path):
+        print(f"错误: PDF文件不存在: {args.pdf_path}")
+        return 1
+    _check_page_arguments(parser, args)
+    from pdf_to_images import convert_pdf_to_images, resolve_image_options
+    try:
+        image_options = resolve_image_options(args.image_preset, args.image_format, args.color, args.compress_level)
+    except ValueError as e:
+        parser.error(str(e))
+
+    def show_progress(current, total):
+        print(f"已渲染 {current+1}/{total} 页")
+
+    success, message = convert_pdf_to_images(args.pdf_path, args.output_dir, args.dpi, show_progress,
+                                             args.workers, not args.no_resume, args.tile_mb, image_options,
+                                             args.pages, args.shard)
+    print(message)
+    return 0 if success else 1
+
+def run_ocr(parser, args):
+    if not os.path.isdir(args.input_dir):
+        print(f"错误: 输入目录不存在: {args.input_dir}")
+        return 1
+    if args.use_async and args.backend not in (None, 'pytesseract'):
+        parser.error("--async 直接运行tesseract进程，不能与 --backend 同时使用")
+    _check_page_arguments(parser, args)
+    _apply_ocr_options(parser, args)
+    from images_to_text_cli import process_images_in_directory
+
+    runner = None
+    if args.use_async:
+        from ocr_async import AsyncOCRDriver, AsyncOCRRunner
+        timeout = args.page_timeout if args.page_timeout > 0 else None
+        runner = AsyncOCRRunner(AsyncOCRDriver(args.lang, args.workers, timeout))
+    if not process_images_in_directory(args.input_dir, args.output_dir, args.lang, args.workers, runner=runner,
+                                       skip_blank=args.skip_blank, dedupe=args.dedupe,
+                                       pages=args.pages, shard=args.shard):
+        return 1
+    # 只识别了部分页时文本还不完整，合并后再建索引
+    if not (args.pages or args.shard):
+        _update_search_index(args)
+    return 0
+
+def run_pipeline(parser, args):
+    if args.adaptive and args.low_dpi >= args.dpi:
+        parser.error(f"--low-dpi ({args.low_dpi}) 必须小于 --dpi ({args.dpi})")
+    if args.adaptive and args.layout:
+        parser.error("--layout 不能与 --adaptive 同时使用")
+    if args.render_workers < 0:
+        parser.error("--render-workers 不能小于0")
+    if not os.path.isfile(args.pdf_path):
+        print(f"错误: PDF文件不存在: {args.pdf_path}")
+        return 1
+    _apply_ocr_options(parser, args)
+    from pdf_to_text_pipeline import convert_pdf_to_text
+
+    def show_progress(current, total):
+        print(f"已完成第 {current+1}/{total} 页")
+
+    min_text_chars = None if args.no_text_layer else args.min_text_chars
+    success, message = convert_pdf_to_text(args.pdf_path, args.output_dir, args.lang, args.dpi,
+                                           args.workers, args.image_dir, show_progress,
+                                           min_text_chars=min_text_chars, adaptive=args.adaptive,
+                                           low_dpi=args.low_dpi, min_confidence=args.min_confidence,
+                                           tile_budget_mb=args.tile_mb, output_format=args.format,
+                                           layout=args.layout, render_workers=args.render_workers)
+    print(message)
+    if not success:
+        return 1
+    _update_search_index(args)
+    return 0
+
+def run_index(parser, args):
+    if not os.path.isdir(args.input_dir):
+        print(f"错误: 输入目录不存在: {args.input_dir}")
+        return 1
+    from create_text_files import list_page_images, write_image_index
+
+    image_files = list_page_images(args.input_dir)
+    if not image_files:
+        print(f"错误: 在目录 '{args.input_dir}' 中没有找到图片文件")
+        return 1
+    os.makedirs(args.output_dir, exist_ok=True)
+    index_file_path = write_image_index(args.input_dir, args.output_dir, image_files)
+    print(f"已创建图片索引文件: {index_file_path}（{len(image_files)} 个图片）")
+    return 0
+
+def run_watch(parser, args):
+    if args.backend not in (None, 'pytesseract', 'tesserocr'):
+        parser.error("watch 的工作进程逐页识别，--backend 只支持 pytesseract 或 tesserocr")
+    from hot_folder import HotFolder
+
+    min_text_chars = None if args.no_text_layer else args.min_text_chars
+    HotFolder(args.inbox, args.output_dir, args.lang, args.dpi, args.workers, args.interval, args.settle,
+              min_text_chars, args.backend, args.preprocess, args.search_index).run(once=args.once)
+    return 0
+
+def run_export(parser, args):
+    if not os.path.isfile(args.archive):
+        print(f"错误: 存档不存在: {args.archive}")
+        return 1
+    from ocr_archive import OcrArchive, export_legacy
+
+    if args.page is None:
+        if not args.output_dir:
+            parser.error("导出全部页时需要指定输出目录")
+        success, message = export_legacy(args.archive, args.output_dir)
+        print(message)
+        return 0 if success else 1
+
+    try:
+        with OcrArchive(args.archive) as archive:
+            sys.stdout.write(archive.text(args.page))
+    except ValueError as e:
+        print(f"错误: {e}")
+        return 1
+    except KeyError:
+        print(f"错误: 存档中没有第 {args.page} 页")
+        return 1
+    return 0
+
+def run_merge(parser, args):
+    for shard_dir in args.shard_dirs:
+        if not os.path.isdir(shard_dir):
+            print(f"错误: 分片目录不存在: {shard_dir}")
+            return 1
+    _check_page_arguments(parser, args)
+    from page_shards import merge_shards
+
+    success, message = merge_shards(args.shard_dirs, args.output_dir, args.pages)
+    print(message)
+    if not success:
+        return 1
+    _update_search_index(args)
+    return 0
+
+def run_search_index(parser, args):
+    from search_index import SearchIndex
+
+    with SearchIndex(args.index) as index:
+        for path in args.paths:
+            if not os.path.exists(path):
+                print(f"错误: 路径不存在: {path}")
+                return 1
+            results = index.index_path(path)
+            if not results:
+                print(f"在 '{path}' 中没有找到可以索引的文本")
+            for name, stats in results:
+                print(f"{name}: 新增 {stats['added']} 页，更新 {stats['updated']} 页，"
+                      f"删除 {stats['removed']} 页，未变 {stats['unchanged']} 页")
+        books, pages, postings = index.stats()
+    print(f"索引共 {books} 本书，{pages} 页，{postings} 条倒排记录")
+    return 0
+
+def run_search(parser, args):
+    if not os.path.isfile(args.index):
+        print(f"错误: 索引文件不存在: {args.index}")
+        return 1
+    import time
+    from search_index import SearchIndex
+
+    start = time.perf_counter()
+    with SearchIndex(args.index) as index:
+        hits = index.search(args.query, args.limit, args.book)
+    elapsed = time.perf_counter() - start
+    for hit in hits:
+        print(f"{hit['book']} 第{hit['page']}页  ({hit['score']:.2f})  {hit['source']}")
+        print(f"    {hit['snippet']}")
+    print(f"共 {len(hits)} 条结果，用时 {elapsed * 1000:.1f} 毫秒")
+    return 0 if hits else 1
+
+def _update_search_index(args):
+    """OCR完成后把输出目录加入 --search-index 指定的索引"""
+    if args.search_index:
+        from search_index import update_search_index
+        print(update_search_index(args.search_index, args.output_dir))
+
+def _add_ocr_arguments(parser):
+    parser.add_argument("--lang", default="chi_sim+eng", help="OCR语言，默认 chi_sim+eng")
+    parser.add_argument("--workers", type=int, help="并行OCR数，默认为CPU核心数")
+    parser.add_argument("--backend", choices=BACKEND_NAMES, help=f"OCR后端，默认 {DEFAULT_BACKEND}")
+    parser.add_argument("--preprocess", help="OCR前的图像预处理：none/gray/binary/full 或逗号分隔的步骤")
+    parser.add_argument("--search-index", metavar="索引文件", help="完成后把输出的文本加入该全文检索索引")
+
+def _add_tile_argument(parser):
+    parser.add_argument("--tile-mb", type=float, metavar="MB",
+                        help="单页位图的内存预算，超过时按横向条带分段渲染，适合大幅面页面和高DPI；默认不限制")
+
+def _add_page_arguments(parser):
+    parser.add_argument("--pages", metavar="范围", help="只处理这些页，例如 1-20,35,50-（页码从1开始）")
+    parser.add_argument("--shard", metavar="i/N",
+                        help="把全书按页码分成N份，只处理第i份；各台机器处理不同的分片，识别结果用 merge 子命令合并")
+
+def _metrics_parent():
+    """各子命令共用的指标输出参数"""
+    parent = argparse.ArgumentParser(add_help=False)
+    group = parent.add_argument_group("运行指标")
+    group.add_argument("--metrics-jsonl", metavar="路径", help="把每页各阶段耗时等事件追加写入JSONL文件")
+    group.add_argument("--metrics-prom", metavar="路径", help="写出Prometheus textfile格式的汇总")
+    group.add_argument("--metrics-summary", action="store_true", help="结束时打印各阶段耗时汇总表")
+    return parent
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="tony-ocr", description="PDF渲染、OCR和索引工具")
+    subparsers = parser.add_subparsers(dest="command", metavar="<子命令>")
+    parents = [_metrics_parent()]
+
+    render = subparsers.add_parser("render", help="把PDF每页渲染为图片", parents=parents)
+    render.add_argument("pdf_path", help="PDF文件路径")
+    render.add_argument("output_dir", help="输出图片目录")
+    render.add_argument("--dpi", type=int, default=300, help="渲染分辨率，默认300")
+    render.add_argument("--workers", type=int, help="并行渲染的进程数，默认为CPU核心数")
+    render.add_argument("--no-resume", action="store_true", help="忽略渲染清单，重新渲染所有页")
+    _add_tile_argument(render)
+    _add_page_arguments(render)
+    group = render.add_argument_group("输出图片")
+    group.add_argument("--image-preset", choices=IMAGE_PRESET_NAMES, default=DEFAULT_IMAGE_PRESET,
+                       help="original 彩色PNG（默认，与以前相同）；fast 灰度PNG低压缩，写得最快；"
+                            "balanced 灰度PNG；small 灰度无损WebP；bw 黑白TIFF G4，只适合文字页，体积最小")
+    group.add_argument("--image-format", choices=IMAGE_FORMAT_NAMES, help="覆盖预设的图片格式")
+    group.add_argument("--color", choices=COLOR_MODES, help="覆盖预设的颜色：rgb 彩色，gray 灰度，bw 黑白")
+    group.add_argument("--compress-level", type=int, metavar="N",
+                       help="覆盖预设的压缩级别：PNG为0-9，WebP为0-6，越大越小越慢")
+    render.set_defaults(handler=run_render, command_parser=render)
+
+    ocr = subparsers.add_parser("ocr", help="识别图片目录中的文字", parents=parents)
+    ocr.add_argument("input_dir", help="输入图片目录")
+    ocr.add_argument("output_dir", help="输出文本目录")
+    _add_ocr_arguments(ocr)
+    ocr.add_argument("--async", dest="use_async", action="store_true",
+                     help="用异步驱动直接运行tesseract进程：单页超时后结束该进程并记为出错，Ctrl+C时不留下子进程")
+    ocr.add_argument("--page-timeout", type=float, default=DEFAULT_PAGE_TIMEOUT,
+                     help=f"--async 模式下单页识别的超时秒数，0表示不限制，默认{DEFAULT_PAGE_TIMEOUT}")
+    ocr.add_argument("--skip-blank", action="store_true", help="OCR前预筛，空白页不识别，文本为空")
+    ocr.add_argument("--dedupe", action="store_true",
+                     help="OCR前预筛，与前面某页几乎相同的重复页（重复的封面、版权页等）沿用那一页的文本")
+    _add_page_arguments(ocr)
+    ocr.set_defaults(handler=run_ocr, command_parser=ocr)
+
+    pipeline = subparsers.add_parser("pipeline", help="PDF直接转文字，渲染后在内存中OCR", parents=parents)
+    pipeline.add_argument("pdf_path", help="PDF文件路径")
+    pipeline.add_argument("output_dir", help="输出文本目录")
+    _add_ocr_arguments(pipeline)
+    pipeline.add_argument("--dpi", type=int, default=300, help="渲染分辨率，默认300；自适应模式下为重新渲染的分辨率")
+    pipeline.add_argument("--save-images", dest="image_dir", help="同时把页面图片保存到该目录")
+    pipeline.add_argument("--min-text-chars", type=int, default=DEFAULT_MIN_TEXT_CHARS,
+                          help=f"文字层至少有多少个字符才跳过OCR直接采用，默认{DEFAULT_MIN_TEXT_CHARS}")
+    pipeline.add_argument("--no-text-layer", action="store_true", help="忽略PDF文字层，所有页都OCR")
+    pipeline.add_argument("--adaptive", action="store_true",
+                          help="自适应DPI：先以低分辨率识别，置信度不足时再以 --dpi 重新渲染")
+    pipeline.add_argument("--low-dpi", type=int, default=DEFAULT_LOW_DPI,
+                          help=f"自适应模式首次渲染的分辨率，默认{DEFAULT_LOW_DPI}")
+    pipeline.add_argument("--min-confidence", type=float, default=DEFAULT_MIN_CONFIDENCE,
+                          help=f"自适应模式可接受的最低平均置信度，默认{DEFAULT_MIN_CONFIDENCE}")
+    pipeline.add_argument("--layout", action="store_true",
+                          help="版面分析：只把页面中的文本区域裁剪下来识别，跳过页边、装饰线和大块图片，"
+                               "同一页的各区域并行识别")
+    pipeline.add_argument("--render-workers", type=int, default=0, metavar="N",
+                          help="用N个进程渲染，页面以灰度像素经共享内存交给OCR线程，不经过pickle或PNG编码；"
+                               "默认0，在本进程的一个线程中渲染（需要Python 3.8或更高版本）")
+    _add_tile_argument(pipeline)
+    pipeline.add_argument("--format", choices=OUTPUT_FORMATS, default=OUTPUT_TEXT,
+                          help="输出格式：text 单页文本加合并文本（默认）；archive 单文件存档，"
+                               "含单词位置和置信度，可用 export 子命令导出为文本；both 两者都写")
+    pipeline.set_defaults(handler=run_pipeline, command_parser=pipeline)
+
+    index = subparsers.add_parser("index", help="生成按页码排序的图片索引", parents=parents)
+    index.add_argument("input_dir", help="输入图片目录")
+    index.add_argument("output_dir", help="索引文件输出目录")
+    index.set_defaults(handler=run_index, command_parser=index)
+
+    watch = subparsers.add_parser("watch", help="监视收件箱，自动转换放入的PDF和图片文件夹", parents=parents)
+    watch.add_argument("inbox", help="收件箱目录")
+    watch.add_argument("output_dir", help="输出目录，完成的任务连同源文件移到这里")
+    _add_ocr_arguments(watch)
+    watch.add_argument("--dpi", type=int, default=300, help="PDF渲染分辨率，默认300")
+    watch.add_argument("--min-text-chars", type=int, default=DEFAULT_MIN_TEXT_CHARS,
+                       help=f"文字层至少有多少个字符才跳过OCR直接采用，默认{DEFAULT_MIN_TEXT_CHARS}")
+    watch.add_argument("--no-text-layer", action="store_true", help="忽略PDF文字层，所有页都OCR")
+    watch.add_argument("--interval", type=float, default=5.0, help="扫描收件箱的间隔秒数，默认5")
+    watch.add_argument("--settle", type=float, default=5.0,
+                       help="文件最后修改后至少经过多少秒才处理，避免读到复制到一半的文件，默认5")
+    watch.add_argument("--once", action="store_true", help="处理完收件箱中已有的文件后退出")
+    watch.set_defaults(handler=run_watch, command_parser=watch)
+
+    export = subparsers.add_parser("export", help="把OCR存档导出为单页文本和合并文本", parents=parents)
+    export.add_argument("archive", help="存档文件（.tocr）")
+    export.add_argument("output_dir", nargs="?", help="输出目录")
+    export.add_argument("--page", type=int, help="只把这一页（从1开始）的文本打印到标准输出")
+    export.set_defaults(handler=run_export, command_parser=export)
+
+    merge = subparsers.add_parser("merge", help="合并各分片的识别结果，检查没有缺页或重复页", parents=parents)
+    merge.add_argument("output_dir", help="合并后的输出目录")
+    merge.add_argument("shard_dirs", nargs="+", metavar="分片目录", help="各分片 ocr --shard 的输出目录")
+    merge.add_argument("--pages", metavar="范围", help="各分片只识别了这个页码范围时，只检查范围内的页是否齐全")
+    merge.add_argument("--search-index", metavar="索引文件", help="合并后把输出的文本加入该全文检索索引")
+    merge.set_defaults(handler=run_merge, command_parser=merge, shard=None)
+
+    search_index = subparsers.add_parser("search-index", help="把OCR输出的文本加入全文检索索引", parents=parents)
+    search_index.add_argument("index", help="索引文件（SQLite），不存在时新建")
+    search_index.add_argument("paths", nargs="+", metavar="路径",
+                              help="单页文本目录、OCR存档（.tocr）或包含多本书的目录；重新OCR过的页增量更新")
+    search_index.set_defaults(handler=run_search_index, command_parser=search_index)
+
+    search = subparsers.add_parser("search", help="全文检索，按相关度列出命中的页", parents=parents)
+    search.add_argument("index", help="索引文件")
+    search.add_argument("query", help="查询文字，多个词之间为“与”的关系")
+    search.add_argument("--limit", type=int, default=10, help="最多显示的条数，默认10")
+    search.add_argument("--book", help="只在这本书中查找")
+    search.set_defaults(handler=run_search, command_parser=search)
+
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.command:
+        parser.print_help()
+        return 1
+
+    from metrics import configure_metrics, close_metrics
+    configure_metrics(args.metrics_jsonl, args.metrics_prom, args.metrics_summary)
+    try:
+        return args.handler(args.command_parser, args)
+    finally:
+        close_metrics()
+
+if __name__ == "__main__":
+    sys.exit(main())